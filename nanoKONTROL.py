@@ -6,27 +6,93 @@
 #
 # Dependencies: tkinter, jack / alsa, PIL, ImageTk
 
-import struct
+from time import perf_counter
+startup_mark = perf_counter()
+startup_phases = [] # List of (phase name, duration in seconds) recorded during startup
+
+# Command line provisioning runs without GUI
+# cli (argparse, sessions, transactions) is only imported when used to keep GUI startup fast
+import sys
+from nanokonfig import cli_commands
+if len(sys.argv) > 1 and sys.argv[1] in cli_commands:
+    from nanokonfig import cli
+    sys.exit(cli.main(sys.argv[1:]))
+
+import argparse
 from tkinter import messagebox
-try:
-    import jack
-except:
-    pass
-try:
-    import alsa_midi 
-except:
-    pass
 import tkinter as tk
 from tkinter import ttk
 import logging
+import os
 from PIL import ImageTk, Image
-from threading import Thread
-import ToolTips
 from datetime import datetime
-
-ev = None # Used to pass MIDI messages for JACK to transmit
+from nanokonfig.scene import control_map, mmc_commands, control_modes, assign_options, behaviour_options
+from nanokonfig import protocol
+from nanokonfig.transaction import TransactionError
+from nanokonfig.ringbuffer import MidiRingBuffer
+from nanokonfig.leds import LedState
+from nanokonfig.ports import SortedPortDict
+from nanokonfig.connection import ConnectionManager
+from nanokonfig.discovery import DeviceDiscovery, MAX_PROBES
+from nanokonfig.session import DeviceSession, SessionRouter
+from nanokonfig.library import SceneLibrary
+from nanokonfig.paramindex import ParameterIndex
+from nanokonfig.conflicts import ConflictTracker
+from nanokonfig.bulkedit import apply_pattern
+from collections import deque
+
+jack_tx_queue = MidiRingBuffer() # Used to pass MIDI messages for JACK to transmit
+jack_rx_queue = MidiRingBuffer(256) # Used to pass MIDI messages received by JACK to the UI thread
+jack_led_queue = MidiRingBuffer(64) # Used to pass host LED messages received by JACK to the UI thread (--led-thru)
+jack_port_events = deque() # Port changes reported by JACK notification thread for the UI thread: (name, registered) where name is None for an unregistered port that is no longer available
+JACK_PORT_SETTLE_MS = 100 # Quiet time after last JACK port change before port lists are updated
+jack_ports_scheduled = None # Tk after ID of pending JACK port update
+jack_port_events_seen = 0 # Quantity of queued JACK port changes when settle timer was last restarted
+CONNECTION_SETTLE_MS = 200 # Quiet time after last connection change before searching for device
+device_search_scheduled = None # Tk after ID of pending device search
+DISCOVERY_TIMEOUT_MS = 500 # Time to wait for replies to device discovery probes
+discovery = None # Device discovery in progress
+discovery_subscriptions = [] # ALSA source ports temporarily connected to application input during discovery
+jack_stats = {'callbacks': 0, 'xruns': 0, 'process_time_last': 0.0, 'process_time_max': 0.0} # JACK process callback performance counters
+MIDI_RX_POLL_MS = 10 # Interval between checks for received MIDI messages
+MIDI_RX_BATCH = 64 # Maximum quantity of received MIDI messages to handle per UI iteration
+TRANSACTION_POLL_MS = 50 # Interval between checks for transaction timeouts
+MIDI_TRACE_INTERVAL_MS = 33 # Minimum interval between status bar updates showing received MIDI (30Hz)
+midi_trace_last = None # Latest received MIDI message not yet shown in status bar
+midi_trace_count = 0 # Quantity of MIDI messages received since status bar last updated
+midi_trace_scheduled = False # True if status bar update is scheduled
+MONITOR_FRAME_MS = 33 # Minimum interval between monitor mode canvas updates
+monitor_index = {} # Controls indexed by (chan, assign, cmd) of MIDI message they send
+monitor_index_data = None # Scene data monitor_index was built from
+monitor_pending = {} # Values received since last monitor update indexed by (group, control)
+monitor_items = {} # Canvas items showing monitored control values indexed by (group, control)
+monitor_scheduled = False # True if monitor update is scheduled
+conflicts = ConflictTracker() # Controls of the edited scene that send the same MIDI message
+conflict_items = {} # Canvas items highlighting conflicting controls indexed by (group, control)
+conflicts_scheduled = False # True if conflict highlight update is scheduled
+bulk_edit_dlg = None # Bulk edit dialog or None if dialog is not shown
+led_state = LedState() # Desired and last sent state of nanoKONTROL2 LEDs (External LED mode)
+led_flush_scheduled = False # True if LED update is scheduled
 echo_id = 0x00 # Used to identify own sysex messages
 
+# Record the duration of a startup phase
+#   name: Name of the phase that has just completed
+def mark_startup_phase(name):
+    global startup_mark
+    now = perf_counter()
+    startup_phases.append((name, now - startup_mark))
+    startup_mark = now
+
+
+# Print the duration of each startup phase (--profile-startup)
+def report_startup_profile():
+    mark_startup_phase('first window')
+    print('Startup profile:')
+    for name, duration in startup_phases:
+        print('  {:<16}{:8.1f} ms'.format(name, duration * 1000))
+    print('  {:<16}{:8.1f} ms'.format('total', sum(duration for name, duration in startup_phases) * 1000))
+
+
 credits = [
     'Code:',
     'riban.co.uk',
@@ -42,539 +108,239 @@ credits = [
     'https://freesvg.org' # LED
 ]
 
-mmc_commands = [
-    'Stop',
-    'Play',
-    'Deferred Play',
-    'Fast Forward',
-    'Rewind',
-    'Record Strobe',
-    'Record Exit',
-    'Record Pause',
-    'Pause',
-    'Eject',
-    'Chase',
-    'Command Error Reset',
-    'MMC Reset'
-]
-
-control_modes = [
-    'MIDI CC',
-    'Cubase',
-    'Digital Performer',
-    'Ableton Live',
-    'ProTools',
-    'SONAR'
-]
-
-assign_options = [
-    'Disabled',
-    'CC', 'Note'
-]
-
-behaviour_options = [
-    'Momentary',
-    'Toggle'
-]
-
-control_map = {
-    'nanoKONTROL1': {
-        'param_map': {
-            'assign':[0, 2],
-            'behaviour': [6, 1],
-            'cmd': [1, 127],
-            'min': [2, 127],
-            'max': [3, 127],
-            'attack': [4, 127],
-            'release': [5, 127],
-            'mmc_cmd': [2, 12],
-            'mmc_id': [3, 127],
-            'transport_behaviour': [4, 1]
-        },
-        'group_map': {
-            'channel': 0,
-            'slider': 1,
-            'knob': 5,
-            'button_a': 9,
-            'button_b': 16,
-            'rew': 1,
-            'play': 6,
-            'ff': 11,
-            'cycle': 16,
-            'stop': 21,
-            'rec': 26,
-        },
-        'num_group_ctrls': 4,
-        'groups': [16, 39, 62, 85, 108, 131, 154, 177, 200],
-        'transport': 224,
-        'group_coords': [(0.20,0.28), (0.29,0.36), (0.38,0.45), (0.47,0.54), (0.55,0.62), (0.64,0.71), (0.72,0.79), (0.81,0.88), (0.89,0.97), (0.01,0.19)],
-        'ctrl_coords': {
-            'knob': [0.03, 0.09, 0.08, 0.2],
-            'slider': [0.04, 0.47, 0.07, 0.75],
-            'button_a': [0.00, 0.44, 0.03, 0.54],
-            'button_b': [0.00, 0.71, 0.03, 0.80],
-            'rew': [0.01, 0.52, 0.06, 0.62],
-            'play': [0.07, 0.52, 0.12, 0.62],
-            'ff': [0.12, 0.52, 0.17, 0.62],
-            'cycle': [0.01, 0.66, 0.06, 0.74],
-            'stop': [0.07, 0.66, 0.12, 0.74],
-            'rec': [0.12, 0.66, 0.17, 0.74],
-            'scene': [0.01, 0.79, 0.05, 0.87]
-        }
-    },
-    'nanoKONTROL2': {
-        'param_map': {
-            'assign':[0, 2],
-            'behaviour': [1, 1],
-            'cmd': [2, 127],
-            'min': [3, 127],
-            'max': [4, 127]
-        },
-        'group_map': {
-            'channel': 0,
-            'slider': 1,
-            'knob': 7,
-            'button_a': 13,
-            'solo': 13,
-            'button_b': 19,
-            'mute': 19,
-            'button_c': 25,
-            'prime': 25,
-            'transport 1': 1,
-            'prev_track': 1,
-            'transport 2': 7,
-            'next_track': 7,
-            'transport 3': 13,
-            'cycle': 13,
-            'transport 4': 19,
-            'set_marker': 19,
-            'transport 5': 25,
-            'prev_marker': 25,
-            'transport 6': 31,
-            'next_marker': 31,
-            'transport 7': 37,
-            'rew': 37,
-            'transport 8': 43,
-            'ff': 43,
-            'transport 9': 49,
-            'stop': 49,
-            'play': 55,
-            'rec': 61
-        },
-        'led_map': {
-            'solo': 0x20,
-            'mute': 0x30,
-            'prime': 0x40,
-            'play': 0x29,
-            'stop': 0x2A,
-            'rew': 0x2B,
-            'ff': 0x2C,
-            'rec': 0x2D,
-            'cycle': 0x2E
-        },
-        'num_group_ctrls': 5,
-        'groups': [3, 34, 65, 96, 127, 158, 189, 220],
-        'transport': 251,
-        'custom daw assign': 318,
-        'group_coords': [(0.30,0.37), (0.39,0.45), (0.47,0.54), (0.56,0.63), (0.64,0.71), (0.73,0.80), (0.81,0.88), (0.90,0.96), (0.04, 0.27)],
-        'ctrl_coords': {
-            'knob': [0.03, 0.12, 0.07, 0.26],
-            'slider': [0.04, 0.44, 0.06, 0.74],
-            'solo': [0.00, 0.40, 0.03, 0.48],
-            'mute': [0.00, 0.59, 0.03, 0.67],
-            'prime': [0.00, 0.78, 0.03, 0.86],
-            'prev_track': [0.00, 0.45, 0.03, 0.50],
-            'next_track': [0.05, 0.45, 0.08, 0.50],
-            'cycle': [0.00, 0.60, 0.03, 0.66],
-            'set_marker': [0.10, 0.60, 0.13, 0.66],
-            'prev_marker': [0.15, 0.60, 0.18, 0.66],
-            'next_marker': [0.20, 0.60, 0.23, 0.66],
-            'rew': [0.00, 0.76, 0.03, 0.88],
-            'ff': [0.05, 0.76, 0.08, 0.88],
-            'stop': [0.10, 0.76, 0.13, 0.88],
-            'play': [0.15, 0.76, 0.18, 0.88],
-            'rec': [0.20, 0.76, 0.23, 0.88],
-        }
-    }
-}
-
-## Scene class encapsulates a nanoKONTROL scene data structure ##
-class scene:
-    def __init__(self):
-        self.global_midi_chan = 0 # Global MIDI channel (0 based)
-        self.device_types = {
-            'nanoKONTROL1': {
-                'sysex_len': 293,
-                'sysex_id': (0x00, 0x01, 0x04, 0x00)
-            },
-            'nanoKONTROL2': {
-                'sysex_len': 388,
-                'sysex_id': (0x00, 0x01, 0x13, 0x00)
-            }
-        }
-        self.device_type = None
-        self.set_device_type('nanoKONTROL2')
-
-
-    # Get the (4 byte) sysex segment defining the device type
-    #   returns: Device ID as 4 byte list
-    def get_sysex_id(self):
-        return self.device_types[self.device_type]['sysex_id']
-
-
-    # Set the device type
-    #   type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
-    def set_device_type(self, type):
-        if type == self.device_type or type not in self.device_types:
-            return
-        self.device_type = type
-        self.reset_data()
-
-
-    # Reset scene data to default values
-    def reset_data(self):
-        transport_offset = control_map[self.device_type]['transport']
-        if self.device_type == 'nanoKONTROL1':
-            self.data = [0] * 256
-            self.set_scene_name('')
-            mmc_map = [5, 2, 0, 4, 3, 1]
-            for i, control in enumerate(('rec', 'play', 'stop', 'rew', 'ff', 'cycle')):
-                transport_offset = control_map[self.device_type]['transport']
-                self.set_control_parameter(transport_offset, control, 'assign', 1)
-                self.set_control_parameter(transport_offset, control, 'cmd', 44 + i)
-                self.set_control_parameter(transport_offset, control, 'mmc_cmd', mmc_map[i])
-                self.set_control_parameter(transport_offset, control, 'mmc_id', 127)
-                self.set_control_parameter(transport_offset, control, 'transport_behaviour', 0)
-
-        elif self.device_type == 'nanoKONTROL2':
-            self.data = [0] * 339
-            self.set_control_mode(0)
-            self.set_led_mode(0)
-            for i, control in enumerate(('play', 'stop', 'rew', 'ff', 'rec', 'cycle', 'prev_track', 'next_track', 'set_marker', 'prev_marker', 'next_marker')):
-                transport_offset = control_map[self.device_type]['transport']
-                self.set_control_parameter(transport_offset, control, 'assign', 1)
-                if i < 6:
-                    self.set_control_parameter(transport_offset, control, 'cmd',  0x29 + i)
-                else:
-                    self.set_control_parameter(transport_offset, control, 'cmd',  0x34 + i)
-                self.set_control_parameter(transport_offset, control, 'min', 0)
-                self.set_control_parameter(transport_offset, control, 'max', 127)
-                self.set_control_parameter(transport_offset, control, 'behaviour', 0)
-            for i in range(318, 323):
-                self.data[i] = 0 #TODO: What are default custom daw values?
-
-        self.set_global_channel(0)
-        self.set_group_channel(transport_offset, 16)
-
-        for group, group_offset in enumerate(control_map[self.device_type]['groups']):
-            self.set_group_channel(group_offset, 16)
-            if self.device_type == 'nanoKONTROL1':
-                for i, control in enumerate(('slider', 'knob', 'button_a', 'button_b')):
-                    self.set_control_parameter(group_offset, control, 'assign', 1)
-                    self.set_control_parameter(group_offset, control, 'cmd', 0x10 * i + group) #This differs from Korg's own defaults but that doesn't matter
-                    self.set_control_parameter(group_offset, control, 'min', 0)
-                    self.set_control_parameter(group_offset, control, 'max', 127)
-                for i, control in enumerate(('button_a', 'button_b')):
-                    self.set_control_parameter(group_offset, control, 'behaviour', 0)
-                    self.set_control_parameter(group_offset, control, 'attack', 0)
-                    self.set_control_parameter(group_offset, control, 'release', 0)
-            elif self.device_type == 'nanoKONTROL2':
-                for i, control in enumerate(('slider', 'knob', 'solo', 'mute', 'prime')):
-                    self.set_control_parameter(group_offset, control, 'assign', 1)
-                    self.set_control_parameter(group_offset, control, 'cmd', 0x10 * i + group)
-                    self.set_control_parameter(group_offset, control, 'min', 0)
-                    self.set_control_parameter(group_offset, control, 'max', 127)
-                    self.set_control_parameter(group_offset, control, 'behaviour', 0)
-
-
-    # Get data (payload) in MIDI sysex format
-    # Convert Korg 8-bit data to 7-bit MIDI data
-    # nanoKONTROL1 has 256 bytes of data which gives 36 blocks of 7 bytes plus 4 extra bytes
-    # nanoKONTROL2 has 339 bytes of data which gives 48 blocks of 7 bytes plus 3 extra bytes
-    # Each block is converted to 8 MIDI bytes (first byte represents most significant bit of subsequent 7 bytes)
-    # Remaining 3 or 4 bytes are sent similarly but not padded to full block of 8, i.e. nanoKONTROL1 MIDI has 36 * 8 + 1 + 4 bytes in payload
-    #   data: 8-bit Korg data
-    #   returns: List containing sysex data
-    def get_midi_data(self):
-        sysex = ()
-        for offset in range(0, len(self.data), 7):
-            block = self.data[offset:offset+7]
-            b0 = 0
-            for b in range(len(block)):
-                b0 |= ((block[b] & 0x80) >> (7 - b))
-            sysex += (b0,)
-            for word in block:
-                sysex += (word & 0x7F,)
-        return sysex
-
-
-    # Set data from MIDI sysex format data
-    # Convert raw 7-bit MIDI data to Korg 8-bit data
-    # Raw data: 1st byte holds bit-7 of subsequent bytes, next 7 bytes hold bits 0..7 of each byte
-    #   data: raw 7-bit MIDI data (multiple 8 x 7-bit blocks of data)
-    def set_data(self, data):
-        if len(data) != self.device_types[self.device_type]['sysex_len']:
-            logging.warning('Received wrong length data dump')
-            return
-        i = 0
-        for offset in range(0, len(data), 8):
-            block = data[offset:offset+8]
-            for word in range(1, len(block)):
-                self.data[i + word - 1] = (block[word] | (block[0] & 1 << (word - 1)))
-            i += 7
-
-
-    # Get scene name
-    #   returns: Scene name
-    #   nanoKONTROL1 only
-    def get_scene_name(self):
-        name = ''
-        if self.device_type == 'nanoKONTROL1':
-            for c in self.data[:12]:
-                name += chr(c)
-        return name
-
-
-    # Set scene name
-    #   name: Scene name (12 characters)
-    #   nanoKONTROL1 only
-    def set_scene_name(self, name):
-        if self.device_type == 'nanoKONTROL1':
-            for i in range(12):
-                if i < len(name):
-                    self.data[i] = ord(name[i])
-                else:
-                    self.data[i] = ord(' ')
-
-
-    # Get global MIDI channel
-    #   returns: MIDI channel
-    def get_global_channel(self):
-        if self.device_type == 'nanoKONTROL1':
-            return self.data[12]
-        elif self.device_type == 'nanoKONTROL2':
-            return self.data[0]
-        return 0
-
-
-    # Set global MIDI channel
-    #   chan: MIDI channel
-    def set_global_channel(self, chan):
-        if chan < 16:
-            if self.device_type == 'nanoKONTROL1':
-                self.data[12] = chan
-            elif self.device_type == 'nanoKONTROL2':
-                self.data[0] = chan
-
-
-    # Get control mode
-    #   returns: Control mode [0:CC, 1:Cubase, 2:DP, 3:Live, 4:ProTools, 5:SONAR]
-    #   nanoKONTROL2 only
-    def get_control_mode(self):
-        if self.device_type == 'nanoKONTROL2':
-            return self.data[1]
-        return 0
-
-
-    # Set control mode
-    #   mode: Control mode [0:CC, 1:Cubase, 2:DP, 3:Live, 4:ProTools, 5:SONAR]
-    #   nanoKONTROL2 only
-    def set_control_mode(self, mode):
-        if self.device_type == 'nanoKONTROL2' and mode < 6:
-            self.data[1] = mode
-        return 0
-
-
-    # Get LED mode
-    #   returns: LED mode [0:Internal, 1:External]
-    #   nanoKONTROL2 only
-    def get_led_mode(self):
-        if self.device_type == 'nanoKONTROL2':
-            return self.data[2]
-        return 0
-
-
-    # Set LED mode
-    #   mode: LED mode [0:Internal, 1:External]
-    #   nanoKONTROL2 only
-    def set_led_mode(self, mode):
-        if self.device_type == 'nanoKONTROL2' and mode <= 1:
-            self.data[2] = mode
-        return 0
-
-
-    # Get group MIDI channel
-    #   group_offset: Offset of the group within dataset
-    #   returns: MIDI channel
-    def get_group_channel(self, group_offset):
-        return self.data[group_offset]
-
-
-    # Set group MIDI channel
-    #   group_offset: Offset of the group within dataset
-    #   chan: MIDI channel
-    def set_group_channel(self, group_offset, chan):
-        self.data[group_offset] = chan
-
-
-    # Get control parameter
-    #   group_offset: Offset of group / transport
-    #   control: Control name, e.g. 'button_a'
-    #   param: Control parameter ['assign', 'behaviour', 'transport_behaviour', 'cmd', 'min', 'max']
-    #   returns: Parameter value or 0 if parameter not available
-    def get_control_parameter(self, group_offset, control, param):
-        try:
-            control_offset = control_map[self.device_type]['group_map'][control]
-            param_offset = control_map[self.device_type]['param_map'][param][0]
-            return self.data[group_offset + control_offset + param_offset]
-        except:
-            return 0
-
-
-    # Set control parameter
-    #   group_offset: Offset of group / transport
-    #   control: Control name, e.g. 'button_a'
-    #   param: Control parameter ['assign', 'behaviour', 'transport_behaviour', 'cmd', 'min', 'max']
-    #   value: Parameter value
-    def set_control_parameter(self, group_offset, control, param, value):
-        try:
-            control_offset = control_map[self.device_type]['group_map'][control]
-            param_offset = control_map[self.device_type]['param_map'][param][0]
-            param_max = control_map[self.device_type]['param_map'][param][1]
-            if value > param_max:
-                return False
-            self.data[group_offset + control_offset + param_offset] = value
-        except:
-            return False
-        return True
-
-
 # Send a MIDI message to all connected devices
-#   msg: Raw MIDI data as list of integers
+#   msg: Raw MIDI data as bytes or list of integers
 def send_midi(msg):
-    global ev
+    send_midi_batch((msg,))
+
+
+# Send several MIDI messages to all connected devices
+# ALSA output is drained once for the whole batch and JACK sends as many as fit in each period
+#   msgs: List of raw MIDI messages
+def send_midi_batch(msgs):
     try:
-        alsa_client.event_output(alsa_midi.MidiBytesEvent(bytes(msg)), port=alsa_midi_out)
+        for msg in msgs:
+            alsa_client.event_output(alsa_midi.MidiBytesEvent(bytes(msg)), port=alsa_midi_out)
         alsa_client.drain_output()
     except:
         pass # ALSA failed but let's try JACk as well
-    ev = msg # Very simple slow (single message) JACK MIDI send mechanism
+    if jack_client:
+        for msg in msgs:
+            if not jack_tx_queue.put(msg):
+                logging.warning('JACK MIDI transmit queue full - message dropped')
 
 ## Device specific MIDI messages - send from application to device ##
 
 # Send Inquiry Message Request
 def send_inquiry():
-    send_midi([0xF0, 0x7E, 0x7F, 0x06, 0x01, 0xF7])
+    send_midi(protocol.inquiry())
 
 
 # Send device search request
 def send_device_search():
-    send_midi([0xF0, 0x42, 0x50, 0x00, echo_id, 0xF7])
-
-
-# Send a command list message
-#   data: List containing the message payload
-def send_command_list(data):
-    try:
-        send_midi((0xF0, 0x42, 0x40 | scene_data.global_midi_chan) + scene_data.get_sysex_id() + data + (0xF7,))
-    except Exception as e:
-        logging.warning(e)
+    send_midi(protocol.device_search(echo_id))
 
 
 # Request current scene data dump from device
 def send_dump_request():
-    send_command_list((0x1F, 0x10, 0x00))
+    main_session.dump().add_done_callback(lambda future: on_transaction_done('Download', future))
 
 
 # Request current temporary scene data be saved on device
 def send_scene_write_request():
-    if scene_data.device_type == 'nanoKONTROL1':
-        send_command_list((0x1F, 0x11, current_scene))
-    else:
-        send_command_list((0x1F, 0x11, 0))
-
+    main_session.write(current_scene).add_done_callback(lambda future: on_transaction_done('Save', future))
 
-# Request native mode in (nanoKONTROL2)
-#TODO: Implement native mode in on nanoKONTROL2
-def send_native_mode():
-    send_command_list((0x00, 0x00, 0x00))
 
-
-# Request native mode out (nanoKONTROL2)
-#TODO: Implement native mode out on nanoKONTROL2
-def send_native_mode():
-    send_command_list((0x00, 0x00, 0x01))
+# Request native mode in or out (nanoKONTROL2)
+#   out: True for native mode out, False for native mode in
+#TODO: Implement native mode on nanoKONTROL2
+def send_native_mode(out=False):
+    send_midi(protocol.native_mode(scene_data, out))
 
 
 # Request mode (nanoKONTROL2)
 #TODO: Implement request mode on nanoKONTROL2
 def send_query_mode():
-    send_command_list((0x1F, 0x12, 0x00))
+    send_midi(protocol.query_mode(scene_data))
 
 
 # Request a scene change (nanoKONTROL1)
 #   scene: Requested scene [0..3]
 def send_scene_change_request(scene):
-    if(scene >= 0 and scene <= 3):
-        send_command_list((0x1F, 0x14, scene, 0xF7))
+    try:
+        main_session.change_scene(scene).add_done_callback(lambda future: on_transaction_done('Scene change', future))
+    except ValueError:
+        pass
+
+
+# Download all scenes from device (nanoKONTROL1)
+# Scenes are cached so that later scene changes do not need a download
+def fetch_all_scenes():
+    if scene_data.device_type != 'nanoKONTROL1':
+        set_statusbar('{} has only one scene'.format(scene_data.device_type))
+        return
+    set_statusbar('Downloading all scenes')
+    start = perf_counter()
+    main_session.fetch_all_scenes().add_done_callback(lambda future: on_fetch_all_scenes_done(start, future))
+
+
+# Handle completion of download of all scenes
+#   start: Time download started
+#   future: Completed future
+def on_fetch_all_scenes_done(start, future):
+    if future.cancelled():
+        return
+    if future.exception():
+        set_statusbar('Download of all scenes failed: {}'.format(future.exception()), 2)
+        return
+    populate_editor()
+    set_statusbar('Downloaded {} scenes in {:.0f} ms'.format(len(future.result()), (perf_counter() - start) * 1000), 1)
 
 
 # Upload a scene to device 'current scene'
 # Must write scene to save to persistent memory
-def send_scene_data():
-    if scene_data.device_type == 'nanoKONTROL1':
-        send_command_list((0x7F, 0x7F, 0x02, 0x02, 0x26, 0x40) + scene_data.get_midi_data())
-    elif scene_data.device_type == 'nanoKONTROL2':
-        send_command_list((0x7F, 0x7F, 0x02, 0x03, 0x05, 0x40) + scene_data.get_midi_data())
+#   force: True to upload even if device already holds scene (default: False)
+def send_scene_data(force=False):
+    if not force and scene_data.is_synced():
+        set_statusbar('Device already matches scene - upload skipped', 1)
+        return
+    main_session.upload(force).add_done_callback(on_upload_done)
+
+
+# Handle completion of scene upload
+# LED mode of device may have changed so LEDs are refreshed
+#   future: Completed transaction future
+def on_upload_done(future):
+    if on_transaction_done('Upload', future):
+        led_state.invalidate()
+        schedule_led_flush()
+
+
+# Handle completion of a device transaction
+# Replies (ACK / NAK) are reported by handle_midi_input so only timeouts are reported here
+#   name: Name of transaction to show in status bar
+#   future: Completed transaction future
+#   returns: True if transaction succeeded
+def on_transaction_done(name, future):
+    try:
+        future.result()
+        return True
+    except TimeoutError:
+        set_statusbar('{} failed - no reply from device'.format(name), 2)
+    except TransactionError:
+        pass
+    except Exception:
+        pass # Cancelled
+    return False
+
+
+# Check for transaction timeouts
+# Runs in UI thread, rescheduling itself with Tk after()
+def poll_transactions():
+    main_session.poll()
+    sessions.poll()
+    root.after(TRANSACTION_POLL_MS, poll_transactions)
 
 
 # Send port detect request
 def send_port_detect():
-    send_command_list((0x1E, 0x00, echo_id))
+    send_midi(protocol.port_detect(scene_data, echo_id))
 
 
 ## UI  Functions ##
 
-# Add and remove ALSA ports to global list of source ports 
-def populate_alsa_source(event=None):
-    global source_ports
-    ports = alsa_client.list_ports(input=True, type=alsa_midi.PortType.ANY)
-    temp_ports = {}
-    for port in source_ports:
-        if source_ports[port][0] == 'jack':
-            temp_ports[port] = source_ports[port]
-    source_ports = temp_ports
-    for port in ports:
-        name = port.client_name + ':' + port.name
+# Add an ALSA port to global lists of source and destination ports
+#   port: ALSA PortInfo
+#   client_name: Name of ALSA client that owns the port
+def add_alsa_port(port, client_name):
+    addr = (port.client_id, port.port_id)
+    remove_alsa_port(addr)
+    if port.client_id == 0:
+        return # Ignore system ports (timer and announce)
+    name = client_name + ':' + port.name
+    caps = port.capability
+    if caps & alsa_midi.PortCaps.READ and caps & alsa_midi.PortCaps.SUBS_READ:
         source_ports[name] = ['alsa', port]
-    update_ports()
-
-
-# Add and remove ALSA ports to global list of destination ports 
-def populate_alsa_dest(event=None):
-    global destination_ports
-    ports = alsa_client.list_ports(output=True, type=alsa_midi.PortType.ANY)
-    temp_ports = {}
-    for port in destination_ports:
-        if destination_ports[port][0] == 'jack':
-            temp_ports[port] = destination_ports[port]
-    destination_ports = temp_ports
-    for port in ports:
-        name = port.client_name + ':' + port.name
+    if caps & alsa_midi.PortCaps.WRITE and caps & alsa_midi.PortCaps.SUBS_WRITE:
         destination_ports[name] = ['alsa', port]
-    update_ports()
+    alsa_port_names[addr] = name
+
+
+# Remove an ALSA port from global lists of source and destination ports
+#   addr: ALSA port address as (client_id, port_id)
+def remove_alsa_port(addr):
+    name = alsa_port_names.pop(tuple(addr), None)
+    if name is None:
+        return
+    for ports in (source_ports, destination_ports):
+        if name in ports and ports[name][0] == 'alsa':
+            del ports[name]
+
+
+# Populate global lists of source and destination ports with all ALSA ports
+# Only required at startup - changes are then applied from ALSA system announce events (or rescanned when a port list is opened if announcements are unavailable)
+def populate_alsa_ports():
+    for addr in list(alsa_port_names):
+        remove_alsa_port(addr)
+    for port in alsa_client.list_ports(input=True, type=alsa_midi.PortType.ANY):
+        add_alsa_port(port, port.client_name)
+    for port in alsa_client.list_ports(output=True, type=alsa_midi.PortType.ANY):
+        add_alsa_port(port, port.client_name)
+    schedule_update_ports()
+
+
+# Handle ALSA port start or change announcement
+#   addr: ALSA port address
+def on_alsa_port_start(addr):
+    try:
+        port = alsa_client.get_port_info(addr)
+        client_name = alsa_client.get_client_info(addr[0]).name
+    except alsa_midi.ALSAError:
+        return # Port has already gone
+    add_alsa_port(port, client_name)
+    schedule_update_ports()
+
+
+# Handle ALSA port exit announcement
+#   addr: ALSA port address
+def on_alsa_port_exit(addr):
+    remove_alsa_port(addr)
+    schedule_update_ports()
+
+
+# Handle ALSA client change announcement, e.g. client renamed
+#   addr: ALSA client address
+def on_alsa_client_change(addr):
+    for port_addr in [port_addr for port_addr in alsa_port_names if port_addr[0] == addr[0]]:
+        on_alsa_port_start(port_addr)
+
+
+# Handle ALSA client exit announcement
+#   addr: ALSA client address
+def on_alsa_client_exit(addr):
+    for port_addr in [port_addr for port_addr in alsa_port_names if port_addr[0] == addr[0]]:
+        remove_alsa_port(port_addr)
+    schedule_update_ports()
+
+
+# Schedule update of drop-down lists of MIDI ports
+# Bursts of port changes are coalesced into a single update
+def schedule_update_ports():
+    global ports_update_scheduled
+    if not ports_update_scheduled:
+        ports_update_scheduled = True
+        root.after_idle(update_ports)
 
 
 # Update drop-down lists of MIDI ports
 def update_ports():
-    values = []
-    for port in source_ports:
-        values.append(port)
-    cmb_midi_input['values'] = values
-    values = []
-    for port in destination_ports:
-        values.append(port)
-    cmb_midi_output['values'] = values
+    global ports_update_scheduled
+    ports_update_scheduled = False
+    cmb_midi_input['values'] = source_ports.names
+    cmb_midi_output['values'] = destination_ports.names
+    for direction, ports in (('in', source_ports), ('out', destination_ports)):
+        if connections.actual[direction] not in ports:
+            connections.lost(connections.actual[direction])
     auto_connect()
 
 
@@ -583,28 +349,8 @@ def source_changed(event=None):
     name = midi_source_port.get()
     if name not in source_ports:
         return
-    try:
-        jack_midi_in.disconnect()
-    except Exception as e:
-        pass
-    try:
-        for port in ports:
-            ports = alsa_client.list_ports(input=True, type=alsa_midi.PortType.ANY)
-            try:
-                alsa_midi_in.disconnect_from(port)
-            except Exception as e:
-                pass # Ignore any unconnected ports
-    except:
-        pass # ALSA may not be enabled
-
-    try:
-        if source_ports[name][0] == 'jack':
-            jack_midi_in.connect(source_ports[name][1])
-        elif source_ports[name][0] == 'alsa':
-            alsa_midi_in.connect_from(source_ports[name][1])
-    except Exception as e:
-        pass
-    send_device_search()
+    connections.set_desired('in', name)
+    apply_connections()
 
 
 # Handle selection from MIDI destination drop-down list
@@ -612,28 +358,484 @@ def destination_changed(event=None):
     name = midi_dest_port.get()
     if name not in destination_ports:
         return
-    try:
-        jack_midi_out.disconnect()
-    except Exception as e:
-        pass
-    try:
-        ports = alsa_client.list_ports(output=True, type=alsa_midi.PortType.ANY)
-        for port in ports:
-            try:
-                alsa_midi_out.disconnect_to(port)
-            except Exception as e:
-                pass # Ignore any unconnected ports
-    except:
-        pass # ALSA may not be enabled
+    connections.set_desired('out', name)
+    apply_connections()
+
+
+# Connect a MIDI port to the application
+#   direction: 'in' to connect a source port to application input, 'out' to connect application output to a destination port
+#   name: Display name of port
+def connect_port(direction, name):
+    if direction == 'in':
+        type, port = source_ports[name]
+        if type == 'jack':
+            jack_midi_in.connect(port)
+        else:
+            alsa_midi_in.connect_from(port)
+    else:
+        type, port = destination_ports[name]
+        if type == 'jack':
+            jack_midi_out.connect(port)
+        else:
+            alsa_midi_out.connect_to(port)
 
+
+# Disconnect a MIDI port from the application
+#   direction: 'in' for a source port, 'out' for a destination port
+#   name: Display name of port
+def disconnect_port(direction, name):
+    if direction == 'in':
+        type, port = source_ports[name]
+        if type == 'jack':
+            jack_midi_in.disconnect(port)
+        else:
+            alsa_midi_in.disconnect_from(port)
+    else:
+        type, port = destination_ports[name]
+        if type == 'jack':
+            jack_midi_out.disconnect(port)
+        else:
+            alsa_midi_out.disconnect_to(port)
+
+
+# Make connections required to reach selected ports
+# A single device search is sent once connections have settled
+def apply_connections():
+    global device_search_scheduled
+    changed = connections.apply()
+    if not changed:
+        return
+    if 'out' in changed:
+        scene_data.clear_synced() # May be a different device
+        led_state.invalidate()
+    if device_search_scheduled:
+        root.after_cancel(device_search_scheduled)
+    device_search_scheduled = root.after(CONNECTION_SETTLE_MS, on_connections_settled)
+
+
+# Search for device after connections have settled
+def on_connections_settled():
+    global device_search_scheduled
+    device_search_scheduled = None
+    if connections.actual['out'] is not None:
+        send_device_search()
+
+
+# Search for devices on all ALSA MIDI ports at once
+# Only ALSA ports are probed because each probe must reach a single port - JACK output goes to all connected ports
+# The selected MIDI output is not probed because it is already connected to the application output
+def discover_devices():
+    global discovery
+    if discovery or not alsa_client:
+        return
+    own_client = alsa_client.client_id
+    outputs = [name for name in destination_ports.names if destination_ports[name][0] == 'alsa' and destination_ports[name][1].client_id != own_client and name != connections.actual['out']]
+    if len(outputs) > MAX_PROBES:
+        logging.warning('Only probing first %d of %d MIDI ports', MAX_PROBES, len(outputs))
+        outputs = outputs[:MAX_PROBES]
+    discovery = DeviceDiscovery(outputs)
+    # Listen to all other sources so that replies can be matched to their input port - their other messages are dropped
+    for name in source_ports.names:
+        type, port = source_ports[name]
+        if type != 'alsa' or port.client_id == own_client or name == connections.actual['in'] or sessions.get(name):
+            continue
+        try:
+            alsa_midi_in.connect_from(port)
+            discovery_subscriptions.append(port)
+            discovery.add_input(name)
+        except alsa_midi.ALSAError:
+            pass
+    for output, msg in discovery.get_requests():
+        try:
+            alsa_client.event_output(alsa_midi.MidiBytesEvent(msg), port=alsa_midi_out, dest=destination_ports[output][1])
+        except alsa_midi.ALSAError:
+            pass
+    alsa_client.drain_output()
+    set_statusbar('Searching for devices on {} ports'.format(len(outputs)))
+    root.after(DISCOVERY_TIMEOUT_MS, finish_discovery)
+
+
+# End device discovery and show detected devices
+def finish_discovery():
+    global discovery
+    for port in discovery_subscriptions:
+        try:
+            alsa_midi_in.disconnect_from(port)
+        except alsa_midi.ALSAError:
+            pass
+    discovery_subscriptions.clear()
+    devices = discovery.get_results()
+    discovery = None
+    show_discovery_results(devices)
+
+
+# Show table of devices detected by discovery
+# Double-click a device to select its ports
+#   devices: List of detected device dictionaries
+def show_discovery_results(devices):
+    set_statusbar('Found {} devices'.format(len(devices)), 1 if devices else 2)
+    if not devices:
+        return
+    dlg = tk.Toplevel(root)
+    dlg.title('Detected devices')
+    columns = (('device_type', 'Device'), ('version', 'Version'), ('family_id', 'Family'), ('member_id', 'Member'), ('chan', 'Global channel'), ('output', 'MIDI output'), ('input', 'MIDI input'))
+    tree = ttk.Treeview(dlg, columns=[column for column, title in columns], show='headings')
+    for column, title in columns:
+        tree.heading(column, text=title)
+    for index, device in enumerate(devices):
+        values = [device[column] for column, title in columns]
+        values[4] += 1 # Show MIDI channel 1..16
+        tree.insert('', 'end', iid=str(index), values=values)
+    tree.bind('<Double-1>', lambda event: select_device(devices[int(tree.focus())]) if tree.focus() else None)
+    tree.grid(sticky='nsew')
+    ttk.Button(dlg, text='Add selected to sessions', command=lambda: [add_session(devices[int(iid)]) for iid in tree.selection()]).grid(sticky='e')
+    dlg.grid_columnconfigure(0, weight=1)
+    dlg.grid_rowconfigure(0, weight=1)
+
+
+# Select ports of a detected device
+#   device: Detected device dictionary
+def select_device(device):
+    if device['input'] in source_ports:
+        midi_source_port.set(device['input'])
+        source_changed()
+    if device['output'] in destination_ports:
+        midi_dest_port.set(device['output'])
+        destination_changed()
+
+
+# Get a function that sends MIDI messages to a single ALSA port
+#   name: Display name of destination port
+#   returns: Function(msg)
+def get_alsa_sender(name):
+    def send(msg):
+        try:
+            alsa_client.event_output(alsa_midi.MidiBytesEvent(bytes(msg)), port=alsa_midi_out, dest=destination_ports[name][1])
+            alsa_client.drain_output()
+        except (KeyError, alsa_midi.ALSAError):
+            pass # Port has gone so request will time out
+    return send
+
+
+# Add a session for a detected device so that it can be configured alongside other devices
+#   device: Detected device dictionary from discovery
+def add_session(device):
+    input = device['input']
+    if input is None or sessions.get(input) or input == connections.actual['in'] or input not in source_ports:
+        return # Unknown input or device already has a session
     try:
-        if destination_ports[name][0] == 'jack':
-            jack_midi_out.connect(destination_ports[name][1])
-        elif destination_ports[name][0] == 'alsa':
-            alsa_midi_out.connect_to(destination_ports[name][1])
-    except Exception as e:
+        alsa_midi_in.connect_from(source_ports[input][1])
+    except alsa_midi.ALSAError:
+        return
+    session = DeviceSession(get_alsa_sender(device['output']), device['device_type'] or 'nanoKONTROL2', input, device['output'], echo_id)
+    session.scene.global_midi_chan = device['chan']
+    sessions.add(session)
+    set_session_status(session, 'Added')
+    show_sessions()
+
+
+# Remove a session
+#   session: Session to remove
+def remove_session(session):
+    sessions.remove(session)
+    session.transactions.cancel_all()
+    session_status.pop(session.input, None)
+    try:
+        alsa_midi_in.disconnect_from(source_ports[session.input][1])
+    except (KeyError, alsa_midi.ALSAError):
         pass
-    send_device_search()
+    refresh_sessions()
+
+
+# Upload current scene to all sessions then save it on each device
+# Devices are programmed concurrently - each session has its own transactions
+def upload_to_sessions():
+    for session in sessions:
+        if session.scene.device_type != scene_data.device_type:
+            set_session_status(session, 'Skipped - different device type')
+            continue
+        session.scene.data = scene_data.data.copy()
+        set_session_status(session, 'Uploading')
+        start = perf_counter()
+        session.upload().add_done_callback(lambda future, session=session, start=start: on_session_upload_done(session, start, future))
+
+
+# Handle completion of session upload and save scene on device
+#   session: Session that uploaded
+#   start: Time upload started
+#   future: Completed transaction future
+def on_session_upload_done(session, start, future):
+    if future.cancelled():
+        return
+    if future.exception():
+        set_session_status(session, 'Upload failed: {}'.format(future.exception()))
+        return
+    set_session_status(session, 'Saving')
+    session.write().add_done_callback(lambda future: on_session_write_done(session, start, future))
+
+
+# Handle completion of session save
+#   session: Session that saved
+#   start: Time upload started
+#   future: Completed transaction future
+def on_session_write_done(session, start, future):
+    if future.cancelled():
+        return
+    if future.exception():
+        set_session_status(session, 'Save failed: {}'.format(future.exception()))
+    else:
+        set_session_status(session, 'Saved ({:.0f} ms)'.format((perf_counter() - start) * 1000))
+
+
+# Set status text shown for a session
+#   session: Session
+#   status: Status text
+def set_session_status(session, status):
+    session_status[session.input] = status
+    refresh_sessions()
+
+
+# Show dialog listing sessions
+def show_sessions():
+    global sessions_tree
+    if sessions_tree:
+        sessions_tree.winfo_toplevel().lift()
+        return
+    dlg = tk.Toplevel(root)
+    dlg.title('Sessions')
+    sessions_tree = ttk.Treeview(dlg, columns=('device_type', 'input', 'output', 'status'), show='headings')
+    for column, title in (('device_type', 'Device'), ('input', 'MIDI input'), ('output', 'MIDI output'), ('status', 'Status')):
+        sessions_tree.heading(column, text=title)
+    sessions_tree.grid(columnspan=2, sticky='nsew')
+    ttk.Button(dlg, text='Upload and save current scene on all', command=upload_to_sessions).grid(row=1, column=0, sticky='w')
+    ttk.Button(dlg, text='Remove selected', command=lambda: [remove_session(sessions.get(iid)) for iid in sessions_tree.selection() if sessions.get(iid)]).grid(row=1, column=1, sticky='e')
+    dlg.grid_columnconfigure(0, weight=1)
+    dlg.grid_rowconfigure(0, weight=1)
+    dlg.bind('<Destroy>', on_sessions_closed)
+    refresh_sessions()
+
+
+# Handle sessions dialog closed
+def on_sessions_closed(event):
+    global sessions_tree
+    if event.widget is event.widget.winfo_toplevel():
+        sessions_tree = None
+
+
+# Update sessions dialog
+def refresh_sessions():
+    if not sessions_tree:
+        return
+    sessions_tree.delete(*sessions_tree.get_children())
+    for session in sessions:
+        sessions_tree.insert('', 'end', iid=session.input, values=(session.scene.device_type, session.input, session.output, session_status.get(session.input, '')))
+
+
+# Get scene library, opening it when first used
+#   returns: SceneLibrary or None if library cannot be opened
+def get_library():
+    global library
+    if library is None:
+        try:
+            library = SceneLibrary(os.path.expanduser(args.library))
+        except (OSError, ValueError) as e:
+            set_statusbar('Failed to open scene library: {}'.format(e), 2)
+    return library
+
+
+# Show dialog listing scenes in library
+# Double-click a scene to load it into the editor
+def show_library():
+    global library_tree
+    if get_library() is None:
+        return
+    if library_tree:
+        library_tree.winfo_toplevel().lift()
+        return
+    dlg = tk.Toplevel(root)
+    dlg.title('Scene library - {}'.format(library.path))
+    library_tree = ttk.Treeview(dlg, columns=('name', 'device_type', 'stored'), show='headings')
+    for column, title in (('name', 'Name'), ('device_type', 'Device'), ('stored', 'Stored')):
+        library_tree.heading(column, text=title)
+    library_tree.bind('<Double-1>', lambda event: load_from_library(int(library_tree.focus())) if library_tree.focus() else None)
+    library_tree.grid(columnspan=3, sticky='nsew')
+    library_name = tk.StringVar()
+    ttk.Entry(dlg, textvariable=library_name).grid(row=1, column=0, sticky='ew')
+    ttk.Button(dlg, text='Add current scene', command=lambda: add_to_library(library_name.get())).grid(row=1, column=1)
+    ttk.Button(dlg, text='Replace selected', command=lambda: [add_to_library(library_name.get(), int(iid)) for iid in library_tree.selection()]).grid(row=1, column=2)
+    frame_search = tk.Frame(dlg)
+    frame_search.grid(row=2, columnspan=3, sticky='w')
+    search_chan = tk.IntVar(value=1)
+    search_assign = tk.StringVar(value='CC')
+    search_cmd = tk.IntVar()
+    tk.Label(frame_search, text='Find scenes sending').grid(row=0, column=0)
+    ttk.Combobox(frame_search, textvariable=search_assign, state='readonly', values=assign_options[1:], width=5).grid(row=0, column=1)
+    tk.Spinbox(frame_search, from_=0, to=127, textvariable=search_cmd, width=3).grid(row=0, column=2)
+    tk.Label(frame_search, text='on channel').grid(row=0, column=3)
+    tk.Spinbox(frame_search, from_=1, to=16, textvariable=search_chan, width=3).grid(row=0, column=4)
+    ttk.Button(frame_search, text='Find', command=lambda: find_in_library(search_chan.get() - 1, assign_options.index(search_assign.get()), search_cmd.get())).grid(row=0, column=5)
+    dlg.grid_columnconfigure(0, weight=1)
+    dlg.grid_rowconfigure(0, weight=1)
+    dlg.bind('<Destroy>', on_library_closed)
+    for record in library:
+        insert_library_record(record)
+
+
+# Add a library record to library dialog
+#   record: SceneRecord
+def insert_library_record(record):
+    values = (record.name, record.device_type, datetime.fromtimestamp(record.timestamp).strftime('%Y-%m-%d %H:%M:%S'))
+    iid = str(record.index)
+    if library_tree.exists(iid):
+        library_tree.item(iid, values=values)
+    else:
+        library_tree.insert('', 'end', iid=iid, values=values)
+
+
+# Handle library dialog closed
+def on_library_closed(event):
+    global library_tree
+    if event.widget is event.widget.winfo_toplevel():
+        library_tree = None
+
+
+# Store current scene in library
+#   name: Name of scene in library (default: nanoKONTROL1 scene name)
+#   index: Index of record to replace or None to add a new record
+def add_to_library(name=None, index=None):
+    if get_library() is None:
+        return
+    if not name:
+        name = None
+    if index is None:
+        index = library.append(scene_data, name)
+    else:
+        library.replace(index, scene_data, name)
+    if library_index is not None:
+        library_index.add(index, scene_data.device_type, scene_data.data)
+    if library_tree:
+        insert_library_record(library[index])
+    set_statusbar('Scene stored in library', 1)
+
+
+# Select library scenes that send a MIDI message
+#   chan: MIDI channel [0..15]
+#   assign: Message type [1: CC, 2: Note]
+#   cmd: CC or note number
+def find_in_library(chan, assign, cmd):
+    global library_index
+    if library_index is None:
+        library_index = ParameterIndex()
+        library_index.add_library(library)
+    keys = library_index.find_scenes(chan, assign, cmd)
+    if library_tree:
+        library_tree.selection_set([str(key) for key in keys])
+        if keys:
+            library_tree.see(str(keys[0]))
+    set_statusbar('{} scenes send {} {} on channel {}'.format(len(keys), assign_options[assign], cmd, chan + 1))
+
+
+# Load a scene from library into editor
+#   index: Index of record
+def load_from_library(index):
+    record = library[index]
+    if record.device_type != scene_data.device_type:
+        set_device_type(record.device_type)
+    scene_data.data = bytearray(record.data)
+    scene_data.clear_synced()
+    populate_editor()
+    set_statusbar('Loaded scene {} from library'.format(record.name or index + 1), 1)
+
+
+# Show bulk edit dialog to assign a pattern of CC / note numbers to many controls
+def show_bulk_edit():
+    global bulk_edit_dlg
+    if bulk_edit_dlg:
+        bulk_edit_dlg.lift()
+        return
+    map = control_map[scene_data.device_type]
+    bulk_edit_dlg = tk.Toplevel(root)
+    bulk_edit_dlg.title('Bulk edit - {}'.format(scene_data.device_type))
+    bulk_edit_dlg.bind('<Destroy>', on_bulk_edit_closed)
+    control_vars = {}
+    tk.Label(bulk_edit_dlg, text='Controls').grid(row=0, column=0, sticky='w')
+    frame_controls = tk.Frame(bulk_edit_dlg)
+    frame_controls.grid(row=0, column=1, columnspan=3, sticky='w')
+    for i, control in enumerate(list(map['ctrl_coords'])[:map['num_group_ctrls']]):
+        control_vars[control] = tk.IntVar(value=control == 'slider')
+        tk.Checkbutton(frame_controls, text=control.replace('_',' ').upper(), variable=control_vars[control]).grid(row=0, column=i)
+    first_group = tk.IntVar(value=1)
+    last_group = tk.IntVar(value=len(map['groups']))
+    tk.Label(bulk_edit_dlg, text='Groups').grid(row=1, column=0, sticky='w')
+    tk.Spinbox(bulk_edit_dlg, from_=1, to=len(map['groups']), textvariable=first_group, width=3).grid(row=1, column=1, sticky='w')
+    tk.Label(bulk_edit_dlg, text='to').grid(row=1, column=2)
+    tk.Spinbox(bulk_edit_dlg, from_=1, to=len(map['groups']), textvariable=last_group, width=3).grid(row=1, column=3, sticky='w')
+    assign = tk.StringVar(value='CC')
+    start = tk.IntVar()
+    step = tk.IntVar(value=1)
+    tk.Label(bulk_edit_dlg, text='Start').grid(row=2, column=0, sticky='w')
+    ttk.Combobox(bulk_edit_dlg, textvariable=assign, state='readonly', values=assign_options[1:], width=5).grid(row=2, column=1, sticky='w')
+    tk.Spinbox(bulk_edit_dlg, from_=0, to=127, textvariable=start, width=3).grid(row=2, column=2)
+    tk.Label(bulk_edit_dlg, text='Step').grid(row=3, column=0, sticky='w')
+    tk.Spinbox(bulk_edit_dlg, from_=-127, to=127, textvariable=step, width=3).grid(row=3, column=1, sticky='w')
+    # Empty / 'Unchanged' leaves parameter unchanged
+    chan = tk.StringVar(value='Unchanged')
+    minimum = tk.StringVar()
+    maximum = tk.StringVar()
+    behaviour = tk.StringVar(value='Unchanged')
+    tk.Label(bulk_edit_dlg, text='MIDI channel').grid(row=4, column=0, sticky='w')
+    ttk.Combobox(bulk_edit_dlg, textvariable=chan, state='readonly', values=['Unchanged', 'Global'] + [str(i) for i in range(1, 17)], width=9).grid(row=4, column=1, columnspan=3, sticky='w')
+    tk.Label(bulk_edit_dlg, text='Min / Off').grid(row=5, column=0, sticky='w')
+    tk.Spinbox(bulk_edit_dlg, from_=0, to=127, textvariable=minimum, width=3).grid(row=5, column=1, sticky='w')
+    tk.Label(bulk_edit_dlg, text='Max / On').grid(row=5, column=2)
+    tk.Spinbox(bulk_edit_dlg, from_=0, to=127, textvariable=maximum, width=3).grid(row=5, column=3, sticky='w')
+    minimum.set('')
+    maximum.set('')
+    tk.Label(bulk_edit_dlg, text='Behaviour').grid(row=6, column=0, sticky='w')
+    ttk.Combobox(bulk_edit_dlg, textvariable=behaviour, state='readonly', values=['Unchanged'] + behaviour_options, width=9).grid(row=6, column=1, columnspan=3, sticky='w')
+
+    def apply():
+        try:
+            groups = range(first_group.get() - 1, last_group.get())
+            pattern_chan = {'Unchanged': None, 'Global': 16}.get(chan.get())
+            if pattern_chan is None and chan.get() != 'Unchanged':
+                pattern_chan = int(chan.get()) - 1
+            bulk_edit([control for control, var in control_vars.items() if var.get()], groups, start.get(), step.get(),
+                assign_options.index(assign.get()), pattern_chan,
+                int(minimum.get()) if minimum.get() else None, int(maximum.get()) if maximum.get() else None,
+                behaviour_options.index(behaviour.get()) if behaviour.get() in behaviour_options else None)
+        except (ValueError, tk.TclError) as e:
+            set_statusbar('Bulk edit failed: {}'.format(e), 2)
+
+    ttk.Button(bulk_edit_dlg, text='Apply', command=apply).grid(row=7, column=0, columnspan=4)
+
+
+# Handle bulk edit dialog closed
+#   event: Destroy event
+def on_bulk_edit_closed(event):
+    global bulk_edit_dlg
+    if event.widget is bulk_edit_dlg:
+        bulk_edit_dlg = None
+
+
+# Assign a pattern of CC / note numbers to controls x groups of the current scene
+# Scene data is changed in one pass then the editor is refreshed once
+#   controls: List of control names
+#   groups: List of group indices
+#   start: First CC or note number
+#   step: Increment between controls
+#   assign: Message type [1: CC, 2: Note]
+#   chan: Group MIDI channel [0..15, 16: Global] or None to leave unchanged
+#   min: Minimum / off value or None to leave unchanged
+#   max: Maximum / on value or None to leave unchanged
+#   behaviour: Button behaviour [0: Momentary, 1: Toggle] or None to leave unchanged
+#   raises: ValueError if pattern is invalid
+def bulk_edit(controls, groups, start, step=1, assign=1, chan=None, min=None, max=None, behaviour=None):
+    if not controls or not groups:
+        raise ValueError('No controls selected')
+    count = apply_pattern(scene_data, controls, groups, start, step, assign, chan, min, max, behaviour)
+    populate_editor()
+    set_statusbar('Assigned {} controls'.format(count), 1)
 
 
 # Populate the control editor and connect to a control to edit
@@ -658,6 +860,9 @@ def populate_editor(ctrl=None, group=None):
     if ctrl is not None:
         editor_ctrl = ctrl
         editor_group = group
+    else:
+        conflicts.rebuild(scene_data)
+        schedule_draw_conflicts()
     if editor_ctrl is None or editor_ctrl not in control_map[scene_data.device_type]['ctrl_coords']:
         # Must be first time so select first knob
         editor_ctrl = 'knob'
@@ -739,7 +944,12 @@ def on_editor_midi_chan(*args):
         scene_data.set_group_channel(editor_group_offset,  16)
     else:
         spn_chan['state'] = tk.NORMAL
-        scene_data.set_group_channel(editor_group_offset,  editor_midi_channel.get() - 1)
+        try:
+            scene_data.set_group_channel(editor_group_offset,  editor_midi_channel.get() - 1)
+        except:
+            return
+    conflicts.update_group(scene_data, editor_group)
+    schedule_draw_conflicts()
 
 
 # Handle change of editor assign (control mode)
@@ -748,6 +958,7 @@ def on_editor_assign(*args):
         scene_data.set_control_parameter(editor_group_offset, editor_ctrl, 'assign', editor_assign.get())
     except:
         pass
+    update_control_conflicts()
     if editor_assign.get() == 0:
         # Disabled
         for ctrl in [rb_editor_momentary, rb_editor_toggle, spn_cmd, spn_min, spn_max, spn_attack, spn_release, spn_chan, chk_global, cmb_cmd, cmb_mmc_cmd, spn_mmc_id]:
@@ -822,6 +1033,7 @@ def on_editor_cmd(*args):
         scene_data.set_control_parameter(editor_group_offset, editor_ctrl, 'cmd', editor_cmd.get())
     except:
         pass
+    update_control_conflicts()
 
 
 # Handle change of editor command (Note)
@@ -830,6 +1042,7 @@ def on_editor_note(*args):
         scene_data.set_control_parameter(editor_group_offset, editor_ctrl, 'cmd', notes.index(editor_note.get()))
     except:
         pass
+    update_control_conflicts()
 
 
 # Handle change of editor min/off
@@ -887,6 +1100,8 @@ def on_editor_global_midi_chan(*args):
         scene_data.set_global_channel(editor_global_midi_channel.get() - 1)
     except:
         pass
+    conflicts.update_global_channel(scene_data)
+    schedule_draw_conflicts()
 
 
 # Handle change of LED mode (nanoKONTROL2 only)
@@ -911,6 +1126,59 @@ def on_editor_scene_name(*args):
     scene_data.set_scene_name(editor_scene_name.get())
 
 
+# Update conflicts after the edited control's assign or command changed
+def update_control_conflicts():
+    conflicts.update_control(scene_data, editor_group, editor_group_offset, editor_ctrl)
+    schedule_draw_conflicts()
+
+
+# Schedule redraw of conflict highlights when idle so that a burst of edits draws once
+def schedule_draw_conflicts():
+    global conflicts_scheduled
+    if not conflicts_scheduled:
+        conflicts_scheduled = True
+        root.after_idle(draw_conflicts)
+
+
+# Highlight controls that send the same MIDI message as another control
+# Only controls whose conflict state may have changed are redrawn
+def draw_conflicts():
+    global conflicts_scheduled
+    conflicts_scheduled = False
+    changes = conflicts.get_changes()
+    for group, control in changes:
+        conflicted = conflicts.is_conflicted(group, control)
+        item = conflict_items.get((group, control))
+        if item is None:
+            if not conflicted or control not in control_map[scene_data.device_type]['ctrl_coords']:
+                continue
+            item = canvas.create_rectangle(*get_control_rect(group, control), outline='red', width=2, tags='conflict')
+            conflict_items[(group, control)] = item
+        canvas.itemconfig(item, state=tk.NORMAL if conflicted else tk.HIDDEN)
+    if (editor_group, editor_ctrl) in changes:
+        report_conflicts()
+
+
+# Show controls that send the same MIDI message as the edited control in status bar
+def report_conflicts():
+    names = []
+    for group, control in conflicts.get_conflicts(editor_group, editor_ctrl):
+        if group is None:
+            names.append(control.replace('_',' ').upper())
+        else:
+            names.append('{} {}'.format(control.replace('_',' ').upper(), group + 1))
+    if names:
+        set_statusbar('Same MIDI message is sent by {}'.format(', '.join(sorted(names))), 2)
+
+
+# Remove conflict highlights, e.g. after resize or device change, and redraw all conflicts
+def clear_conflicts():
+    canvas.delete('conflict')
+    conflict_items.clear()
+    conflicts.changed.update(conflicts.get_conflicted())
+    schedule_draw_conflicts()
+
+
 # Restore the data from last downloaded
 def restore_last_download():
     scene_data.data = scene_backup.data.copy()
@@ -923,16 +1191,34 @@ def show_info():
     msg = 'nanoKONTROL-Config\nriban 2022\n'
     for credit in credits:
         msg += '\n{}'.format(credit)
+    if jack_client:
+        stats = get_jack_stats()
+        msg += '\n\nJACK xruns: {}\nJACK process: {:.0f} us max, {:.0f} us budget'.format(stats['xruns'], stats['process_time_max'] * 1e6, stats['budget'] * 1e6)
     messagebox.showinfo('About...', msg)
 
 
+# Create tooltips (deferred until main loop is running)
+def create_tooltips():
+    global tooltip_obj
+    import ToolTips
+    tooltip_obj = ToolTips.ToolTips(
+        [btn_download, btn_upload, btn_save, btn_restore, btn_info, chk_monitor, btn_discover, btn_sessions, btn_fetch_scenes, btn_library, btn_bulk_edit],
+        ['Download from nanoKONTROL', 'Upload to nanoKONTROL', 'Save current scene on nanoKONTROL', 'Restore to last download', 'About', 'Show controls moved on nanoKONTROL', 'Search all ALSA MIDI ports for devices', 'Configure several devices at once', 'Download all scenes from nanoKONTROL1', 'Store and load scenes on disk', 'Assign CC / note numbers to many controls at once']
+    )
+
+
 # Resize the device image
 def resize_image(event):
     global photo_img_device, photo_img_sel, photo_img_scene_led
-    photo_img_device = ImageTk.PhotoImage(img_device.resize((event.width, event.width // 4), Image.LANCZOS))
+    if event.width != photo_img_device.width():
+        # Avoid repeated resize of large device image when only height changes
+        img_device = get_device_image(scene_data.device_type)
+        photo_img_device = ImageTk.PhotoImage(img_device.resize((event.width, event.width // 4), Image.LANCZOS))
+        canvas.itemconfig(img_id_device, image=photo_img_device)
+        clear_monitor()
+        clear_conflicts()
     photo_img_sel = ImageTk.PhotoImage(img_sel.resize((int(event.width * 0.03), int(event.width * 0.03)), Image.LANCZOS))
     photo_img_scene_led = ImageTk.PhotoImage(img_scene_led.resize((int(event.width * 0.02), int(event.width * 0.02)), Image.LANCZOS))
-    canvas.itemconfig(img_id_device, image=photo_img_device)
     canvas.itemconfig(img_id_sel, image=photo_img_sel)
     canvas.itemconfig(img_id_scene_led, image=photo_img_scene_led)
     highlight_control()
@@ -969,6 +1255,7 @@ def on_canvas_click(event):
             else:
                 populate_editor(ctrl, group)
                 highlight_control()
+                report_conflicts()
             break
 
 
@@ -983,6 +1270,110 @@ def highlight_control():
     canvas.coords(img_id_sel, (group_offset_x + ctrl_offset_x) * photo_img_device.width(), ctrl_offset_y * photo_img_device.height())
 
 
+# Get canvas rectangle of a control
+#   group: Group index or None for transport controls
+#   control: Control name, e.g. 'slider'
+#   returns: (x0, y0, x1, y1) in canvas coordinates
+def get_control_rect(group, control):
+    if group is None:
+        group_offset_x = control_map[scene_data.device_type]['group_coords'][-1][0]
+    else:
+        group_offset_x = control_map[scene_data.device_type]['group_coords'][group][0]
+    coords = control_map[scene_data.device_type]['ctrl_coords'][control]
+    width = photo_img_device.width()
+    height = photo_img_device.height()
+    return ((group_offset_x + coords[0]) * width, coords[1] * height, (group_offset_x + coords[2]) * width, coords[3] * height)
+
+
+# Handle CC or note message in monitor mode
+# Value is stored per control and drawn at most once per frame by draw_monitor
+#   msg: Parsed MIDI message
+def on_monitor_message(msg):
+    global monitor_index, monitor_index_data, monitor_scheduled
+    if not monitor_enabled.get():
+        return
+    if monitor_index_data != scene_data.data:
+        # Scene has changed so rebuild reverse index of MIDI message to control
+        monitor_index = scene_data.get_control_index()
+        monitor_index_data = bytes(scene_data.data)
+    if msg['type'] == 'cc':
+        controls = monitor_index.get((msg['chan'], 1, msg['cc']))
+    else:
+        controls = monitor_index.get((msg['chan'], 2, msg['note']))
+    if not controls:
+        return
+    for group, group_offset, control in controls:
+        monitor_pending[(group, control)] = msg['value']
+    if not monitor_scheduled:
+        monitor_scheduled = True
+        root.after(MONITOR_FRAME_MS, draw_monitor)
+
+
+# Draw controls changed since last frame in monitor mode
+# Canvas items are created once per control then moved / shown / hidden
+def draw_monitor():
+    global monitor_scheduled
+    monitor_scheduled = False
+    for (group, control), value in monitor_pending.items():
+        x0, y0, x1, y1 = get_control_rect(group, control)
+        if control in ('slider', 'knob'):
+            y0 = y1 - (y1 - y0) * value / 127
+        item = monitor_items.get((group, control))
+        if item is None:
+            item = canvas.create_rectangle(x0, y0, x1, y1, fill='#80cde0', stipple='gray50', outline='', tags='monitor')
+            monitor_items[(group, control)] = item
+        else:
+            canvas.coords(item, x0, y0, x1, y1)
+        canvas.itemconfig(item, state=tk.NORMAL if value else tk.HIDDEN)
+    monitor_pending.clear()
+
+
+# Remove monitor display, e.g. after resize or device change
+def clear_monitor():
+    canvas.delete('monitor')
+    monitor_items.clear()
+    monitor_pending.clear()
+
+
+# Set state of a nanoKONTROL2 LED
+# LEDs are only driven when device is in External LED mode. Changes are coalesced and sent by flush_leds.
+#   control: Control name ['solo', 'mute', 'prime', 'play', 'stop', 'rew', 'ff', 'rec', 'cycle']
+#   group: Group index [0..7] for solo / mute / prime, None for transport LEDs
+#   on: True to light LED
+def set_led(control, group=None, on=True):
+    if led_state.set(control, group, on):
+        schedule_led_flush()
+
+
+# Schedule sending of changed LED states
+def schedule_led_flush():
+    global led_flush_scheduled
+    if not led_flush_scheduled:
+        led_flush_scheduled = True
+        root.after_idle(flush_leds)
+
+
+# Send LED messages for LEDs changed since last flush as a single batch
+# LEDs are only sent when the scene on the device (not the edited scene) has LED mode External
+def flush_leds():
+    global led_flush_scheduled
+    led_flush_scheduled = False
+    if scene_data.device_type != 'nanoKONTROL2' or main_session.get_device_led_mode() != 1:
+        led_state.invalidate() # Device is driving its own LEDs so resend all when External mode is restored
+        return
+    msgs = led_state.flush()
+    if msgs:
+        send_midi_batch(msgs)
+
+
+# Handle MIDI data received from a host on the LED input port (--led-thru)
+# Messages from the device input are never mirrored so button presses are not echoed back as LEDs
+#   indata: Raw MIDI data bytes
+def handle_led_input(indata):
+    if led_state.handle_midi(indata):
+        schedule_led_flush()
+
+
 # Update current scene
 #   scene: Index of scene. None for to update display with current scene (default)
 def set_current_scene(scene=None):
@@ -992,20 +1383,31 @@ def set_current_scene(scene=None):
             current_scene = 0
         else:
             current_scene = scene
+        main_session.current_scene = current_scene
     canvas.coords(img_id_scene_led, (0.09 + 0.025 * current_scene) * photo_img_device.width(), 0.82 * photo_img_device.height())
 
 
+# Get the image of a device, only opening and decoding it when first used
+#   type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+#   returns: PIL image
+def get_device_image(type):
+    if type not in device_images:
+        device_images[type] = Image.open('{}.png'.format(type))
+    return device_images[type]
+
+
 # Set the device type
 #   type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
 def set_device_type(type):
-    global img_device
     global photo_img_device
     scene_data.set_device_type(type)
     width = photo_img_device.width()
     height = photo_img_device.height()
-    img_device = Image.open('{}.png'.format(scene_data.device_type))
+    img_device = get_device_image(scene_data.device_type)
     photo_img_device = ImageTk.PhotoImage(img_device.resize((width, height), Image.LANCZOS))
     canvas.itemconfig(img_id_device, image=photo_img_device)
+    clear_monitor()
+    clear_conflicts()
     if scene_data.device_type == 'nanoKONTROL1':
         set_current_scene()
         canvas.itemconfig(img_id_scene_led, state=tk.NORMAL)
@@ -1020,6 +1422,9 @@ def set_device_type(type):
 #   msg: Text message to show in status bar
 #   status: Influences display [0: Info (default), 1: Success, 2: Error]
 def set_statusbar(msg, status=None):
+    global midi_trace_last, midi_trace_count
+    midi_trace_last = None # Status message supersedes pending MIDI trace
+    midi_trace_count = 0
     if status == 1:
         bg = '#aacf55'
     elif status == 2:
@@ -1029,194 +1434,413 @@ def set_statusbar(msg, status=None):
     lbl_statusbar.config(text=datetime.now().strftime('%H:%M:%S: ' + msg), background=bg)
 
 
+# Format a MIDI message for display
+#   data: Raw MIDI data bytes
+#   returns: String showing message length and hex bytes
+def format_midi(data):
+    return '[{}] {}'.format(len(data), bytes(data).hex(' ').upper())
+
+
+# Record received MIDI message for display in status bar
+# Status bar shows only the latest message, updated at most every MIDI_TRACE_INTERVAL_MS
+#   data: Raw MIDI data bytes
+def trace_midi_input(data):
+    global midi_trace_last, midi_trace_count, midi_trace_scheduled
+    if args.trace_midi:
+        logging.debug('MIDI in %s', format_midi(data))
+    midi_trace_last = data
+    midi_trace_count += 1
+    if not midi_trace_scheduled:
+        midi_trace_scheduled = True
+        root.after(MIDI_TRACE_INTERVAL_MS, show_midi_trace)
+
+
+# Show latest received MIDI message in status bar
+def show_midi_trace():
+    global midi_trace_scheduled
+    midi_trace_scheduled = False
+    if midi_trace_last is None:
+        return
+    msg = format_midi(midi_trace_last)
+    if midi_trace_count > 1:
+        msg += ' ({} messages since last update)'.format(midi_trace_count)
+    set_statusbar(msg)
+
+
+# Handle device search reply
+# Session state has been updated by main_session so only the display is updated here
+#   msg: Parsed MIDI message
+def on_search_reply(msg):
+    if msg['device_type']:
+        set_device_type(msg['device_type'])
+    on_inquiry_reply(msg)
+    device_info.set('Device version: {}.{}'.format(msg['major'], msg['minor']))
+
+
+# Handle device inquiry reply
+# Device LEDs listen on the global MIDI channel reported by the device
+#   msg: Parsed MIDI message
+def on_inquiry_reply(msg):
+    led_state.set_channel(main_session.global_midi_chan)
+    schedule_led_flush()
+
+
+# Handle scene data dump
+#   msg: Parsed MIDI message
+def on_dump(msg):
+    set_device_type(msg['device_type'])
+    led_state.invalidate()
+    schedule_led_flush()
+
+
+# Handle scene change (nanoKONTROL1)
+#   msg: Parsed MIDI message
+def on_scene_change(msg):
+    set_current_scene(msg['scene'])
+    if msg['loaded']:
+        populate_editor()
+        set_statusbar('Scene change {} - loaded from cache'.format(current_scene + 1), 1)
+    else:
+        set_statusbar('Scene change {}'.format(current_scene + 1), 1)
+
+
+# Handlers of parsed MIDI messages indexed by message type
+midi_handlers = {
+    'search_reply': on_search_reply,
+    'inquiry_reply': on_inquiry_reply,
+    'dump': on_dump,
+    'scene_change': on_scene_change,
+    'cc': on_monitor_message,
+    'note_on': on_monitor_message,
+    'note_off': on_monitor_message
+}
+
+# Status bar messages shown for device replies indexed by message type: (message, status)
+reply_status = {
+    'load_ack': ('Load data succeded', 1),
+    'load_nak': ('Load data failed', 2),
+    'write_ack': ('Scene saved to device', 1),
+    'write_nak': ('Scene failed to save to device', 2),
+    'native_out': ("Native mode 'out' set on device", 1),
+    'native_in': ("Native mode out set 'in' device", 1),
+    'normal_mode': ('Normal mode set on device', 1),
+    'native_mode': ('Native mode set on device', 1)
+}
+
 # Handle MIDI data received from JACK or ALSA
-#   indata: List of raw MIDI data bytes
-def handle_midi_input(indata):
-    
-    data = struct.unpack('{}B'.format(len(indata)), indata)
-    str = '[{}] '.format(len(data))
-    for i in data:
-        str += '{:02X} '.format(i)
-    set_statusbar(str)
-
-    if len(data) == 14 and data[:2] == (0xF0, 0x7E) and data[3:5] == (0x06, 0x02, 0x42):
-        # Device inquiry reply
-        scene_data.global_midi_chan = data[2]
-        major = data[12] + (data[13 << 7])
-        minor = data[10] + (data[11] << 7)
-    elif data[:4] == (0xF0, 0x42, 0x50, 0x01) and data[5] == echo_id:
-        # Search device reply
-        scene_data.global_midi_chan = data[4]
-        family_id = data[6] + (data[7] << 7)
-        member_id = data[8] + (data[9] << 7)
-        minor = data[10]  + (data[11] << 7)
-        major = data[12] + (data[13] << 7)
-        if family_id == 132:
-            set_device_type('nanoKONTROL1')
-        elif family_id == 147:
-            set_device_type('nanoKONTROL2')
-        device_info.set('Device version: {}.{}'.format(major,minor))
-    elif len(data) == 3:
-        cmd = data[0] & 0xF0
-        if cmd == 0x80 or cmd == 0x90 and data[2] == 0:
-            # Note off
-            pass
-        elif cmd == 0x90:
-            # Note on
-            pass
-        elif cmd == 0xB0:
-            # CC
-            pass
-        elif cmd == 0xE0:
-            # Pitch bend
-            pass
-    elif len(data) > 10 and data[:7] == (0xF0, 0x42, 0x40 | scene_data.global_midi_chan) + scene_data.get_sysex_id():
-        # Command list
-        if data[7:13] == (0x7F, 0x7F, 0x02, 0x03, 0x05, 0x40):
-            # nanoKONTROL2 data dump
-            scene_data.set_data(data[13:-1])
-            scene_backup.data = scene_data.data.copy()
-            set_device_type('nanoKONTROL2')
-        elif data[7:13] == (0x7F, 0x7F, 0x02, 0x02, 0x26, 0x40):
-            # nanoKONTROL1 data dump
-            scene_data.set_data(data[13:-1])
-            scene_backup.data = scene_data.data.copy()
-            set_device_type('nanoKONTROL1')
-        elif data[7:10] == (0x5F, 0x23, 0x00):
-            # Load data ACK
-            set_statusbar('Load data succeded', 1)
-        elif data[7:10] == (0x5F, 0x24, 0x00):
-            # Load data NAK
-            set_statusbar('Load data failed', 2)
-        elif data[7:10] == (0x5F, 0x21, 0x00):
-            # Write completed
-            set_statusbar('Scene saved to device', 1)
-        elif data[7:10] == (0x5F, 0x22, 0x00):
-            # Write error
-            set_statusbar('Scene failed to save to device', 2)
-        elif data[7:10] == (0x40, 0x00, 0x02):
-            # Native mode out
-            set_statusbar("Native mode 'out' set on device", 1)
-        elif data[7:10] == (0x40, 0x00, 0x03):
-            # Native mode in
-            set_statusbar("Native mode out set 'in' device", 1)
-        elif data[7:10] == (0x5F, 0x42, 0x00):
-            # Normal mode
-            set_statusbar('Normal mode set on device', 1)
-        elif data[7:10] == (0x5F, 0x42, 0x01):
-            # Native mode
-            set_statusbar('Native mode set on device', 1)
-        elif data[7:9] == (0x5F, 0x4F):
-            # Scene change
-            try:
-                set_current_scene(data[9])
-                set_statusbar('Scene change {}'.format(current_scene + 1), 1)
-            except Exception as e:
-                logging.warning('Scene change error %s', e)
+#   indata: Raw MIDI data bytes
+#   source: Name of port data was received from or None if unknown
+def handle_midi_input(indata, source=None):
+    if discovery and (discovery.handle_midi(indata, source) or discovery.owns_input(source)):
+        return # Search reply or other traffic from a port only subscribed for discovery
+    trace_midi_input(indata)
+    if source is not None and sessions.handle_midi(indata, source):
+        return # Message from a device in another session
+    msg = main_session.handle_midi(indata)
+    if msg is None:
+        return
+    type = msg['type']
+    handler = midi_handlers.get(type)
+    if handler:
+        handler(msg)
+    elif type in reply_status:
+        set_statusbar(*reply_status[type])
 
 
 ## JACK Functions ##
 
 # Process jack frames
+# Runs in JACK real-time thread so only copies data between ring buffers and JACK ports
 def jack_process(frames):
-    global ev
-
+    start = perf_counter()
     jack_midi_out.clear_buffer()
-    if ev:
-        jack_midi_out.write_midi_event(0, ev)
-        ev = None
-    
-    # Process incoming messages
+    # Send as many queued messages as fit in this period's buffer
+    written = 0
+    while True:
+        msg = jack_tx_queue.peek()
+        if msg is None:
+            break
+        buffer = jack_midi_out.reserve_midi_event(0, len(msg))
+        if not buffer:
+            if written:
+                break # Port buffer full - send remaining messages next period
+            jack_tx_queue.discard() # Too large to ever fit in port buffer
+            continue
+        buffer[:] = msg
+        jack_tx_queue.pop()
+        written += 1
+
+    # Queue incoming messages for handling by UI thread
     for offset, indata in jack_midi_in.incoming_midi_events():
-        handle_midi_input(indata)
-        
+        jack_rx_queue.put(indata)
+    if jack_led_in:
+        for offset, indata in jack_led_in.incoming_midi_events():
+            jack_led_queue.put(indata)
+
+    duration = perf_counter() - start
+    jack_stats['callbacks'] += 1
+    jack_stats['process_time_last'] = duration
+    if duration > jack_stats['process_time_max']:
+        jack_stats['process_time_max'] = duration
+
+
+# Handle JACK xrun
+#   delayed_usecs: Delay in microseconds
+def jack_xrun(delayed_usecs):
+    jack_stats['xruns'] += 1
+
 
-# Refresh jack MIDI ports
+# Get JACK performance counters
+#   returns: Dictionary of counters including process callback budget (period duration) in seconds
+def get_jack_stats():
+    stats = dict(jack_stats)
+    try:
+        stats['budget'] = jack_client.blocksize / jack_client.samplerate
+    except:
+        stats['budget'] = 0.0
+    stats['rx'] = jack_rx_queue.get_stats()
+    stats['tx'] = jack_tx_queue.get_stats()
+    return stats
+
+
+# Handle MIDI messages queued by JACK process callback
+# Runs in UI thread, rescheduling itself with Tk after()
+def drain_jack_midi_input():
+    for i in range(MIDI_RX_BATCH):
+        msg = jack_rx_queue.peek()
+        if msg is None:
+            break
+        data = bytes(msg)
+        jack_rx_queue.pop()
+        try:
+            handle_midi_input(data)
+        except Exception as e:
+            logging.warning('Failed to handle MIDI input: %s', e)
+    while True:
+        msg = jack_led_queue.peek()
+        if msg is None:
+            break
+        handle_led_input(bytes(msg))
+        jack_led_queue.pop()
+    check_jack_port_events()
+    if len(jack_rx_queue):
+        root.after_idle(drain_jack_midi_input)
+    else:
+        root.after(MIDI_RX_POLL_MS, drain_jack_midi_input)
+
+
+# Populate global lists of source and destination ports with all JACK MIDI ports
+# Only required at startup - changes are then applied by apply_jack_port_events
 def refresh_jack_ports():
-    global source_ports, destination_ports
-
-    ports = jack_client.get_ports(is_midi=True, is_input=True)
-    temp_ports = {}
-    for port in destination_ports:
-        if destination_ports[port][0] == 'alsa':
-            temp_ports[port] = destination_ports[port]
-    destination_ports = temp_ports
-    for port in ports:
+    for ports in (source_ports, destination_ports):
+        for name in [name for name in ports if ports[name][0] == 'jack']:
+            del ports[name]
+    for port in jack_client.get_ports(is_midi=True, is_input=True):
         destination_ports[port.name] = ['jack', port]
-
-    ports = jack_client.get_ports(is_midi=True, is_output=True)
-    temp_ports = {}
-    for port in source_ports:
-        if source_ports[port][0] == 'alsa':
-            temp_ports[port] = source_ports[port]
-    source_ports = temp_ports
-    for port in ports:
+    for port in jack_client.get_ports(is_midi=True, is_output=True):
         source_ports[port.name] = ['jack', port]
+    schedule_update_ports()
+
+
+# Handle JACK port registration or unregistration
+# Runs in JACK notification thread so only queues the change for the UI thread
+#   port: JACK port or None if port is no longer available
+#   register: True if port registered, False if unregistered
+def jack_port_registration(port, register):
+    jack_port_events.append((port.name if port else None, register))
 
-    update_ports()
+
+# Handle JACK port rename
+# Runs in JACK notification thread so only queues the change for the UI thread
+#   port: JACK port or None if port is no longer available
+#   old: Previous port name
+#   new: New port name
+def jack_port_rename(port, old, new):
+    jack_port_events.append((old, False))
+    jack_port_events.append((new, True))
+
+
+# Check for JACK port changes and schedule update of port lists once changes settle
+# Each change restarts the settle timer so a burst of changes results in a single update
+# Runs in UI thread, called from drain_jack_midi_input
+def check_jack_port_events():
+    global jack_ports_scheduled, jack_port_events_seen
+    if len(jack_port_events) == jack_port_events_seen:
+        return
+    jack_port_events_seen = len(jack_port_events)
+    if jack_ports_scheduled:
+        root.after_cancel(jack_ports_scheduled)
+    jack_ports_scheduled = root.after(JACK_PORT_SETTLE_MS, apply_jack_port_events)
+
+
+# Remove JACK ports that no longer exist from global lists of source and destination ports
+# Used when JACK reports an unregistration after the port (and its name) has gone - each listed JACK port is looked up by name
+def remove_stale_jack_ports():
+    for ports in (source_ports, destination_ports):
+        for name in [name for name in ports if ports[name][0] == 'jack']:
+            try:
+                jack_client.get_port_by_name(name)
+            except jack.JackError:
+                del ports[name]
+
+
+# Apply queued JACK port changes to global lists of source and destination ports
+def apply_jack_port_events():
+    global jack_ports_scheduled, jack_port_events_seen
+    jack_ports_scheduled = None
+    jack_port_events_seen = 0
+    stale = False
+    while jack_port_events:
+        name, registered = jack_port_events.popleft()
+        if name is None:
+            stale = stale or not registered
+            continue
+        if registered:
+            try:
+                port = jack_client.get_port_by_name(name)
+            except jack.JackError:
+                continue # Port has already gone
+            if port.is_midi:
+                (source_ports if port.is_output else destination_ports)[name] = ['jack', port]
+        else:
+            for ports in (source_ports, destination_ports):
+                if name in ports and ports[name][0] == 'jack':
+                    del ports[name]
+    if stale:
+        remove_stale_jack_ports()
+    schedule_update_ports()
 
 
 ## ALSA Functions ##
 
-# Thread worker listening for ALSA MIDI events
-def alsa_midi_in_thread():
+# Handle all pending ALSA sequencer events in one batch
+# MIDI events are handled by handle_midi_input and system announce events update the port lists
+# Runs in UI thread, called by Tk when the sequencer file descriptor is readable
+#   fd: File descriptor (unused)
+#   mask: Tk file event mask (unused)
+def alsa_midi_input(fd=None, mask=None):
     while True:
-        event = alsa_client.event_input(prefer_bytes=True)
         try:
-            handle_midi_input(event.midi_bytes)
-        except:
-            #print(repr(event))
-            pass
+            if not alsa_client.event_input_pending(fetch_sequencer=True):
+                break
+            event = alsa_client.event_input(prefer_bytes=True)
+        except alsa_midi.ALSAError:
+            break # No more events available (EAGAIN)
+        try:
+            if isinstance(event, alsa_midi.MidiBytesEvent):
+                if alsa_led_in and event.dest is not None and event.dest.port_id == alsa_led_in.port_id:
+                    handle_led_input(event.midi_bytes)
+                else:
+                    handle_midi_input(event.midi_bytes, alsa_port_names.get(event.source))
+            elif event.type in alsa_announce_handlers:
+                alsa_announce_handlers[event.type](event.addr)
+        except Exception as e:
+            logging.warning('Failed to handle MIDI input: %s', e)
+
 
+# Poll for ALSA sequencer events where Tk cannot watch file descriptors (e.g. Windows)
+def poll_alsa_midi_input():
+    alsa_midi_input()
+    root.after(MIDI_RX_POLL_MS, poll_alsa_midi_input)
 
+
+# Select nanoKONTROL ports if not already selected and make any connections that differ from selection
+#   force: True to select nanoKONTROL ports even if ports are already selected
 def auto_connect(force=False):
-    if not force and midi_dest_port.get() and midi_source_port.get():
-        return
-    for name in source_ports:
-        if "nanoKONTROL" in name:
-            midi_source_port.set(name)
-            break
-    for name in destination_ports:
-        if "nanoKONTROL" in name:
-            midi_dest_port.set(name)
-            break
-    source_changed()
-    destination_changed()
+    if force or not (midi_dest_port.get() and midi_source_port.get()):
+        for name in source_ports:
+            if "nanoKONTROL" in name:
+                midi_source_port.set(name)
+                break
+        for name in destination_ports:
+            if "nanoKONTROL" in name:
+                midi_dest_port.set(name)
+                break
+    if midi_source_port.get() in source_ports:
+        connections.set_desired('in', midi_source_port.get())
+    if midi_dest_port.get() in destination_ports:
+        connections.set_desired('out', midi_dest_port.get())
+    apply_connections()
 
 
 ##################################### 
 ## Core sequential functional code ##
 ##################################### 
 
-scene_data = scene()
-scene_backup = scene()
+parser = argparse.ArgumentParser(description='riban nanoKONTROL editor')
+parser.add_argument('--backend', choices=['all', 'jack', 'alsa'], default='all', help='MIDI interface to use (default: all)')
+parser.add_argument('--profile-startup', action='store_true', help='Report time spent in each startup phase')
+parser.add_argument('--trace-midi', action='store_true', help='Log every received MIDI message (debug)')
+parser.add_argument('--library', default='~/nanoKONTROL-scenes.nksl', help='Scene library file (default: ~/nanoKONTROL-scenes.nksl)')
+parser.add_argument('--led-thru', action='store_true', help="Mirror LED CC messages received on the 'leds' input port to nanoKONTROL2 LEDs (External LED mode)")
+args = parser.parse_args()
+if args.trace_midi:
+    logging.basicConfig(level=logging.DEBUG)
+mark_startup_phase('imports')
+
+main_session = DeviceSession(send_midi, echo_id=echo_id) # Session of device selected in MIDI port drop-down lists
+scene_data = main_session.scene
+scene_backup = main_session.backup
+sessions = SessionRouter() # Sessions of other devices, routed by input port (ALSA only)
+session_status = {} # Status text of each session indexed by input port
+sessions_tree = None # Treeview of sessions dialog or None if dialog is not shown
+library = None # Scene library, opened when first used
+library_tree = None # Treeview of library dialog or None if dialog is not shown
+library_index = None # Index of library scenes by MIDI message sent, built when first searched
 
 ## Initialise MIDI interfaces ##
+# Backend modules are only imported when selected
 jack_client = None
-try:
-    jack_client = jack.Client('riban-nanoKonfig', no_start_server=True)
-    jack_midi_in = jack_client.midi_inports.register('in')
-    jack_midi_out = jack_client.midi_outports.register('out')
-except:
-    pass
+jack_led_in = None # JACK port receiving host LED messages (--led-thru)
+if args.backend in ('all', 'jack'):
+    try:
+        import jack
+        jack_client = jack.Client('riban-nanoKonfig', no_start_server=True)
+        jack_midi_in = jack_client.midi_inports.register('in')
+        jack_midi_out = jack_client.midi_outports.register('out')
+        if args.led_thru:
+            jack_led_in = jack_client.midi_inports.register('leds')
+    except:
+        pass
 
 alsa_client = None
-try:
-    alsa_client = alsa_midi.SequencerClient('riban-nanoKonfig')
-    alsa_midi_in = alsa_client.create_port('in', caps=alsa_midi.WRITE_PORT)
-    alsa_midi_out = alsa_client.create_port('out', caps=alsa_midi.READ_PORT)
-except:
-    pass
+alsa_led_in = None # ALSA port receiving host LED messages (--led-thru)
+alsa_announce_handlers = {} # Handlers of ALSA system announce events indexed by event type (empty if not subscribed to announcements)
+if args.backend in ('all', 'alsa'):
+    try:
+        import alsa_midi
+        alsa_client = alsa_midi.SequencerClient('riban-nanoKonfig')
+        alsa_midi_in = alsa_client.create_port('in', caps=alsa_midi.WRITE_PORT)
+        alsa_midi_out = alsa_client.create_port('out', caps=alsa_midi.READ_PORT)
+        if args.led_thru:
+            alsa_led_in = alsa_client.create_port('leds', caps=alsa_midi.WRITE_PORT)
+        try:
+            alsa_midi_in.connect_from(alsa_midi.SYSTEM_ANNOUNCE) # Port start / exit / change events arrive with MIDI input
+            alsa_announce_handlers.update({
+                alsa_midi.EventType.PORT_START: on_alsa_port_start,
+                alsa_midi.EventType.PORT_CHANGE: on_alsa_port_start,
+                alsa_midi.EventType.PORT_EXIT: on_alsa_port_exit,
+                alsa_midi.EventType.CLIENT_CHANGE: on_alsa_client_change,
+                alsa_midi.EventType.CLIENT_EXIT: on_alsa_client_exit
+            })
+        except Exception as e:
+            logging.warning('Failed to subscribe to ALSA port announcements - port lists are rescanned when opened: %s', e)
+    except:
+        pass
 
 if alsa_client == jack_client == None:
     logging.error('Failed to create ALSA or JACK client')
     exit(-1)
+mark_startup_phase('client creation')
 
 
 # Create UI
 current_scene = 0
-source_ports = {} # Dictionary of available MIDI source ports: display_name:[type,port] where type is jack or alsa
-destination_ports = {} # Dictionary of available MIDI destination ports: display_name:[type,port] where type is jack or alsa
+source_ports = SortedPortDict() # Dictionary of available MIDI source ports: display_name:[type,port] where type is jack or alsa
+destination_ports = SortedPortDict() # Dictionary of available MIDI destination ports: display_name:[type,port] where type is jack or alsa
+connections = ConnectionManager(connect_port, disconnect_port) # Desired and actual connections to device ports
+alsa_port_names = {} # Display names of ALSA ports indexed by (client_id, port_id)
+ports_update_scheduled = False # True if update of MIDI port drop-down lists is scheduled
 
 # Root window
 root = tk.Tk()
@@ -1243,16 +1867,12 @@ ttk.Label(frame_top, text='MIDI input').grid(row=0, column=0, sticky='w')
 cmb_midi_input = ttk.Combobox(frame_top, textvariable=midi_source_port, state='readonly')
 cmb_midi_input.bind('<<ComboboxSelected>>', source_changed)
 cmb_midi_input.grid(row=1, column=0, sticky='n')
-if alsa_client:
-    cmb_midi_input.bind('<Enter>', populate_alsa_source)
 
 midi_dest_port = tk.StringVar()
 ttk.Label(frame_top, text='MIDI output').grid(row=0, column=1, sticky='w')
 cmb_midi_output = ttk.Combobox(frame_top, textvariable=midi_dest_port, state='readonly')
 cmb_midi_output.bind('<<ComboboxSelected>>', destination_changed)
 cmb_midi_output.grid(row=1, column=1, sticky='n')
-if alsa_client:
-    cmb_midi_output.bind('<Enter>', populate_alsa_dest)
 
 btn_download = ttk.Button(frame_top, image=img_transfer_down, command=send_dump_request)
 btn_download.grid(row=0, column=2, rowspan=2)
@@ -1267,6 +1887,22 @@ btn_info.grid(row=0, column=6, rowspan=2)
 device_info = tk.StringVar()
 lbl_device_info = tk.Label(frame_top, textvariable=device_info)
 lbl_device_info.grid(row=0, column=7, sticky='ne')
+monitor_enabled = tk.IntVar()
+chk_monitor = ttk.Checkbutton(frame_top, text='Monitor', variable=monitor_enabled, command=clear_monitor)
+chk_monitor.grid(row=1, column=7, sticky='se')
+btn_discover = ttk.Button(frame_top, text='Discover', command=discover_devices)
+btn_discover.grid(row=0, column=8, rowspan=2)
+btn_sessions = ttk.Button(frame_top, text='Sessions', command=show_sessions)
+btn_sessions.grid(row=0, column=9, rowspan=2)
+btn_fetch_scenes = ttk.Button(frame_top, text='All scenes', command=fetch_all_scenes)
+btn_fetch_scenes.grid(row=0, column=10, rowspan=2)
+btn_library = ttk.Button(frame_top, text='Library', command=show_library)
+btn_library.grid(row=0, column=11, rowspan=2)
+btn_bulk_edit = ttk.Button(frame_top, text='Bulk edit', command=show_bulk_edit)
+btn_bulk_edit.grid(row=0, column=12, rowspan=2)
+if not alsa_client:
+    btn_discover.state(['disabled'])
+    btn_sessions.state(['disabled'])
 
 # Control editor frame
 editor_midi_channel = tk.IntVar()
@@ -1415,25 +2051,31 @@ lbl_statusbar.grid(row=3, column=0, columnspan=2, sticky='ew')
 # Start jack client
 if jack_client:
     jack_client.set_process_callback(jack_process)
-    jack_client.set_graph_order_callback(refresh_jack_ports)
+    jack_client.set_xrun_callback(jack_xrun)
+    jack_client.set_port_registration_callback(jack_port_registration, only_available=False)
+    jack_client.set_port_rename_callback(jack_port_rename, only_available=False)
 
     # Activate jack client and get available MIDI ports
     jack_client.activate()
 
 
-# Start ALSA MIDI listening thread
+# Listen for ALSA MIDI events in Tk main loop
 if alsa_client:
-    alsa_thread = Thread(target=alsa_midi_in_thread, args=())
-    alsa_thread.name = 'alsa_in'
-    alsa_thread.daemon = True
-    alsa_thread.start()
+    try:
+        # alsa_midi does not expose the sequencer poll descriptor publicly (its asyncio client uses _fd too)
+        root.tk.createfilehandler(alsa_client._fd, tk.READABLE, alsa_midi_input)
+    except Exception as e:
+        logging.info('Polling ALSA MIDI input: %s', e)
+        poll_alsa_midi_input()
 
 
+mark_startup_phase('UI construction')
+
 # Device image
 canvas = tk.Canvas(root, width=800, height=250)
 
-img_device = Image.open('{}.png'.format(scene_data.device_type))
-photo_img_device = ImageTk.PhotoImage(img_device)
+device_images = {} # PIL image of each device type, opened when first shown
+photo_img_device = tk.PhotoImage(width=800, height=200) # Blank until set_device_type decodes device image
 img_id_device = canvas.create_image(0, 0, anchor='nw', image=photo_img_device)
 canvas.grid(row=2, column=0, sticky='nsew')
 canvas.bind('<Button-1>', on_canvas_click)
@@ -1450,16 +2092,22 @@ photo_img_scene_led = ImageTk.PhotoImage(img_scene_led)
 img_id_scene_led = canvas.create_image(0, 0, image=photo_img_scene_led)
 
 set_device_type('nanoKONTROL2')
-
-tooltip_obj = ToolTips.ToolTips(
-    [btn_download, btn_upload, btn_save, btn_restore, btn_info],
-    ['Download from nanoKONTROL', 'Upload to nanoKONTROL', 'Save current scene on nanoKONTROL', 'Restore to last download', 'About']
-)
+mark_startup_phase('image decode')
 
 if alsa_client:
-    populate_alsa_source()
-    populate_alsa_dest()
+    populate_alsa_ports()
+    if not alsa_announce_handlers:
+        # Port changes are not announced so rescan when a port list is opened
+        cmb_midi_input.bind('<Enter>', lambda event: populate_alsa_ports())
+        cmb_midi_output.bind('<Enter>', lambda event: populate_alsa_ports())
 if jack_client:
     refresh_jack_ports()
+    drain_jack_midi_input()
+mark_startup_phase('port scan')
+
+poll_transactions()
+root.after_idle(create_tooltips)
+if args.profile_startup:
+    root.after_idle(report_startup_profile)
 
 root.mainloop()
@@ -0,0 +1,14 @@
+# Core library for riban nanoKONTROL editor
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Dependencies: None (no GUI or audio imports)
+#
+# Provides the scene data model, Korg sysex codec and MIDI protocol message
+# builders / parser for use by the GUI, scripts and batch jobs.
+
+from nanokonfig.scene import scene, control_map, device_types
+
+cli_commands = ('dump', 'upload', 'write', 'verify') # Commands of nanokonfig.cli - defined here so callers can detect command line use without importing cli
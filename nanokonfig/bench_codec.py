@@ -0,0 +1,71 @@
+# Korg 7-bit codec microbenchmark
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Compares the table based codec with reference per-byte loop implementations.
+# Kept apart from codec so that it may be run as a module without codec being
+# imported twice (nanokonfig imports codec via scene).
+#
+# Usage: python3 -m nanokonfig.bench_codec
+#
+# Dependencies: None
+
+from nanokonfig.codec import encode_korg_7bit, decode_korg_7bit, encode_many, decode_many, decoded_length
+
+# Reference implementation of encoding using per-byte loops and tuple concatenation
+def _encode_reference(data):
+    sysex = ()
+    for offset in range(0, len(data), 7):
+        block = data[offset:offset+7]
+        b0 = 0
+        for b in range(len(block)):
+            b0 |= ((block[b] & 0x80) >> (7 - b))
+        sysex += (b0,)
+        for word in block:
+            sysex += (word & 0x7F,)
+    return sysex
+
+
+# Reference implementation of decoding using per-block slices
+def _decode_reference(data):
+    result = [0] * decoded_length(len(data))
+    i = 0
+    for offset in range(0, len(data), 8):
+        block = data[offset:offset+8]
+        for word in range(1, len(block)):
+            result[i + word - 1] = block[word] | (((block[0] >> (word - 1)) & 1) << 7)
+        i += 7
+    return result
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    for length in (256, 339):
+        data = [random.randrange(256) for i in range(length)]
+        encoded = encode_korg_7bit(data)
+        assert encoded == bytes(_encode_reference(data))
+        assert decode_korg_7bit(encoded) == bytes(data)
+        assert list(decode_korg_7bit(encoded)) == _decode_reference(list(encoded))
+        data_bytes = bytes(data)
+        encoded_list = list(encoded)
+        count = 2000
+        results = (
+            ('encode loop', timeit.timeit(lambda: _encode_reference(data), number=count)),
+            ('encode table', timeit.timeit(lambda: encode_korg_7bit(data_bytes), number=count)),
+            ('decode loop', timeit.timeit(lambda: _decode_reference(encoded_list), number=count)),
+            ('decode table', timeit.timeit(lambda: decode_korg_7bit(encoded), number=count)),
+        )
+        print('{} bytes:'.format(length))
+        for name, t in results:
+            print('  {:<14}{:8.2f} us'.format(name, t / count * 1e6))
+        print('  encode speedup {:.1f}x, decode speedup {:.1f}x'.format(results[0][1] / results[1][1], results[2][1] / results[3][1]))
+
+        batch = [bytes(random.randrange(256) for i in range(length)) for j in range(1000)]
+        assert decode_many(encode_many(batch)) == batch
+        t_single = timeit.timeit(lambda: [encode_korg_7bit(buf) for buf in batch], number=10) / 10
+        t_batch = timeit.timeit(lambda: encode_many(batch), number=10) / 10
+        print('  1000 scenes: encode each {:.2f} ms, encode_many {:.2f} ms'.format(t_single * 1e3, t_batch * 1e3))
@@ -0,0 +1,71 @@
+# Bulk edit - apply an assignment pattern across controls and groups
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# A pattern assigns consecutive CC or note numbers to controls x groups, e.g.
+# sliders 1-8 to CC 20-27 on channel 2, optionally setting range, behaviour
+# and group channel. The pattern is compiled to a list of parameter changes
+# that is validated as a whole then written to scene data in one pass.
+#
+# Dependencies: None
+
+from nanokonfig.scene import control_map, get_param_offsets, get_controls, get_control_params
+
+# Get the parameter changes of an assignment pattern
+# Numbers increase by step for each group then each control, e.g. controls ['slider', 'knob'], groups [0, 1], start 20 gives slider 1: 20, slider 2: 21, knob 1: 22, knob 2: 23
+#   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+#   controls: List of control names, e.g. ['slider']
+#   groups: List of group indices or None for transport controls
+#   start: First CC or note number
+#   step: Increment between controls (default: 1)
+#   assign: Message type [1: CC, 2: Note] or None to leave unchanged (default: 1)
+#   chan: Group MIDI channel [0..15, 16: Global] or None to leave unchanged
+#   min: Minimum / off value or None to leave unchanged
+#   max: Maximum / on value or None to leave unchanged
+#   behaviour: Button behaviour [0: Momentary, 1: Toggle] or None to leave unchanged
+#   returns: Tuple (list of (group_offset, control, param, value), list of (group_offset, chan))
+#   raises: ValueError if a control does not exist or a value is out of range
+def get_pattern_params(device_type, controls, groups, start, step=1, assign=1, chan=None, min=None, max=None, behaviour=None):
+    map = control_map[device_type]
+    table = get_param_offsets(device_type)
+    valid = set((group, control) for group, group_offset, control in get_controls(device_type))
+    params = []
+    channels = []
+    cmd = start
+    for control in controls:
+        for group in groups:
+            if (group, control) not in valid:
+                raise ValueError('{} {} is not a {} control'.format(control, group, device_type))
+            group_offset = map['transport'] if group is None else map['groups'][group]
+            available = get_control_params(device_type, control, group is None)
+            values = [('cmd', cmd), ('assign', assign), ('min', min), ('max', max)]
+            if control not in ('slider', 'knob'):
+                values.append(('transport_behaviour' if 'transport_behaviour' in available else 'behaviour', behaviour))
+            for param, value in values:
+                if value is None or param not in available or (group_offset, control, param) not in table:
+                    continue
+                if value < 0 or value > table[(group_offset, control, param)][1]:
+                    raise ValueError('{} {} out of range for {}'.format(param, value, control))
+                params.append((group_offset, control, param, value))
+            if chan is not None and (group_offset, chan) not in channels:
+                if chan < 0 or chan > 16:
+                    raise ValueError('MIDI channel {} out of range'.format(chan))
+                channels.append((group_offset, chan))
+            cmd += step
+    return params, channels
+
+
+# Apply an assignment pattern to a scene
+# Pattern is validated before any change so scene is unchanged on error
+#   scene: Scene object
+#   Other parameters as get_pattern_params
+#   returns: Quantity of controls assigned
+#   raises: ValueError if a control does not exist or a value is out of range
+def apply_pattern(scene, controls, groups, start, step=1, assign=1, chan=None, min=None, max=None, behaviour=None):
+    params, channels = get_pattern_params(scene.device_type, controls, groups, start, step, assign, chan, min, max, behaviour)
+    for group_offset, group_chan in channels:
+        scene.set_group_channel(group_offset, group_chan)
+    scene.set_many(params)
+    return len(controls) * len(groups)
@@ -0,0 +1,242 @@
+# Command line provisioning of nanoKONTROL devices without GUI
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Runs dump, upload, write or verify on many devices concurrently. Each device
+# has its own DeviceSession and all sessions share one ALSA sequencer client,
+# with received messages routed to sessions by source port. The exit status is
+# 0 if every device succeeded, 1 if any device failed (NAK, timeout or verify
+# mismatch) and 2 for usage errors.
+#
+# A nanoKONTROL1 does not report its current scene so write requires
+# --scene-index to select which of its four scenes is overwritten.
+#
+# Usage: python3 nanoKONTROL.py dump|upload|write|verify [--port NAME ...] --scene FILE [--scene-index N]
+#
+# Dependencies: alsa_midi (imported when run)
+
+import argparse
+import os
+import re
+from time import perf_counter
+from nanokonfig.scene import scene, device_types
+from nanokonfig.session import DeviceSession, SessionRouter
+from nanokonfig import cli_commands
+from nanokonfig.transaction import TransactionError
+
+commands = cli_commands
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+POLL_INTERVAL = 0.02 # Maximum time to wait for MIDI input before checking transaction timeouts
+
+# Progress of a command on one device
+class DeviceJob:
+    #   session: DeviceSession of device
+    #   command: Command to run ['dump', 'upload', 'write', 'verify']
+    #   path: Scene file path
+    #   scene_index: Index of scene to write [0..3] (nanoKONTROL1 only) or None if not selected
+    def __init__(self, session, command, path, scene_index=None):
+        self.session = session
+        self.command = command
+        self.path = path
+        self.scene_index = scene_index
+        self.start = perf_counter()
+        self.duration = None # Seconds taken or None if not finished
+        self.ok = False
+        self.result = 'Pending'
+
+
+    # Run command on device
+    def run(self):
+        self._then(self.session.search(), self._on_search)
+
+
+    # Add handler to run when a request succeeds, finishing job if it fails
+    #   future: Request future
+    #   handler: Function(reply) to call on success
+    def _then(self, future, handler):
+        def done(future):
+            try:
+                reply = future.result()
+            except TimeoutError:
+                self.finish(False, 'No reply from device')
+                return
+            except TransactionError as e:
+                self.finish(False, str(e))
+                return
+            except Exception as e:
+                self.finish(False, 'Failed: {}'.format(e))
+                return
+            try:
+                handler(reply)
+            except Exception as e:
+                self.finish(False, 'Failed: {}'.format(e))
+        future.add_done_callback(done)
+
+
+    # Record end of job
+    #   ok: True on success
+    #   result: Description of result
+    def finish(self, ok, result):
+        if self.duration is not None:
+            return
+        self.duration = perf_counter() - self.start
+        self.ok = ok
+        self.result = result
+
+
+    # Load scene file
+    #   device_type: Device type detected by search
+    #   returns: Scene object
+    def _load_scene(self, device_type):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        return scene(device_type, data)
+
+
+    # Results are taken from replies rather than session state so they do not depend on the order session and job handle a reply
+    def _on_search(self, reply):
+        if not reply['device_type']:
+            self.finish(False, 'Unsupported device (family {})'.format(reply['family_id']))
+            return
+        self.session.scene.global_midi_chan = reply['chan']
+        self.session.scene.set_device_type(reply['device_type'])
+        if self.command in ('dump', 'verify'):
+            self._then(self.session.dump(), self._on_dump)
+        elif self.command == 'write' and reply['device_type'] == 'nanoKONTROL1' and self.scene_index is None:
+            self.finish(False, 'Scene to write not selected (use --scene-index)')
+        else:
+            self.session.scene.data = self._load_scene(reply['device_type']).data
+            self._then(self.session.upload(force=True), self._on_upload)
+
+
+    def _on_dump(self, reply):
+        if len(reply['payload']) != device_types[reply['device_type']]['sysex_len']:
+            self.finish(False, 'Received wrong length data dump')
+            return
+        device_scene = scene(reply['device_type'])
+        device_scene.set_data(reply['payload'])
+        if self.command == 'dump':
+            with open(self.path, 'wb') as f:
+                f.write(device_scene.data)
+            self.finish(True, 'Saved {}'.format(self.path))
+            return
+        differences = device_scene.diff(self._load_scene(reply['device_type']))
+        if differences:
+            self.finish(False, '{} parameters differ'.format(len(differences)))
+        else:
+            self.finish(True, 'Matches {}'.format(self.path))
+
+
+    def _on_upload(self, reply):
+        if self.command == 'write':
+            self._then(self.session.write(self.scene_index or 0), lambda reply: self.finish(True, 'Written'))
+        else:
+            self.finish(True, 'Uploaded')
+
+
+# Get ALSA MIDI ports matching name patterns
+#   client: ALSA sequencer client
+#   patterns: List of port name substrings
+#   returns: List of (port name, source port info, destination port info) - source is None if port has no output
+def find_ports(client, patterns):
+    import alsa_midi
+    sources = {}
+    destinations = {}
+    for port in client.list_ports(input=True, type=alsa_midi.PortType.ANY):
+        sources['{}:{}'.format(port.client_name, port.name)] = port
+    for port in client.list_ports(output=True, type=alsa_midi.PortType.ANY):
+        if port.client_id != client.client_id:
+            destinations['{}:{}'.format(port.client_name, port.name)] = port
+    found = []
+    for pattern in patterns:
+        for name in sorted(destinations):
+            if pattern in name and name not in [port[0] for port in found]:
+                found.append((name, sources.get(name), destinations[name]))
+    return found
+
+
+# Get scene file path for a device
+#   path: Scene file path which may include {index} and {port} placeholders
+#   index: Index of device in port list
+#   name: Port name
+#   returns: File path
+def get_scene_path(path, index, name):
+    return path.format(index=index, port=re.sub(r'[^\w.-]+', '_', name))
+
+
+# Run command line provisioning
+#   argv: Command line arguments (excluding program name)
+#   returns: Exit status
+def main(argv):
+    parser = argparse.ArgumentParser(prog='nanoKONTROL.py', description='riban nanoKONTROL command line provisioning')
+    parser.add_argument('command', choices=commands, help='dump: save device scene to file, upload: send scene file to device, write: upload and save on device, verify: compare device scene with file')
+    parser.add_argument('--port', action='append', help='ALSA MIDI port name or part of name - may be repeated (default: all nanoKONTROL ports)')
+    parser.add_argument('--scene', required=True, help='Scene file of raw scene data. May include {index} or {port} to use a file per device')
+    parser.add_argument('--scene-index', type=int, choices=range(1, 5), metavar='{1..4}', help='Scene to save on nanoKONTROL1 devices by write (required to write to a nanoKONTROL1)')
+    parser.add_argument('--timeout', type=float, default=1.0, help='Seconds to wait for each reply (default: 1.0)')
+    parser.add_argument('--retries', type=int, default=2, help='Quantity of times to resend unanswered search and dump requests - uploads and writes are never resent (default: 2)')
+    args = parser.parse_args(argv)
+
+    try:
+        import alsa_midi
+        client = alsa_midi.SequencerClient('riban-nanoKonfig-cli')
+        midi_in = client.create_port('in', caps=alsa_midi.WRITE_PORT)
+        midi_out = client.create_port('out', caps=alsa_midi.READ_PORT)
+    except Exception as e:
+        print('Failed to create ALSA client: {}'.format(e))
+        return EXIT_FAILED
+
+    ports = find_ports(client, args.port or ['nanoKONTROL'])
+    if not ports:
+        print('No matching MIDI ports found')
+        return EXIT_FAILED
+    paths = [get_scene_path(args.scene, index, name) for index, (name, source, destination) in enumerate(ports)]
+    if args.command == 'dump' and len(set(paths)) < len(paths):
+        print('Scene file must include {index} or {port} to dump several devices')
+        return EXIT_USAGE
+    if args.command != 'dump':
+        for path in set(paths):
+            if not os.path.isfile(path):
+                print('Scene file not found: {}'.format(path))
+                return EXIT_USAGE
+
+    router = SessionRouter()
+    jobs = []
+    for (name, source, destination), path in zip(ports, paths):
+        def send(msg, destination=destination):
+            try:
+                client.event_output(alsa_midi.MidiBytesEvent(bytes(msg)), port=midi_out, dest=destination)
+                client.drain_output()
+            except alsa_midi.ALSAError:
+                pass # Request will time out
+        session = DeviceSession(send, input=(source.client_id, source.port_id) if source else None, output=name, timeout=args.timeout, retries=args.retries)
+        job = DeviceJob(session, args.command, path, None if args.scene_index is None else args.scene_index - 1)
+        jobs.append(job)
+        if source is None:
+            job.finish(False, 'Port has no MIDI output')
+            continue
+        midi_in.connect_from(source)
+        router.add(session)
+
+    for job in jobs:
+        if job.duration is None:
+            job.run()
+    while any(job.duration is None for job in jobs):
+        event = client.event_input(prefer_bytes=True, timeout=POLL_INTERVAL)
+        while event is not None:
+            if isinstance(event, alsa_midi.MidiBytesEvent) and event.source is not None:
+                router.handle_midi(event.midi_bytes, tuple(event.source))
+            if not client.event_input_pending(fetch_sequencer=True):
+                break
+            event = client.event_input(prefer_bytes=True)
+        router.poll()
+
+    for job in jobs:
+        print('{:<40} {:<13} {:>7.0f} ms  {}'.format(job.session.output, job.session.scene.device_type, job.duration * 1000, job.result))
+    if all(job.ok for job in jobs):
+        return EXIT_OK
+    return EXIT_FAILED
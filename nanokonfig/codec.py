@@ -0,0 +1,113 @@
+# Korg 8-bit <-> MIDI 7-bit sysex codec
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Korg packs 8-bit data into 7-bit MIDI sysex as blocks of 8 bytes. The first byte
+# of each block holds the most significant bit of the following 7 bytes (bit n is
+# bit 7 of byte n). A final partial block is not padded, e.g. 256 bytes of data
+# encode as 36 blocks of 8 plus 1 + 4 bytes.
+#
+# Conversion is done with translation tables and strided slices so that the work
+# is done by bytes / int builtins rather than per-byte Python loops.
+#
+# Dependencies: None
+
+# Translation table: clear bit 7
+_LOW7 = bytes(i & 0x7F for i in range(256))
+# Translation tables: bit 7 of a data byte -> bit n of block header (encode)
+_MSB_TO_HEADER = [bytes(((i >> 7) & 1) << n for i in range(256)) for n in range(7)]
+# Translation tables: bit n of block header -> bit 7 of data byte (decode)
+_HEADER_TO_MSB = [bytes(((i >> n) & 1) << 7 for i in range(256)) for n in range(7)]
+
+
+# Get a buffer that supports translate and strided slicing
+#   buf: bytes, bytearray, memoryview or sequence of integers
+#   returns: bytes or bytearray
+def _as_bytes(buf):
+    if isinstance(buf, (bytes, bytearray)):
+        return buf
+    if isinstance(buf, memoryview):
+        return buf.tobytes()
+    return bytes(buf)
+
+
+# Get length of 7-bit MIDI data required to encode 8-bit data
+#   length: Quantity of 8-bit bytes
+#   returns: Quantity of 7-bit bytes
+def encoded_length(length):
+    return length + (length + 6) // 7
+
+
+# Get length of 8-bit data represented by 7-bit MIDI data
+#   length: Quantity of 7-bit bytes
+#   returns: Quantity of 8-bit bytes
+def decoded_length(length):
+    return length - (length + 7) // 8
+
+
+# Convert Korg 8-bit data to 7-bit MIDI data
+#   buf: 8-bit data (bytes, bytearray, memoryview or sequence of integers)
+#   returns: 7-bit MIDI data as bytes
+def encode_korg_7bit(buf):
+    buf = _as_bytes(buf)
+    blocks = (len(buf) + 6) // 7
+    out = bytearray(len(buf) + blocks)
+    headers = 0
+    for n in range(7):
+        column = buf[n::7]
+        out[n + 1::8] = column.translate(_LOW7)
+        # Header bits do not overlap so OR of little-endian integers combines all blocks at once
+        headers |= int.from_bytes(column.translate(_MSB_TO_HEADER[n]), 'little')
+    out[0::8] = headers.to_bytes(blocks, 'little')
+    return bytes(out)
+
+
+# Convert 7-bit MIDI data to Korg 8-bit data
+#   buf: 7-bit MIDI data (bytes, bytearray, memoryview or sequence of integers)
+#   returns: 8-bit data as bytearray
+def decode_korg_7bit(buf):
+    buf = _as_bytes(buf)
+    out = bytearray(decoded_length(len(buf)))
+    headers = buf[0::8]
+    for n in range(7):
+        column = buf[n + 1::8]
+        if not column:
+            break
+        msb = headers[:len(column)].translate(_HEADER_TO_MSB[n])
+        value = int.from_bytes(column.translate(_LOW7), 'little') | int.from_bytes(msb, 'little')
+        out[n::7] = value.to_bytes(len(column), 'little')
+    return out
+
+
+# Convert many blocks of Korg 8-bit data to 7-bit MIDI data in one pass
+#   bufs: Iterable of 8-bit data buffers
+#   returns: List of 7-bit MIDI data as bytes
+#   Each buffer is zero padded to a whole block so that all may be encoded together. Padding only adds zero header bits to the final block so each result is a prefix of its padded encoding.
+def encode_many(bufs):
+    bufs = [_as_bytes(buf) for buf in bufs]
+    joined = b''.join(buf + bytes(-len(buf) % 7) for buf in bufs)
+    encoded = encode_korg_7bit(joined)
+    result = []
+    offset = 0
+    for buf in bufs:
+        length = encoded_length(len(buf))
+        result.append(encoded[offset:offset + length])
+        offset += encoded_length(len(buf) + -len(buf) % 7)
+    return result
+
+
+# Convert many blocks of 7-bit MIDI data to Korg 8-bit data in one pass
+#   bufs: Iterable of 7-bit MIDI data buffers
+#   returns: List of 8-bit data as bytearray
+def decode_many(bufs):
+    bufs = [_as_bytes(buf) for buf in bufs]
+    joined = b''.join(buf + bytes(-len(buf) % 8) for buf in bufs)
+    decoded = decode_korg_7bit(joined)
+    result = []
+    offset = 0
+    for buf in bufs:
+        result.append(decoded[offset:offset + decoded_length(len(buf))])
+        offset += decoded_length(len(buf) + -len(buf) % 8)
+    return result
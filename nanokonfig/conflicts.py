@@ -0,0 +1,118 @@
+# Assignment conflict tracker - finds controls that send the same MIDI message
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Maintains a multimap of (chan, assign, cmd) to the controls that send it so
+# that an edit only updates the edited control (or the controls of the edited
+# group when its channel changes) instead of rescanning the scene. Controls
+# whose conflict state may have changed are collected for the UI to redraw.
+#
+# Dependencies: None
+
+from nanokonfig.scene import get_assignments, get_controls
+
+class ConflictTracker:
+    def __init__(self):
+        self.assignments = {} # (chan, assign, cmd) sent by each enabled control indexed by (group, control)
+        self.controls = {} # Set of (group, control) indexed by (chan, assign, cmd)
+        self.group_controls = {} # List of (group_offset, control) indexed by group (None for transport controls)
+        self.changed = set() # (group, control) of controls whose conflict state may have changed since get_changes
+
+
+    # Rebuild from a whole scene, e.g. after download or device type change
+    #   scene: Scene object
+    def rebuild(self, scene):
+        self.changed.update(self.get_conflicted())
+        self.assignments.clear()
+        self.controls.clear()
+        self.group_controls = {}
+        for group, group_offset, control in get_controls(scene.device_type):
+            self.group_controls.setdefault(group, []).append((group_offset, control))
+        for assignment, (group, group_offset, control) in get_assignments(scene.device_type, scene.data):
+            self._set((group, control), assignment)
+
+
+    # Set the MIDI message sent by a control
+    #   key: (group, control)
+    #   assignment: (chan, assign, cmd) or None if control sends nothing
+    def _set(self, key, assignment):
+        old = self.assignments.get(key)
+        if old == assignment:
+            return
+        if old is not None:
+            del self.assignments[key]
+            controls = self.controls[old]
+            controls.discard(key)
+            if len(controls) == 1:
+                self.changed.update(controls) # Remaining control no longer conflicts
+            elif not controls:
+                del self.controls[old]
+        if assignment is not None:
+            self.assignments[key] = assignment
+            controls = self.controls.setdefault(assignment, set())
+            controls.add(key)
+            if len(controls) == 2:
+                self.changed.update(controls) # Existing control now conflicts
+        self.changed.add(key)
+
+
+    # Update after a control's assign or command changed
+    #   scene: Scene object
+    #   group: Group index or None for transport controls
+    #   group_offset: Offset of group / transport
+    #   control: Control name, e.g. 'slider'
+    def update_control(self, scene, group, group_offset, control):
+        self._set((group, control), scene.get_assignment(group_offset, control))
+
+
+    # Update after a group's MIDI channel changed
+    #   scene: Scene object
+    #   group: Group index or None for transport controls
+    def update_group(self, scene, group):
+        for group_offset, control in self.group_controls.get(group, ()):
+            self._set((group, control), scene.get_assignment(group_offset, control))
+
+
+    # Update after the global MIDI channel changed
+    # Only groups that use the global channel are updated
+    #   scene: Scene object
+    def update_global_channel(self, scene):
+        for group, controls in self.group_controls.items():
+            if controls and scene.get_group_channel(controls[0][0]) > 15:
+                self.update_group(scene, group)
+
+
+    # Check if a control sends the same message as another control
+    #   group: Group index or None for transport controls
+    #   control: Control name
+    #   returns: True if control conflicts
+    def is_conflicted(self, group, control):
+        assignment = self.assignments.get((group, control))
+        return assignment is not None and len(self.controls[assignment]) > 1
+
+
+    # Get the other controls that send the same message as a control
+    #   group: Group index or None for transport controls
+    #   control: Control name
+    #   returns: List of (group, control)
+    def get_conflicts(self, group, control):
+        assignment = self.assignments.get((group, control))
+        if assignment is None:
+            return []
+        return [key for key in self.controls[assignment] if key != (group, control)]
+
+
+    # Get all conflicting controls
+    #   returns: List of (group, control)
+    def get_conflicted(self):
+        return [key for controls in self.controls.values() if len(controls) > 1 for key in controls]
+
+
+    # Get controls whose conflict state may have changed since last call
+    #   returns: Set of (group, control)
+    def get_changes(self):
+        changes = self.changed
+        self.changed = set()
+        return changes
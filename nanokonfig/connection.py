@@ -0,0 +1,74 @@
+# MIDI connection state
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Tracks the desired and actual endpoint of each connection direction so that
+# connect / disconnect calls are only made for real differences. Applying the
+# same desired state repeatedly (e.g. after every port list change) does nothing.
+#
+# Dependencies: None
+
+class ConnectionManager:
+    #   connect: Function(direction, endpoint) making a connection, raising an exception on failure
+    #   disconnect: Function(direction, endpoint) removing a connection
+    #   directions: Iterable of connection directions (default: ('in', 'out'))
+    def __init__(self, connect, disconnect, directions=('in', 'out')):
+        self.connect = connect
+        self.disconnect = disconnect
+        self.desired = dict.fromkeys(directions) # Endpoint that should be connected indexed by direction
+        self.actual = dict.fromkeys(directions) # Endpoint that is connected indexed by direction
+        self.stats = {'connects': 0, 'disconnects': 0, 'failures': 0}
+
+
+    # Set the endpoint that should be connected
+    #   direction: Connection direction
+    #   endpoint: Endpoint identifier or None to disconnect
+    def set_desired(self, direction, endpoint):
+        self.desired[direction] = endpoint
+
+
+    # Record that a connected endpoint no longer exists, e.g. device unplugged
+    # The connection is remade by apply if the endpoint reappears
+    #   endpoint: Endpoint identifier
+    def lost(self, endpoint):
+        for direction in self.actual:
+            if self.actual[direction] == endpoint:
+                self.actual[direction] = None
+
+
+    # Check if a direction is connected to its desired endpoint
+    #   direction: Connection direction
+    #   returns: True if connected as desired
+    def is_connected(self, direction):
+        return self.actual[direction] is not None and self.actual[direction] == self.desired[direction]
+
+
+    # Make connect / disconnect calls required to reach the desired state
+    #   returns: List of directions whose connection changed
+    def apply(self):
+        changed = []
+        for direction, desired in self.desired.items():
+            actual = self.actual[direction]
+            if desired == actual:
+                continue
+            if actual is not None:
+                try:
+                    self.disconnect(direction, actual)
+                except Exception:
+                    pass # Endpoint may have gone
+                self.stats['disconnects'] += 1
+                self.actual[direction] = None
+                changed.append(direction)
+            if desired is not None:
+                try:
+                    self.connect(direction, desired)
+                except Exception:
+                    self.stats['failures'] += 1
+                    continue
+                self.stats['connects'] += 1
+                self.actual[direction] = desired
+                if direction not in changed:
+                    changed.append(direction)
+        return changed
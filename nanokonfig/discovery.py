@@ -0,0 +1,79 @@
+# Parallel nanoKONTROL device discovery
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# A device search request with a distinct echo ID is sent to every candidate
+# output port at once. Each device echoes the ID in its reply so the reply
+# identifies the output port that reached the device and the input port it
+# arrived on identifies the device's output. All ports are probed within a
+# single timeout period rather than one port at a time.
+#
+# Input ports that are only subscribed for discovery are registered with
+# add_input so that the owner can drop their other traffic (e.g. another
+# device's controls) instead of handling it as input from the selected device.
+#
+# Dependencies: None
+
+from nanokonfig import protocol
+
+MAX_PROBES = 127 # Echo IDs are 7-bit, ID 0 is reserved for normal device search
+
+class DeviceDiscovery:
+    #   outputs: Iterable of candidate output port identifiers
+    def __init__(self, outputs):
+        self.probes = {} # Output port indexed by echo ID
+        for echo_id, output in enumerate(outputs, 1):
+            if echo_id > MAX_PROBES:
+                raise ValueError('Too many ports to probe: maximum is {}'.format(MAX_PROBES))
+            self.probes[echo_id] = output
+        self.devices = {} # Detected devices indexed by (echo ID, input port)
+        self.inputs = set() # Input ports subscribed only for discovery
+        self.parser = protocol.MidiParser(None)
+
+
+    # Get device search requests to send
+    #   returns: List of (output port, raw MIDI message)
+    def get_requests(self):
+        return [(output, protocol.device_search(echo_id)) for echo_id, output in self.probes.items()]
+
+
+    # Register an input port that is only subscribed for discovery
+    #   input: Identifier of input port
+    def add_input(self, input):
+        self.inputs.add(input)
+
+
+    # Check if an input port is only subscribed for discovery
+    #   input: Identifier of input port
+    #   returns: True if all messages from the port should be consumed by discovery
+    def owns_input(self, input):
+        return input in self.inputs
+
+
+    # Handle a MIDI message received during discovery
+    #   data: Raw MIDI message
+    #   input: Identifier of port message was received on or None if unknown
+    #   returns: Detected device as dictionary or None if message was not a reply to a probe
+    def handle_midi(self, data, input=None):
+        reply = self.parser.parse(data)
+        if reply is None or reply['type'] != 'search_reply' or reply['echo_id'] not in self.probes:
+            return None
+        device = {
+            'output': self.probes[reply['echo_id']],
+            'input': input,
+            'device_type': reply['device_type'],
+            'family_id': reply['family_id'],
+            'member_id': reply['member_id'],
+            'version': '{}.{}'.format(reply['major'], reply['minor']),
+            'chan': reply['chan']
+        }
+        self.devices[(reply['echo_id'], input)] = device
+        return device
+
+
+    # Get table of detected devices
+    #   returns: List of device dictionaries sorted by output and input port
+    def get_results(self):
+        return [self.devices[key] for key in sorted(self.devices, key=lambda key: (key[0], str(key[1])))]
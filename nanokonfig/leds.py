@@ -0,0 +1,123 @@
+# nanoKONTROL2 external LED state engine
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# When LED mode is External the nanoKONTROL2 LEDs are driven by CC messages on
+# the global MIDI channel. LedState holds the desired state of each LED and
+# flush returns CC messages only for LEDs that differ from the state last sent
+# so that a host refresh does not flood the device with redundant messages.
+#
+# Dependencies: None
+
+from nanokonfig.scene import control_map
+
+class LedState:
+    #   chan: MIDI channel the device listens on for LED messages (global MIDI channel)
+    def __init__(self, chan=0):
+        self.leds = {} # LED CC indexed by (control, group) where group is None for transport LEDs
+        for control, cc in control_map['nanoKONTROL2']['led_map'].items():
+            if control in ('solo', 'mute', 'prime'):
+                for group in range(len(control_map['nanoKONTROL2']['groups'])):
+                    self.leds[(control, group)] = cc + group
+            else:
+                self.leds[(control, None)] = cc
+        self.ccs = sorted(self.leds.values())
+        self.chan = chan
+        self.desired = bytearray(128) # Desired LED value indexed by CC
+        self.sent = None # LED values last sent indexed by CC or None if device state unknown
+        self.stats = {'requested': 0, 'sent': 0}
+
+
+    # Set state of an LED
+    #   control: Control name ['solo', 'mute', 'prime', 'play', 'stop', 'rew', 'ff', 'rec', 'cycle']
+    #   group: Group index [0..7] for solo / mute / prime, None for transport LEDs
+    #   on: True to light LED
+    #   returns: True if LED exists
+    def set(self, control, group=None, on=True):
+        cc = self.leds.get((control, group))
+        if cc is None:
+            return False
+        self.desired[cc] = 127 if on else 0
+        self.stats['requested'] += 1
+        return True
+
+
+    # Get desired state of an LED
+    #   control: Control name
+    #   group: Group index or None for transport LEDs
+    #   returns: True if LED is (to be) lit
+    def get(self, control, group=None):
+        cc = self.leds.get((control, group))
+        return cc is not None and self.desired[cc] > 0
+
+
+    # Set state of an LED by its CC number
+    #   cc: LED CC number
+    #   value: CC value (0 for off)
+    #   returns: True if CC drives an LED
+    def set_cc(self, cc, value):
+        if cc not in self.ccs:
+            return False
+        self.desired[cc] = 127 if value else 0
+        self.stats['requested'] += 1
+        return True
+
+
+    # Mirror a host's LED message onto the device (MIDI thru rule)
+    #   chan: MIDI channel of received CC
+    #   cc: CC number
+    #   value: CC value
+    #   returns: True if message was an LED CC on the LED MIDI channel
+    def handle_cc(self, chan, cc, value):
+        if chan != self.chan:
+            return False
+        return self.set_cc(cc, value)
+
+
+    # Mirror a raw MIDI message received from a host onto the device
+    # Only host / DAW traffic should be passed here - CCs sent by the device's own buttons would be echoed back as LEDs
+    #   data: Raw MIDI message
+    #   returns: True if message was an LED CC on the LED MIDI channel
+    def handle_midi(self, data):
+        if len(data) != 3 or data[0] & 0xF0 != 0xB0:
+            return False
+        return self.handle_cc(data[0] & 0x0F, data[1], data[2])
+
+
+    # Turn off all LEDs
+    def clear(self):
+        for cc in self.ccs:
+            self.desired[cc] = 0
+
+
+    # Set MIDI channel the device listens on for LED messages
+    #   chan: MIDI channel
+    def set_channel(self, chan):
+        if chan != self.chan:
+            self.chan = chan
+            self.invalidate()
+
+
+    # Forget what was sent so that next flush sends all LEDs, e.g. after device reconnect
+    def invalidate(self):
+        self.sent = None
+
+
+    # Get messages required to bring device LEDs to desired state
+    #   returns: List of raw MIDI CC messages for LEDs that changed since last flush
+    def flush(self):
+        status = 0xB0 | self.chan
+        if self.sent is None:
+            changed = self.ccs
+            self.sent = bytearray(128)
+        else:
+            changed = [cc for cc in self.ccs if self.desired[cc] != self.sent[cc]]
+        msgs = []
+        for cc in changed:
+            value = self.desired[cc]
+            self.sent[cc] = value
+            msgs.append(bytes((status, cc, value)))
+        self.stats['sent'] += len(msgs)
+        return msgs
@@ -0,0 +1,321 @@
+# Scene library - binary archive of scenes
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# File layout (all values little endian):
+#   Header: magic 'NKSL', version (uint16), flags (uint16), record count (uint32), newest table segment position (uint32, 0 if none)
+#   Records: device type (uint8), pad, data length (uint16), timestamp (float64 seconds since epoch), name (32 bytes UTF-8, zero padded), raw 8-bit scene data
+#   Table segments: previous segment position (uint32, 0 if none), entry count (uint32), entries of record index (uint32) and record position (uint32)
+#
+# The file is memory mapped so opening a library only reads the header and
+# table segments. Record data is returned as a memoryview of the mapped file
+# (no copy) which remains valid until the library is closed.
+# Records are appended after the end of the file followed by a table segment
+# listing only the new (or replaced) records and linking to the previous
+# segment, then the header is updated to point at the new segment. Newer
+# segments take precedence when the chain is read. Once the entries added
+# since the last full table reach half the library size a full table (with no
+# previous segment) is written instead, so each change writes a constant
+# amount of table data on average. Records are never overwritten and the
+# header is only written once the new data is on disk so a failed write
+# (crash, full disk) leaves the previous library intact. Space used by
+# superseded tables and records is reclaimed by rewriting the library to a
+# temporary file that replaces it when the space exceeds the size of the live
+# data. Version 1 libraries (a single flat offset table) are read and
+# converted when first modified.
+#
+# Dependencies: None
+
+import mmap
+import os
+import struct
+from time import time
+from nanokonfig.scene import scene
+
+MAGIC = b'NKSL'
+VERSION = 2
+header_struct = struct.Struct('<4sHHII') # magic, version, flags, record count, newest table segment position
+record_struct = struct.Struct('<BxHd32s') # device type, data length, timestamp, name
+segment_struct = struct.Struct('<II') # previous segment position, entry count
+entry_struct = struct.Struct('<II') # record index, record position
+library_device_types = ('nanoKONTROL1', 'nanoKONTROL2') # Device types indexed by value stored in records - append only
+
+# A scene record within a library
+class SceneRecord:
+    __slots__ = ('index', 'device_type', 'name', 'timestamp', 'data')
+
+    def __init__(self, index, device_type, name, timestamp, data):
+        self.index = index # Index of record in library
+        self.device_type = device_type
+        self.name = name
+        self.timestamp = timestamp # Seconds since epoch when scene was stored
+        self.data = data # Raw scene data as memoryview of library file
+
+
+    # Get a scene object from the record
+    #   returns: New scene object with a copy of the record data
+    def get_scene(self):
+        return scene(self.device_type, self.data)
+
+
+class SceneLibrary:
+    #   path: Library file path (created if it does not exist unless readonly)
+    #   readonly: True to open without allowing changes
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        if not readonly and not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(header_struct.pack(MAGIC, VERSION, 0, 0, 0))
+        self.file = open(path, 'rb' if readonly else 'r+b')
+        self._mm = None
+        self._live_size = None # Size of header, records and table segments in use or None if not yet calculated
+        self._map()
+
+
+    # Map library file into memory and read table segments
+    def _map(self):
+        mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.table_offset, self.offsets, self._table_size, self._delta_entries = self._read_table(mm)
+        except Exception:
+            mm.close()
+            raise
+        self._set_map(mm)
+
+
+    # Replace memory map of library file
+    # The previous map is closed unless record data views still reference it - it is then released with the last view
+    #   mm: New memory map
+    def _set_map(self, mm):
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass
+        self._mm = mm
+
+
+    # Read offset table from mapped library file
+    #   mm: Memory map of library file
+    #   returns: (newest table segment position, list of record positions, size of table segments, quantity of entries since last full table)
+    def _read_table(self, mm):
+        try:
+            magic, version, flags, count, table_offset = header_struct.unpack_from(mm, 0)
+            if magic != MAGIC:
+                raise ValueError('{} is not a scene library'.format(self.path))
+            if version == 1:
+                # Flat table - counted as changes so that the next write converts it to a full version 2 table
+                offsets = list(struct.unpack_from('<{}I'.format(count), mm, table_offset))
+                return table_offset, offsets, 4 * count, count
+            if version != VERSION:
+                raise ValueError('Unsupported scene library version {}'.format(version))
+            offsets = [None] * count
+            table_size = 0
+            delta_entries = 0
+            position = table_offset
+            while position:
+                previous, entries = segment_struct.unpack_from(mm, position)
+                if previous >= position:
+                    raise ValueError('{} is truncated or corrupt'.format(self.path))
+                values = struct.unpack_from('<{}I'.format(2 * entries), mm, position + segment_struct.size)
+                for index, offset in zip(values[0::2], values[1::2]):
+                    if offsets[index] is None:
+                        offsets[index] = offset # Newer segment takes precedence
+                table_size += segment_struct.size + entry_struct.size * entries
+                if previous:
+                    delta_entries += entries
+                position = previous
+        except (struct.error, IndexError):
+            raise ValueError('{} is truncated or corrupt'.format(self.path))
+        if None in offsets or offsets and max(offsets) + record_struct.size > len(mm):
+            raise ValueError('{} is truncated or corrupt'.format(self.path))
+        return table_offset, offsets, table_size, delta_entries
+
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+    # Get a record
+    #   index: Index of record
+    #   returns: SceneRecord
+    def __getitem__(self, index):
+        offset = self.offsets[index]
+        type_id, length, timestamp, name = record_struct.unpack_from(self._mm, offset)
+        start = offset + record_struct.size
+        return SceneRecord(index % len(self.offsets), library_device_types[type_id], name.rstrip(b'\0').decode('utf-8', 'replace'), timestamp, memoryview(self._mm)[start:start + length])
+
+
+    def __iter__(self):
+        for index in range(len(self.offsets)):
+            yield self[index]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    # Get scene from library
+    #   index: Index of record
+    #   returns: New scene object
+    def get_scene(self, index):
+        return self[index].get_scene()
+
+
+    # Pack a scene record
+    #   scene: Scene object
+    #   name: Record name (default: scene name of nanoKONTROL1, empty for nanoKONTROL2)
+    #   timestamp: Seconds since epoch (default: now)
+    #   returns: Record as bytes
+    def _pack(self, scene, name=None, timestamp=None):
+        if name is None:
+            name = scene.get_scene_name().rstrip() if scene.device_type == 'nanoKONTROL1' else ''
+        if timestamp is None:
+            timestamp = time()
+        encoded_name = name.encode('utf-8')[:32].decode('utf-8', 'ignore').encode('utf-8') # Truncate on character boundary
+        return record_struct.pack(library_device_types.index(scene.device_type), len(scene.data), timestamp, encoded_name) + bytes(scene.data)
+
+
+    # Write records and a table segment after end of file then update header
+    #   records: List of packed records to write
+    #   replace: Index of record to replace with the first written record or None to append records
+    def _write(self, records, replace=None):
+        if self.readonly:
+            raise ValueError('Scene library is read only')
+        live_size = self._get_live_size() + sum(len(record) for record in records)
+        if replace is not None:
+            live_size -= record_struct.size + record_struct.unpack_from(self._mm, self.offsets[replace])[1]
+        position = self.file.seek(0, os.SEEK_END)
+        entries = []
+        for record in records:
+            entries.append((len(self.offsets) + len(entries) if replace is None else replace, position))
+            self.file.write(record)
+            position += len(record)
+        offsets = list(self.offsets)
+        for index, offset in entries:
+            if index == len(offsets):
+                offsets.append(offset)
+            else:
+                offsets[index] = offset
+        delta_entries = self._delta_entries + len(entries)
+        if delta_entries > len(offsets) // 2:
+            # Full table written at most once per half library of changes so table writes are amortised constant per record
+            entries = list(enumerate(offsets))
+            previous = 0
+            delta_entries = 0
+            live_size -= self._table_size
+            table_size = 0
+        else:
+            previous = self.table_offset
+            table_size = self._table_size
+        values = [value for entry in entries for value in entry]
+        segment = segment_struct.pack(previous, len(entries)) + struct.pack('<{}I'.format(len(values)), *values)
+        self.file.write(segment)
+        self._sync()
+        self.file.seek(0)
+        self.file.write(header_struct.pack(MAGIC, VERSION, 0, len(offsets), position))
+        self._sync()
+        self._set_map(mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ))
+        self.table_offset = position
+        self.offsets = offsets
+        self._table_size = table_size + len(segment)
+        self._delta_entries = delta_entries
+        self._live_size = live_size + len(segment)
+        if len(self._mm) > 2 * self._live_size:
+            self._compact()
+
+
+    # Flush file to disk
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+
+    # Get size of header, records and table segments in use
+    #   returns: Size in bytes
+    def _get_live_size(self):
+        if self._live_size is None:
+            size = header_struct.size + self._table_size
+            for offset in self.offsets:
+                size += record_struct.size + record_struct.unpack_from(self._mm, offset)[1]
+            self._live_size = size
+        return self._live_size
+
+
+    # Rewrite library without superseded records and tables, with a single full table
+    # The library is written to a temporary file that replaces the library file so the library is intact if rewrite fails
+    def _compact(self):
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(bytes(header_struct.size))
+                offsets = []
+                position = header_struct.size
+                for offset in self.offsets:
+                    end = offset + record_struct.size + record_struct.unpack_from(self._mm, offset)[1]
+                    f.write(self._mm[offset:end])
+                    offsets.append(position)
+                    position += end - offset
+                values = [value for entry in enumerate(offsets) for value in entry]
+                f.write(segment_struct.pack(0, len(offsets)) + struct.pack('<{}I'.format(len(values)), *values))
+                f.seek(0)
+                f.write(header_struct.pack(MAGIC, VERSION, 0, len(offsets), position))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except OSError:
+            # Library is still valid, just larger than necessary, e.g. file is open elsewhere on Windows
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        self.file.close()
+        self.file = open(self.path, 'r+b')
+        self._map()
+        self._live_size = None
+
+
+    # Add a scene to the library
+    #   scene: Scene object
+    #   name: Record name (default: scene name of nanoKONTROL1, empty for nanoKONTROL2)
+    #   timestamp: Seconds since epoch (default: now)
+    #   returns: Index of new record
+    def append(self, scene, name=None, timestamp=None):
+        self._write([self._pack(scene, name, timestamp)])
+        return len(self.offsets) - 1
+
+
+    # Add many scenes to the library in one write
+    #   scenes: Iterable of scene objects or (scene, name, timestamp)
+    #   returns: Index of first new record
+    def extend(self, scenes):
+        first = len(self.offsets)
+        self._write([self._pack(*item) if isinstance(item, tuple) else self._pack(item) for item in scenes])
+        return first
+
+
+    # Replace a scene in the library
+    # A new record is written and indexed in its place so the old record (and any view of its data) is unchanged
+    #   index: Index of record
+    #   scene: Scene object
+    #   name: Record name (default: scene name of nanoKONTROL1, empty for nanoKONTROL2)
+    #   timestamp: Seconds since epoch (default: now)
+    def replace(self, index, scene, name=None, timestamp=None):
+        self._write([self._pack(scene, name, timestamp)], index % len(self.offsets))
+
+
+    # Close library file
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            pass # Record data views still reference map - released with the last view
+        self.file.close()
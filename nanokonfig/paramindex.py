@@ -0,0 +1,71 @@
+# Parameter index - find scenes by the MIDI messages their controls send
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Maps (chan, assign, cmd) to the scenes and controls that send that message,
+# e.g. every scene that sends CC 7 on channel 3. Scenes are indexed from raw
+# data using the compiled assignment layout (no scene objects are created) and
+# each scene may be added, replaced or removed without rebuilding the index.
+#
+# Dependencies: None
+
+from nanokonfig.scene import get_assignments
+
+class ParameterIndex:
+    def __init__(self):
+        self.index = {} # Dictionary of {scene key: [(group, control)]} indexed by (chan, assign, cmd)
+        self.scenes = {} # Assignments of each indexed scene indexed by scene key
+
+
+    def __len__(self):
+        return len(self.scenes)
+
+
+    # Add or replace a scene
+    #   key: Identifier of scene, e.g. library record index
+    #   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+    #   data: Raw 8-bit Korg scene data
+    def add(self, key, device_type, data):
+        self.remove(key)
+        assignments = set()
+        for assignment, (group, group_offset, control) in get_assignments(device_type, data):
+            self.index.setdefault(assignment, {}).setdefault(key, []).append((group, control))
+            assignments.add(assignment)
+        self.scenes[key] = assignments
+
+
+    # Remove a scene
+    #   key: Identifier of scene
+    def remove(self, key):
+        for assignment in self.scenes.pop(key, ()):
+            entry = self.index[assignment]
+            del entry[key]
+            if not entry:
+                del self.index[assignment]
+
+
+    # Add all scenes of a scene library, indexed by record index
+    #   library: SceneLibrary
+    def add_library(self, library):
+        for record in library:
+            self.add(record.index, record.device_type, record.data)
+
+
+    # Find controls that send a MIDI message
+    #   chan: MIDI channel [0..15]
+    #   assign: Message type [1: CC, 2: Note]
+    #   cmd: CC or note number
+    #   returns: List of (scene key, group, control) where group is None for transport controls
+    def find(self, chan, assign, cmd):
+        return [(key, group, control) for key, controls in self.index.get((chan, assign, cmd), {}).items() for group, control in controls]
+
+
+    # Find scenes that send a MIDI message
+    #   chan: MIDI channel [0..15]
+    #   assign: Message type [1: CC, 2: Note]
+    #   cmd: CC or note number
+    #   returns: List of scene keys
+    def find_scenes(self, chan, assign, cmd):
+        return list(self.index.get((chan, assign, cmd), ()))
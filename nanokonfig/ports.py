@@ -0,0 +1,45 @@
+# MIDI port lists
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Port lists are updated one port at a time as ports appear and disappear so a
+# sorted list of names is maintained alongside the dictionary, ready to show in
+# a drop-down list without sorting the whole list on each change.
+#
+# Dependencies: None
+
+from bisect import bisect_left, insort
+
+# Dictionary of MIDI ports indexed by display name with names kept in sorted order
+class SortedPortDict(dict):
+    def __init__(self):
+        super().__init__()
+        self.names = [] # Sorted list of port names
+
+
+    def __setitem__(self, name, value):
+        if name not in self:
+            insort(self.names, name)
+        super().__setitem__(name, value)
+
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        del self.names[bisect_left(self.names, name)]
+
+
+    # Remove a port
+    #   name: Port name
+    #   default: Value to return if port does not exist
+    #   returns: Removed value or default
+    def pop(self, name, *default):
+        if name in self:
+            del self.names[bisect_left(self.names, name)]
+        return super().pop(name, *default)
+
+
+    def clear(self):
+        super().clear()
+        self.names.clear()
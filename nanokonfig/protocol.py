@@ -0,0 +1,286 @@
+# nanoKONTROL MIDI protocol - message builders and parser
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Builders return raw MIDI messages as bytes, ready to send to a device.
+# The parser converts raw MIDI messages received from a device to a dictionary
+# describing the message.
+#
+# Dependencies: None
+
+from nanokonfig.scene import device_types
+
+# Command list data headers of scene data dumps
+dump_headers = {
+    'nanoKONTROL1': (0x7F, 0x7F, 0x02, 0x02, 0x26, 0x40),
+    'nanoKONTROL2': (0x7F, 0x7F, 0x02, 0x03, 0x05, 0x40)
+}
+
+## Device specific MIDI messages - send from application to device ##
+
+# Build Inquiry Message Request
+#   returns: MIDI message as bytes
+def inquiry():
+    return bytes((0xF0, 0x7E, 0x7F, 0x06, 0x01, 0xF7))
+
+
+# Build device search request
+#   echo_id: Identifier echoed in device reply
+#   returns: MIDI message as bytes
+def device_search(echo_id=0):
+    return bytes((0xF0, 0x42, 0x50, 0x00, echo_id, 0xF7))
+
+
+# Build a command list message
+#   scene: Scene object providing global MIDI channel and device type
+#   data: Bytes or tuple containing the message payload
+#   returns: MIDI message as bytes
+def command_list(scene, data):
+    return bytes((0xF0, 0x42, 0x40 | scene.global_midi_chan) + scene.get_sysex_id()) + bytes(data) + b'\xF7'
+
+
+# Build current scene data dump request
+#   scene: Scene object
+#   returns: MIDI message as bytes
+def dump_request(scene):
+    return command_list(scene, (0x1F, 0x10, 0x00))
+
+
+# Build request for current temporary scene data be saved on device
+#   scene: Scene object
+#   scene_index: Index of scene to write [0..3] (nanoKONTROL1 only)
+#   returns: MIDI message as bytes
+def scene_write_request(scene, scene_index=0):
+    if scene.device_type == 'nanoKONTROL1':
+        return command_list(scene, (0x1F, 0x11, scene_index))
+    return command_list(scene, (0x1F, 0x11, 0))
+
+
+# Build native mode request (nanoKONTROL2)
+#   scene: Scene object
+#   out: True for native mode out, False for native mode in
+#   returns: MIDI message as bytes
+def native_mode(scene, out=False):
+    return command_list(scene, (0x00, 0x00, 0x01 if out else 0x00))
+
+
+# Build query mode request (nanoKONTROL2)
+#   scene: Scene object
+#   returns: MIDI message as bytes
+def query_mode(scene):
+    return command_list(scene, (0x1F, 0x12, 0x00))
+
+
+# Build scene change request (nanoKONTROL1)
+#   scene: Scene object
+#   scene_index: Requested scene [0..3]
+#   returns: MIDI message as bytes or None if scene index is invalid
+def scene_change_request(scene, scene_index):
+    if scene_index >= 0 and scene_index <= 3:
+        return command_list(scene, (0x1F, 0x14, scene_index))
+
+
+# Build scene data upload to device 'current scene'
+# Must write scene to save to persistent memory
+#   scene: Scene object
+#   returns: MIDI message as bytes
+def scene_data(scene):
+    return command_list(scene, bytes(dump_headers[scene.device_type]) + scene.get_midi_data())
+
+
+# Build port detect request
+#   scene: Scene object
+#   echo_id: Identifier echoed in device reply
+#   returns: MIDI message as bytes
+def port_detect(scene, echo_id=0):
+    return command_list(scene, (0x1E, 0x00, echo_id))
+
+
+## Parse MIDI messages - received from device ##
+
+# Command list replies identified by first 3 bytes of command list data
+command_replies = {
+    (0x5F, 0x23, 0x00): 'load_ack',
+    (0x5F, 0x24, 0x00): 'load_nak',
+    (0x5F, 0x21, 0x00): 'write_ack',
+    (0x5F, 0x22, 0x00): 'write_nak',
+    (0x40, 0x00, 0x02): 'native_out',
+    (0x40, 0x00, 0x03): 'native_in',
+    (0x5F, 0x42, 0x00): 'normal_mode',
+    (0x5F, 0x42, 0x01): 'native_mode'
+}
+
+# Get device type from Korg family ID
+#   family_id: Korg family ID
+#   returns: Device type or None if not recognised
+def get_device_type_from_family(family_id):
+    for device_type in device_types:
+        if device_types[device_type]['family_id'] == family_id:
+            return device_type
+    return None
+
+
+# Parser for MIDI messages using dispatch tables
+# Channel messages are dispatched by status byte. System exclusive messages are
+# dispatched by header prefix. Command list prefixes include the global MIDI
+# channel and device sysex ID so the prefix table is rebuilt when the channel changes.
+class MidiParser:
+    #   echo_id: Identifier expected in device search reply or None to accept any
+    def __init__(self, echo_id=0):
+        self.echo_id = echo_id
+        self.status_handlers = [None] * 256 # Handlers indexed by status byte
+        self.sysex_handlers = {} # Handlers indexed by sysex prefix
+        self.command_handlers = {} # Handlers indexed by command list data prefix
+        self._chan = None # Global MIDI channel prefix table was built for
+        self._prefix_table = {}
+        self._prefix_lengths = ()
+
+        self.register(0x80, self._parse_note_off)
+        self.register(0x90, self._parse_note_on)
+        self.register(0xB0, self._parse_cc)
+        self.register(0xE0, self._parse_pitch_bend)
+        self.register((0xF0, 0x7E), self._parse_inquiry_reply)
+        self.register((0xF0, 0x42, 0x50, 0x01), self._parse_search_reply)
+        for device_type in dump_headers:
+            self.register_command(dump_headers[device_type], self._parse_dump)
+        for prefix in command_replies:
+            self.register_command(prefix, self._parse_command_reply)
+        self.register_command((0x5F, 0x4F), self._parse_scene_change)
+
+
+    # Register a message handler
+    #   key: Status byte of channel message (registered for all 16 channels) or sysex prefix as bytes / tuple starting 0xF0
+    #   handler: Function(data) returning dictionary describing message or None if not recognised
+    def register(self, key, handler):
+        if isinstance(key, int):
+            for chan in range(16):
+                self.status_handlers[(key & 0xF0) | chan] = handler
+        else:
+            self.sysex_handlers[bytes(key)] = handler
+            self._chan = None # Force rebuild
+
+
+    # Register a command list message handler
+    #   prefix: Command list data prefix as bytes / tuple (after global channel and sysex ID)
+    #   handler: Function(data, device_type) returning dictionary describing message or None if not recognised
+    def register_command(self, prefix, handler):
+        self.command_handlers[bytes(prefix)] = handler
+        self._chan = None # Force rebuild
+
+
+    # Build table of sysex prefixes for a global MIDI channel
+    #   chan: Global MIDI channel
+    def _build(self, chan):
+        table = dict(self.sysex_handlers)
+        for device_type in device_types:
+            header = bytes((0xF0, 0x42, 0x40 | chan) + device_types[device_type]['sysex_id'])
+            for prefix, handler in self.command_handlers.items():
+                table[header + prefix] = lambda data, handler=handler, device_type=device_type: handler(data, device_type)
+        self._prefix_table = table
+        self._prefix_lengths = sorted(set(len(prefix) for prefix in table), reverse=True)
+        self._chan = chan
+
+
+    # Parse a MIDI message
+    #   data: Raw MIDI message (bytes, bytearray or memoryview)
+    #   global_midi_chan: Global MIDI channel of device (default: 0)
+    #   returns: Dictionary describing message with 'type' and message specific values or None if not recognised
+    def parse(self, data, global_midi_chan=0):
+        if not data:
+            return None
+        status = data[0]
+        if status != 0xF0:
+            handler = self.status_handlers[status]
+            if handler:
+                return handler(data)
+            return None
+        if global_midi_chan != self._chan:
+            self._build(global_midi_chan)
+        for length in self._prefix_lengths:
+            handler = self._prefix_table.get(bytes(data[:length]))
+            if handler:
+                return handler(data)
+        return None
+
+
+    def _parse_note_off(self, data):
+        if len(data) == 3:
+            return {'type': 'note_off', 'chan': data[0] & 0x0F, 'note': data[1], 'value': data[2]}
+
+
+    def _parse_note_on(self, data):
+        if len(data) == 3:
+            if data[2] == 0:
+                return {'type': 'note_off', 'chan': data[0] & 0x0F, 'note': data[1], 'value': 0}
+            return {'type': 'note_on', 'chan': data[0] & 0x0F, 'note': data[1], 'value': data[2]}
+
+
+    def _parse_cc(self, data):
+        if len(data) == 3:
+            return {'type': 'cc', 'chan': data[0] & 0x0F, 'cc': data[1], 'value': data[2]}
+
+
+    def _parse_pitch_bend(self, data):
+        if len(data) == 3:
+            return {'type': 'pitch_bend', 'chan': data[0] & 0x0F, 'value': data[1] + (data[2] << 7)}
+
+
+    def _parse_inquiry_reply(self, data):
+        if len(data) == 15 and bytes(data[3:6]) == b'\x06\x02\x42':
+            family_id = data[6] + (data[7] << 7)
+            return {
+                'type': 'inquiry_reply',
+                'chan': data[2],
+                'family_id': family_id,
+                'member_id': data[8] + (data[9] << 7),
+                'minor': data[10] + (data[11] << 7),
+                'major': data[12] + (data[13] << 7),
+                'device_type': get_device_type_from_family(family_id)
+            }
+
+
+    def _parse_search_reply(self, data):
+        if len(data) > 13 and (self.echo_id is None or data[5] == self.echo_id):
+            family_id = data[6] + (data[7] << 7)
+            return {
+                'type': 'search_reply',
+                'chan': data[4],
+                'echo_id': data[5],
+                'family_id': family_id,
+                'member_id': data[8] + (data[9] << 7),
+                'minor': data[10] + (data[11] << 7),
+                'major': data[12] + (data[13] << 7),
+                'device_type': get_device_type_from_family(family_id)
+            }
+
+
+    def _parse_dump(self, data, device_type):
+        if bytes(data[7:13]) == bytes(dump_headers[device_type]):
+            return {'type': 'dump', 'device_type': device_type, 'payload': bytes(data[13:-1])}
+
+
+    def _parse_command_reply(self, data, device_type):
+        return {'type': command_replies[tuple(data[7:10])], 'device_type': device_type}
+
+
+    def _parse_scene_change(self, data, device_type):
+        if len(data) > 10:
+            return {'type': 'scene_change', 'device_type': device_type, 'scene': data[9]}
+
+
+parsers = {} # Parsers used by parse_midi indexed by echo ID
+
+# Parse a MIDI message
+#   data: Raw MIDI message (bytes, bytearray, memoryview or tuple of integers)
+#   scene: Scene object providing global MIDI channel
+#   echo_id: Identifier expected in device search reply or None to accept any
+#   returns: Dictionary describing message with 'type' and message specific values or None if not recognised
+def parse_midi(data, scene, echo_id=0):
+    parser = parsers.get(echo_id)
+    if parser is None:
+        parser = parsers[echo_id] = MidiParser(echo_id)
+    if isinstance(data, (tuple, list)):
+        data = bytes(data)
+    return parser.parse(data, scene.global_midi_chan)
@@ -0,0 +1,88 @@
+# Lock-free single producer / single consumer MIDI message ring buffer
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Messages are copied into preallocated fixed size slots so that neither side
+# allocates storage. The producer only advances the head and the consumer only
+# advances the tail so no lock is required, e.g. between a GUI thread and the
+# JACK process thread.
+#
+# Dependencies: None
+
+from array import array
+
+class MidiRingBuffer:
+    #   slots: Maximum quantity of queued messages
+    #   slot_size: Maximum size of each message in bytes
+    def __init__(self, slots=64, slot_size=512):
+        self.slots = slots
+        self.slot_size = slot_size
+        self._data = bytearray(slots * slot_size)
+        self._view = memoryview(self._data)
+        self._lengths = array('H', [0] * slots)
+        self._head = 0 # Total messages written (only modified by producer)
+        self._tail = 0 # Total messages read (only modified by consumer)
+        self.queued = 0 # Quantity of messages added (producer)
+        self.dropped = 0 # Quantity of messages rejected because queue full or message too large (producer)
+        self.consumed = 0 # Quantity of messages removed after processing (consumer)
+        self.discarded = 0 # Quantity of messages removed without processing (consumer)
+
+
+    # Get quantity of messages waiting in queue
+    def __len__(self):
+        return self._head - self._tail
+
+
+    # Add a message to the queue (producer only)
+    #   msg: Raw MIDI data as bytes-like object or list of integers
+    #   returns: True on success, False if message dropped
+    def put(self, msg):
+        size = len(msg)
+        if self._head - self._tail >= self.slots or size > self.slot_size:
+            self.dropped += 1
+            return False
+        slot = self._head % self.slots
+        offset = slot * self.slot_size
+        self._data[offset:offset + size] = msg
+        self._lengths[slot] = size
+        self._head += 1 # Publish to consumer after data is written
+        self.queued += 1
+        return True
+
+
+    # Get the oldest message without removing it from the queue (consumer only)
+    #   returns: Memoryview of message data (valid until pop) or None if queue is empty
+    def peek(self):
+        if self._tail == self._head:
+            return None
+        slot = self._tail % self.slots
+        offset = slot * self.slot_size
+        return self._view[offset:offset + self._lengths[slot]]
+
+
+    # Remove the oldest message from the queue after it has been processed (consumer only)
+    def pop(self):
+        if self._tail != self._head:
+            self._tail += 1
+            self.consumed += 1
+
+
+    # Remove the oldest message from the queue without processing it (consumer only)
+    def discard(self):
+        if self._tail != self._head:
+            self._tail += 1
+            self.discarded += 1
+
+
+    # Get counters
+    #   returns: Dictionary of message counters
+    def get_stats(self):
+        return {
+            'queued': self.queued,
+            'consumed': self.consumed,
+            'dropped': self.dropped,
+            'discarded': self.discarded,
+            'pending': len(self)
+        }
@@ -0,0 +1,656 @@
+# nanoKONTROL scene data model
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Dependencies: None
+
+from nanokonfig.codec import encode_korg_7bit, decode_korg_7bit
+
+mmc_commands = [
+    'Stop',
+    'Play',
+    'Deferred Play',
+    'Fast Forward',
+    'Rewind',
+    'Record Strobe',
+    'Record Exit',
+    'Record Pause',
+    'Pause',
+    'Eject',
+    'Chase',
+    'Command Error Reset',
+    'MMC Reset'
+]
+
+control_modes = [
+    'MIDI CC',
+    'Cubase',
+    'Digital Performer',
+    'Ableton Live',
+    'ProTools',
+    'SONAR'
+]
+
+assign_options = [
+    'Disabled',
+    'CC', 'Note'
+]
+
+behaviour_options = [
+    'Momentary',
+    'Toggle'
+]
+
+control_map = {
+    'nanoKONTROL1': {
+        'param_map': {
+            'assign':[0, 2],
+            'behaviour': [6, 1],
+            'cmd': [1, 127],
+            'min': [2, 127],
+            'max': [3, 127],
+            'attack': [4, 127],
+            'release': [5, 127],
+            'mmc_cmd': [2, 12],
+            'mmc_id': [3, 127],
+            'transport_behaviour': [4, 1]
+        },
+        'group_map': {
+            'channel': 0,
+            'slider': 1,
+            'knob': 5,
+            'button_a': 9,
+            'button_b': 16,
+            'rew': 1,
+            'play': 6,
+            'ff': 11,
+            'cycle': 16,
+            'stop': 21,
+            'rec': 26,
+        },
+        'num_group_ctrls': 4,
+        'groups': [16, 39, 62, 85, 108, 131, 154, 177, 200],
+        'transport': 224,
+        'group_coords': [(0.20,0.28), (0.29,0.36), (0.38,0.45), (0.47,0.54), (0.55,0.62), (0.64,0.71), (0.72,0.79), (0.81,0.88), (0.89,0.97), (0.01,0.19)],
+        'ctrl_coords': {
+            'knob': [0.03, 0.09, 0.08, 0.2],
+            'slider': [0.04, 0.47, 0.07, 0.75],
+            'button_a': [0.00, 0.44, 0.03, 0.54],
+            'button_b': [0.00, 0.71, 0.03, 0.80],
+            'rew': [0.01, 0.52, 0.06, 0.62],
+            'play': [0.07, 0.52, 0.12, 0.62],
+            'ff': [0.12, 0.52, 0.17, 0.62],
+            'cycle': [0.01, 0.66, 0.06, 0.74],
+            'stop': [0.07, 0.66, 0.12, 0.74],
+            'rec': [0.12, 0.66, 0.17, 0.74],
+            'scene': [0.01, 0.79, 0.05, 0.87]
+        }
+    },
+    'nanoKONTROL2': {
+        'param_map': {
+            'assign':[0, 2],
+            'behaviour': [1, 1],
+            'cmd': [2, 127],
+            'min': [3, 127],
+            'max': [4, 127]
+        },
+        'group_map': {
+            'channel': 0,
+            'slider': 1,
+            'knob': 7,
+            'button_a': 13,
+            'solo': 13,
+            'button_b': 19,
+            'mute': 19,
+            'button_c': 25,
+            'prime': 25,
+            'transport 1': 1,
+            'prev_track': 1,
+            'transport 2': 7,
+            'next_track': 7,
+            'transport 3': 13,
+            'cycle': 13,
+            'transport 4': 19,
+            'set_marker': 19,
+            'transport 5': 25,
+            'prev_marker': 25,
+            'transport 6': 31,
+            'next_marker': 31,
+            'transport 7': 37,
+            'rew': 37,
+            'transport 8': 43,
+            'ff': 43,
+            'transport 9': 49,
+            'stop': 49,
+            'play': 55,
+            'rec': 61
+        },
+        'led_map': {
+            'solo': 0x20,
+            'mute': 0x30,
+            'prime': 0x40,
+            'play': 0x29,
+            'stop': 0x2A,
+            'rew': 0x2B,
+            'ff': 0x2C,
+            'rec': 0x2D,
+            'cycle': 0x2E
+        },
+        'num_group_ctrls': 5,
+        'groups': [3, 34, 65, 96, 127, 158, 189, 220],
+        'transport': 251,
+        'custom daw assign': 318,
+        'group_coords': [(0.30,0.37), (0.39,0.45), (0.47,0.54), (0.56,0.63), (0.64,0.71), (0.73,0.80), (0.81,0.88), (0.90,0.96), (0.04, 0.27)],
+        'ctrl_coords': {
+            'knob': [0.03, 0.12, 0.07, 0.26],
+            'slider': [0.04, 0.44, 0.06, 0.74],
+            'solo': [0.00, 0.40, 0.03, 0.48],
+            'mute': [0.00, 0.59, 0.03, 0.67],
+            'prime': [0.00, 0.78, 0.03, 0.86],
+            'prev_track': [0.00, 0.45, 0.03, 0.50],
+            'next_track': [0.05, 0.45, 0.08, 0.50],
+            'cycle': [0.00, 0.60, 0.03, 0.66],
+            'set_marker': [0.10, 0.60, 0.13, 0.66],
+            'prev_marker': [0.15, 0.60, 0.18, 0.66],
+            'next_marker': [0.20, 0.60, 0.23, 0.66],
+            'rew': [0.00, 0.76, 0.03, 0.88],
+            'ff': [0.05, 0.76, 0.08, 0.88],
+            'stop': [0.10, 0.76, 0.13, 0.88],
+            'play': [0.15, 0.76, 0.18, 0.88],
+            'rec': [0.20, 0.76, 0.23, 0.88],
+        }
+    }
+}
+
+device_types = {
+    'nanoKONTROL1': {
+        'sysex_len': 293,
+        'data_len': 256,
+        'sysex_id': (0x00, 0x01, 0x04, 0x00),
+        'family_id': 132,
+        'global_channel_offset': 12
+    },
+    'nanoKONTROL2': {
+        'sysex_len': 388,
+        'data_len': 339,
+        'sysex_id': (0x00, 0x01, 0x13, 0x00),
+        'family_id': 147,
+        'global_channel_offset': 0
+    }
+}
+
+param_offsets = {} # Compiled parameter tables indexed by device type, populated by get_param_offsets
+
+# Get compiled table of parameter offsets for a device type
+# Flattens control_map so that each parameter is found with a single lookup
+#   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+#   returns: Dictionary of (absolute offset, max value) indexed by (group offset, control, param)
+def get_param_offsets(device_type):
+    table = param_offsets.get(device_type)
+    if table is None:
+        map = control_map[device_type]
+        data_len = device_types[device_type]['data_len']
+        table = {}
+        for group_offset in map['groups'] + [map['transport']]:
+            for control, control_offset in map['group_map'].items():
+                for param, (param_offset, param_max) in map['param_map'].items():
+                    offset = group_offset + control_offset + param_offset
+                    if offset < data_len:
+                        table[(group_offset, control, param)] = (offset, param_max)
+        param_offsets[device_type] = table
+    return table
+
+
+controls = {} # Physical controls indexed by device type, populated by get_controls
+
+# Get the physical controls of a device type
+# Group controls are the first 'num_group_ctrls' of 'ctrl_coords', the remainder (except scene button) are transport controls
+#   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+#   returns: List of (group, group_offset, control) where group is group index or None for transport controls
+def get_controls(device_type):
+    result = controls.get(device_type)
+    if result is None:
+        map = control_map[device_type]
+        names = [control for control in map['ctrl_coords'] if control != 'scene']
+        result = []
+        for group, group_offset in enumerate(map['groups']):
+            for control in names[:map['num_group_ctrls']]:
+                result.append((group, group_offset, control))
+        for control in names[map['num_group_ctrls']:]:
+            result.append((None, map['transport'], control))
+        controls[device_type] = result
+    return result
+
+
+# Get the parameters stored for a control
+#   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+#   control: Control name, e.g. 'button_a'
+#   transport: True if control is a transport control
+#   returns: Tuple of parameter names
+def get_control_params(device_type, control, transport=False):
+    if device_type == 'nanoKONTROL1':
+        if transport:
+            return ('assign', 'cmd', 'mmc_cmd', 'mmc_id', 'transport_behaviour')
+        if control in ('slider', 'knob'):
+            return ('assign', 'cmd', 'min', 'max')
+        return ('assign', 'behaviour', 'cmd', 'min', 'max', 'attack', 'release')
+    return ('assign', 'behaviour', 'cmd', 'min', 'max')
+
+
+assignment_layouts = {} # Compiled assignment offsets indexed by device type, populated by get_assignment_layout
+
+# Get compiled offsets of the parameters that define the MIDI message each control sends
+#   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+#   returns: List of (group, group_offset, control, assign offset, cmd offset, mmc) where mmc is True if note assignment sends MMC
+def get_assignment_layout(device_type):
+    layout = assignment_layouts.get(device_type)
+    if layout is None:
+        params = get_param_offsets(device_type)
+        layout = []
+        for group, group_offset, control in get_controls(device_type):
+            assign = params.get((group_offset, control, 'assign'))
+            cmd = params.get((group_offset, control, 'cmd'))
+            if assign is None or cmd is None:
+                continue
+            mmc = device_type == 'nanoKONTROL1' and group_offset == control_map['nanoKONTROL1']['transport']
+            layout.append((group, group_offset, control, assign[0], cmd[0], mmc))
+        assignment_layouts[device_type] = layout
+    return layout
+
+
+# Get the MIDI message sent by each control from raw scene data
+# Works directly on data (e.g. a memoryview of a scene library) without creating a scene object
+#   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+#   data: Raw 8-bit Korg scene data
+#   returns: List of ((chan, assign, cmd), (group, group_offset, control)) for each enabled control
+def get_assignments(device_type, data):
+    global_chan = data[device_types[device_type]['global_channel_offset']]
+    result = []
+    for group, group_offset, control, assign_offset, cmd_offset, mmc in get_assignment_layout(device_type):
+        assign = data[assign_offset]
+        if assign == 0 or assign == 2 and mmc:
+            continue
+        chan = data[group_offset]
+        if chan > 15:
+            chan = global_chan
+        result.append(((chan, assign, data[cmd_offset]), (group, group_offset, control)))
+    return result
+
+
+default_templates = {} # Immutable default scene data indexed by device type, populated by get_default_template
+
+# Get default scene data for a device type
+# Defaults are built once per device type then copied by scene.reset_data
+#   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+#   returns: Default 8-bit Korg data as bytes
+def get_default_template(device_type):
+    template = default_templates.get(device_type)
+    if template is None:
+        builder = scene.__new__(scene)
+        builder.global_midi_chan = 0
+        builder._synced = None
+        builder._midi_cache = (None, None)
+        builder.device_type = device_type
+        builder._params = get_param_offsets(device_type)
+        builder._build_default_data()
+        template = bytes(builder.data)
+        default_templates[device_type] = template
+    return template
+
+
+## Scene class encapsulates a nanoKONTROL scene data structure ##
+# Scene data is held as a bytearray of the Korg 8-bit data
+class scene:
+    __slots__ = ('global_midi_chan', 'device_type', 'data', '_params', '_synced', '_midi_cache')
+    device_types = device_types
+
+    #   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2'] (default: nanoKONTROL2)
+    #   data: Raw 8-bit Korg data to use instead of default values (default: None for defaults)
+    def __init__(self, device_type='nanoKONTROL2', data=None):
+        if device_type not in self.device_types:
+            raise ValueError('Unknown device type {}'.format(device_type))
+        self.global_midi_chan = 0 # Global MIDI channel (0 based)
+        self.device_type = device_type
+        self._synced = None # Copy of data last known to be on device
+        self._midi_cache = (None, None) # Last encoded sysex data as (data, sysex)
+        self._params = get_param_offsets(device_type)
+        if data is None:
+            self.data = bytearray(get_default_template(device_type))
+        elif len(data) == self.device_types[device_type]['data_len']:
+            self.data = bytearray(data)
+        else:
+            raise ValueError('Wrong length data for {}'.format(device_type))
+
+
+    # Get a copy of this scene
+    #   returns: New scene object with same device type, global MIDI channel and data
+    def copy(self):
+        new_scene = scene(self.device_type, self.data)
+        new_scene.global_midi_chan = self.global_midi_chan
+        new_scene._synced = self._synced
+        return new_scene
+
+
+    # Get the (4 byte) sysex segment defining the device type
+    #   returns: Device ID as 4 byte list
+    def get_sysex_id(self):
+        return self.device_types[self.device_type]['sysex_id']
+
+
+    # Set the device type
+    #   type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+    def set_device_type(self, type):
+        if type == self.device_type or type not in self.device_types:
+            return
+        self.device_type = type
+        self._params = get_param_offsets(type)
+        self.reset_data()
+
+
+    # Reset scene data to default values
+    def reset_data(self):
+        self.data = bytearray(get_default_template(self.device_type))
+
+
+    # Populate scene data with default values (used to build default templates)
+    def _build_default_data(self):
+        transport_offset = control_map[self.device_type]['transport']
+        if self.device_type == 'nanoKONTROL1':
+            self.data = bytearray(256)
+            self.set_scene_name('')
+            mmc_map = [5, 2, 0, 4, 3, 1]
+            for i, control in enumerate(('rec', 'play', 'stop', 'rew', 'ff', 'cycle')):
+                transport_offset = control_map[self.device_type]['transport']
+                self.set_control_parameter(transport_offset, control, 'assign', 1)
+                self.set_control_parameter(transport_offset, control, 'cmd', 44 + i)
+                self.set_control_parameter(transport_offset, control, 'mmc_cmd', mmc_map[i])
+                self.set_control_parameter(transport_offset, control, 'mmc_id', 127)
+                self.set_control_parameter(transport_offset, control, 'transport_behaviour', 0)
+
+        elif self.device_type == 'nanoKONTROL2':
+            self.data = bytearray(339)
+            self.set_control_mode(0)
+            self.set_led_mode(0)
+            for i, control in enumerate(('play', 'stop', 'rew', 'ff', 'rec', 'cycle', 'prev_track', 'next_track', 'set_marker', 'prev_marker', 'next_marker')):
+                transport_offset = control_map[self.device_type]['transport']
+                self.set_control_parameter(transport_offset, control, 'assign', 1)
+                if i < 6:
+                    self.set_control_parameter(transport_offset, control, 'cmd',  0x29 + i)
+                else:
+                    self.set_control_parameter(transport_offset, control, 'cmd',  0x34 + i)
+                self.set_control_parameter(transport_offset, control, 'min', 0)
+                self.set_control_parameter(transport_offset, control, 'max', 127)
+                self.set_control_parameter(transport_offset, control, 'behaviour', 0)
+            for i in range(318, 323):
+                self.data[i] = 0 #TODO: What are default custom daw values?
+
+        self.set_global_channel(0)
+        self.set_group_channel(transport_offset, 16)
+
+        for group, group_offset in enumerate(control_map[self.device_type]['groups']):
+            self.set_group_channel(group_offset, 16)
+            if self.device_type == 'nanoKONTROL1':
+                for i, control in enumerate(('slider', 'knob', 'button_a', 'button_b')):
+                    self.set_control_parameter(group_offset, control, 'assign', 1)
+                    self.set_control_parameter(group_offset, control, 'cmd', 0x10 * i + group) #This differs from Korg's own defaults but that doesn't matter
+                    self.set_control_parameter(group_offset, control, 'min', 0)
+                    self.set_control_parameter(group_offset, control, 'max', 127)
+                for i, control in enumerate(('button_a', 'button_b')):
+                    self.set_control_parameter(group_offset, control, 'behaviour', 0)
+                    self.set_control_parameter(group_offset, control, 'attack', 0)
+                    self.set_control_parameter(group_offset, control, 'release', 0)
+            elif self.device_type == 'nanoKONTROL2':
+                for i, control in enumerate(('slider', 'knob', 'solo', 'mute', 'prime')):
+                    self.set_control_parameter(group_offset, control, 'assign', 1)
+                    self.set_control_parameter(group_offset, control, 'cmd', 0x10 * i + group)
+                    self.set_control_parameter(group_offset, control, 'min', 0)
+                    self.set_control_parameter(group_offset, control, 'max', 127)
+                    self.set_control_parameter(group_offset, control, 'behaviour', 0)
+
+
+    # Get data (payload) in MIDI sysex format
+    # Convert Korg 8-bit data to 7-bit MIDI data
+    # nanoKONTROL1 has 256 bytes of data which gives 36 blocks of 7 bytes plus 4 extra bytes
+    # nanoKONTROL2 has 339 bytes of data which gives 48 blocks of 7 bytes plus 3 extra bytes
+    # Each block is converted to 8 MIDI bytes (first byte represents most significant bit of subsequent 7 bytes)
+    # Remaining 3 or 4 bytes are sent similarly but not padded to full block of 8, i.e. nanoKONTROL1 MIDI has 36 * 8 + 1 + 4 bytes in payload
+    #   returns: Bytes containing sysex data
+    # Encoded data is cached until scene data changes
+    def get_midi_data(self):
+        if self._midi_cache[0] != self.data:
+            self._midi_cache = (bytes(self.data), encode_korg_7bit(self.data))
+        return self._midi_cache[1]
+
+
+    # Record that the device holds the current (or given) scene data, e.g. after download or successful upload
+    #   data: 8-bit Korg data known to be on device (default: None for current data)
+    def mark_synced(self, data=None):
+        if data is None:
+            data = self.data
+        self._synced = bytes(data)
+
+
+    # Record that the content of the device is unknown, e.g. after device or scene change
+    def clear_synced(self):
+        self._synced = None
+
+
+    # Get scene data last known to be on device
+    #   returns: 8-bit Korg data as bytes or None if device data unknown
+    def get_synced_data(self):
+        return self._synced
+
+
+    # Check if device holds the current scene data
+    #   returns: True if scene data is unchanged since last sync
+    def is_synced(self):
+        return self._synced is not None and self._synced == self.data
+
+
+    # Get offsets of data modified since last sync
+    #   returns: List of offsets that differ from data on device (all offsets if device data unknown)
+    def get_dirty_offsets(self):
+        if self._synced is None or len(self._synced) != len(self.data):
+            return list(range(len(self.data)))
+        return [offset for offset, (value, synced) in enumerate(zip(self.data, self._synced)) if value != synced]
+
+
+    # Get differences between this scene and another
+    #   other: Scene of same device type to compare
+    #   returns: List of (group_offset, control, param, value, other_value) for each parameter that differs
+    #   Group and global settings are reported with control None and param 'channel', 'global_channel', 'control_mode', 'led_mode' or 'scene_name'
+    def diff(self, other):
+        if other.device_type != self.device_type:
+            raise ValueError('Cannot compare {} with {}'.format(self.device_type, other.device_type))
+        changes = []
+        if self.data == other.data:
+            return changes
+        for param, getter in (('global_channel', scene.get_global_channel), ('control_mode', scene.get_control_mode), ('led_mode', scene.get_led_mode), ('scene_name', scene.get_scene_name)):
+            value, other_value = getter(self), getter(other)
+            if value != other_value:
+                changes.append((None, None, param, value, other_value))
+        map = control_map[self.device_type]
+        for group_offset in map['groups'] + [map['transport']]:
+            if self.data[group_offset] != other.data[group_offset]:
+                changes.append((group_offset, None, 'channel', self.data[group_offset], other.data[group_offset]))
+        for group, group_offset, control in get_controls(self.device_type):
+            for param in get_control_params(self.device_type, control, group is None):
+                offset = self._params[(group_offset, control, param)][0]
+                if self.data[offset] != other.data[offset]:
+                    changes.append((group_offset, control, param, self.data[offset], other.data[offset]))
+        return changes
+
+
+    # Set data from MIDI sysex format data
+    # Convert raw 7-bit MIDI data to Korg 8-bit data
+    # Raw data: 1st byte holds bit-7 of subsequent bytes, next 7 bytes hold bits 0..7 of each byte
+    #   data: raw 7-bit MIDI data (multiple 8 x 7-bit blocks of data)
+    def set_data(self, data):
+        if len(data) != self.device_types[self.device_type]['sysex_len']:
+            import logging # Deferred import keeps library import time low
+            logging.warning('Received wrong length data dump')
+            return
+        self.data = decode_korg_7bit(data)
+
+
+    # Get scene name
+    #   returns: Scene name
+    #   nanoKONTROL1 only
+    def get_scene_name(self):
+        if self.device_type == 'nanoKONTROL1':
+            return self.data[:12].decode('latin-1')
+        return ''
+
+
+    # Set scene name
+    #   name: Scene name (12 characters)
+    #   nanoKONTROL1 only
+    def set_scene_name(self, name):
+        if self.device_type == 'nanoKONTROL1':
+            self.data[:12] = name[:12].ljust(12).encode('latin-1', 'replace')
+
+
+    # Get global MIDI channel
+    #   returns: MIDI channel
+    def get_global_channel(self):
+        return self.data[device_types[self.device_type]['global_channel_offset']]
+
+
+    # Set global MIDI channel
+    #   chan: MIDI channel
+    def set_global_channel(self, chan):
+        if chan < 16:
+            self.data[device_types[self.device_type]['global_channel_offset']] = chan
+
+
+    # Get control mode
+    #   returns: Control mode [0:CC, 1:Cubase, 2:DP, 3:Live, 4:ProTools, 5:SONAR]
+    #   nanoKONTROL2 only
+    def get_control_mode(self):
+        if self.device_type == 'nanoKONTROL2':
+            return self.data[1]
+        return 0
+
+
+    # Set control mode
+    #   mode: Control mode [0:CC, 1:Cubase, 2:DP, 3:Live, 4:ProTools, 5:SONAR]
+    #   nanoKONTROL2 only
+    def set_control_mode(self, mode):
+        if self.device_type == 'nanoKONTROL2' and mode < 6:
+            self.data[1] = mode
+        return 0
+
+
+    # Get LED mode
+    #   returns: LED mode [0:Internal, 1:External]
+    #   nanoKONTROL2 only
+    def get_led_mode(self):
+        if self.device_type == 'nanoKONTROL2':
+            return self.data[2]
+        return 0
+
+
+    # Set LED mode
+    #   mode: LED mode [0:Internal, 1:External]
+    #   nanoKONTROL2 only
+    def set_led_mode(self, mode):
+        if self.device_type == 'nanoKONTROL2' and mode <= 1:
+            self.data[2] = mode
+        return 0
+
+
+    # Get group MIDI channel
+    #   group_offset: Offset of the group within dataset
+    #   returns: MIDI channel
+    def get_group_channel(self, group_offset):
+        return self.data[group_offset]
+
+
+    # Set group MIDI channel
+    #   group_offset: Offset of the group within dataset
+    #   chan: MIDI channel
+    def set_group_channel(self, group_offset, chan):
+        self.data[group_offset] = chan
+
+
+    # Get MIDI channel a group's controls send on
+    #   group_offset: Offset of the group within dataset
+    #   returns: Group MIDI channel or global MIDI channel if group uses global channel (16)
+    def get_effective_channel(self, group_offset):
+        chan = self.data[group_offset]
+        if chan > 15:
+            return self.get_global_channel()
+        return chan
+
+
+    # Get MIDI message sent by a control
+    #   group_offset: Offset of group / transport
+    #   control: Control name, e.g. 'button_a'
+    #   returns: (chan, assign, cmd) where assign is 1 for CC, 2 for note or None if control is disabled or sends MMC
+    def get_assignment(self, group_offset, control):
+        assign = self.get_control_parameter(group_offset, control, 'assign')
+        if assign == 0 or assign == 2 and self.device_type == 'nanoKONTROL1' and group_offset == control_map['nanoKONTROL1']['transport']:
+            return None
+        return (self.get_effective_channel(group_offset), assign, self.get_control_parameter(group_offset, control, 'cmd'))
+
+
+    # Get index of controls by the MIDI message they send
+    #   returns: Dictionary of lists of (group, group_offset, control) indexed by (chan, assign, cmd)
+    def get_control_index(self):
+        index = {}
+        for assignment, control in get_assignments(self.device_type, self.data):
+            index.setdefault(assignment, []).append(control)
+        return index
+
+
+    # Get control parameter
+    #   group_offset: Offset of group / transport
+    #   control: Control name, e.g. 'button_a'
+    #   param: Control parameter ['assign', 'behaviour', 'transport_behaviour', 'cmd', 'min', 'max']
+    #   returns: Parameter value or 0 if parameter not available
+    def get_control_parameter(self, group_offset, control, param):
+        entry = self._params.get((group_offset, control, param))
+        if entry is None:
+            return 0
+        return self.data[entry[0]]
+
+
+    # Set control parameter
+    #   group_offset: Offset of group / transport
+    #   control: Control name, e.g. 'button_a'
+    #   param: Control parameter ['assign', 'behaviour', 'transport_behaviour', 'cmd', 'min', 'max']
+    #   value: Parameter value
+    #   returns: True on success, False if parameter not available or value out of range
+    def set_control_parameter(self, group_offset, control, param, value):
+        entry = self._params.get((group_offset, control, param))
+        if entry is None or value < 0 or value > entry[1]:
+            return False
+        self.data[entry[0]] = value
+        return True
+
+
+    # Get many control parameters
+    #   params: Iterable of (group_offset, control, param)
+    #   returns: List of parameter values (0 where parameter not available)
+    def get_many(self, params):
+        data = self.data
+        table = self._params
+        return [data[table[key][0]] if key in table else 0 for key in params]
+
+
+    # Set many control parameters
+    #   params: Iterable of (group_offset, control, param, value)
+    #   returns: True if all parameters were set
+    def set_many(self, params):
+        data = self.data
+        table = self._params
+        success = True
+        for group_offset, control, param, value in params:
+            entry = table.get((group_offset, control, param))
+            if entry is None or value < 0 or value > entry[1]:
+                success = False
+                continue
+            data[entry[0]] = value
+        return success
@@ -0,0 +1,283 @@
+# Device session - state of one connected nanoKONTROL
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# A session owns the scene, backup (last download), ports, global MIDI channel
+# and in-flight transactions of one device. Many sessions may share a single
+# JACK / ALSA client - the owner routes each received message to the session
+# whose input port it arrived on with SessionRouter and gives each session a
+# send function that only reaches that session's output port.
+#
+# Scenes downloaded from a nanoKONTROL1 are cached by scene index so that
+# changing scene from the application is served from the cache instead of a
+# dump. A cached scene is invalidated when it is written or when the device
+# changes to it without being asked (it may have been edited elsewhere).
+#
+# Dependencies: None
+
+from concurrent.futures import Future
+from nanokonfig.scene import scene
+from nanokonfig import protocol
+from nanokonfig.transaction import TransactionManager
+
+class DeviceSession:
+    #   send: Function(msg) sending a raw MIDI message to this device only
+    #   device_type: Initial device type (default: nanoKONTROL2)
+    #   input: Identifier of port receiving from the device
+    #   output: Identifier of port sending to the device
+    #   echo_id: Identifier used in device search
+    #   timeout: Seconds to wait for each reply
+    #   retries: Quantity of times to resend a search or dump that is not answered (uploads and writes are not resent)
+    def __init__(self, send, device_type='nanoKONTROL2', input=None, output=None, echo_id=0, timeout=1.0, retries=2):
+        self.scene = scene(device_type)
+        self.backup = scene(device_type) # Scene data last downloaded from device
+        self.current_scene = 0 # Index of current scene (nanoKONTROL1)
+        self.input = input
+        self.output = output
+        self.echo_id = echo_id
+        self.device_info = None # Last device search reply
+        self.scene_cache = {} # Scene data downloaded from device indexed by scene index (nanoKONTROL1)
+        self._scene_requests = [] # Scene indexes requested by change_scene awaiting device confirmation
+        self._write_index = None # Index of scene being written
+        self.transactions = TransactionManager(send, timeout, retries)
+        self.parser = protocol.MidiParser(echo_id)
+        self.handlers = {
+            'inquiry_reply': self._on_inquiry_reply,
+            'search_reply': self._on_search_reply,
+            'dump': self._on_dump,
+            'scene_change': self._on_scene_change,
+            'write_ack': self._on_write_ack
+        }
+
+
+    # Get global MIDI channel of device
+    @property
+    def global_midi_chan(self):
+        return self.scene.global_midi_chan
+
+
+    # Get LED mode of scene data last known to be on device, i.e. the mode the device is using
+    #   returns: LED mode [0:Internal, 1:External] or None if device data unknown (always 0 for nanoKONTROL1)
+    def get_device_led_mode(self):
+        data = self.scene.get_synced_data()
+        if data is None or len(data) != len(self.scene.data):
+            return None
+        return scene(self.scene.device_type, data).get_led_mode()
+
+
+    # Handle a MIDI message received from this device
+    #   data: Raw MIDI message
+    #   returns: Parsed message or None if not recognised
+    def handle_midi(self, data):
+        msg = self.parser.parse(data, self.scene.global_midi_chan)
+        if msg is None:
+            return None
+        # Apply reply to session before resolving its transaction - future callbacks run synchronously and expect updated state
+        handler = self.handlers.get(msg['type'])
+        if handler:
+            handler(msg)
+        self.transactions.handle_reply(msg)
+        return msg
+
+
+    def _on_inquiry_reply(self, msg):
+        self.scene.global_midi_chan = msg['chan']
+
+
+    def _on_search_reply(self, msg):
+        self.scene.global_midi_chan = msg['chan']
+        if msg['device_type']:
+            self.scene.set_device_type(msg['device_type'])
+        self.device_info = msg
+
+
+    def _on_dump(self, msg):
+        self.scene.set_device_type(msg['device_type'])
+        self.scene.set_data(msg['payload'])
+        self.scene.mark_synced()
+        self.backup.set_device_type(msg['device_type'])
+        self.backup.data = self.scene.data.copy()
+        if self.scene.device_type == 'nanoKONTROL1':
+            self.scene_cache[self.current_scene] = bytes(self.scene.data)
+
+
+    # Handle scene change, loading scene from cache if change was requested and scene has no local edits
+    # Adds 'loaded' to msg: True if scene data was loaded from cache
+    def _on_scene_change(self, msg):
+        index = msg['scene'] if 0 <= msg['scene'] <= 3 else 0
+        synced = self.scene.is_synced()
+        self.scene.clear_synced()
+        self.current_scene = index
+        msg['loaded'] = False
+        if index in self._scene_requests:
+            self._scene_requests.remove(index)
+            data = self.scene_cache.get(index)
+            if data is not None and synced:
+                self.scene.data = bytearray(data)
+                self.scene.mark_synced()
+                msg['loaded'] = True
+        else:
+            self.scene_cache.pop(index, None) # Changed on device so may have been edited elsewhere
+
+
+    def _on_write_ack(self, msg):
+        self.scene_cache.pop(self._write_index, None)
+
+
+    # Search for device
+    #   returns: Future resolved with 'search_reply'
+    def search(self, **kwargs):
+        return self.transactions.search(self.echo_id, **kwargs)
+
+
+    # Download current scene from device
+    #   returns: Future resolved with 'dump' reply
+    def dump(self, **kwargs):
+        return self.transactions.dump(self.scene, **kwargs)
+
+
+    # Upload scene to device, skipped if device already has the scene data
+    #   force: True to upload even if device already has the scene data
+    #   returns: Future resolved with 'load_ack' reply (or None if upload was skipped)
+    def upload(self, force=False, **kwargs):
+        if not force and self.scene.is_synced():
+            future = Future()
+            future.set_result(None)
+            return future
+        data = bytes(self.scene.data)
+        future = self.transactions.upload(self.scene, **kwargs)
+        future.add_done_callback(lambda future: self._on_upload_done(data, future))
+        return future
+
+
+    def _on_upload_done(self, data, future):
+        if not future.cancelled() and future.exception() is None:
+            self.scene.mark_synced(data)
+
+
+    # Save uploaded scene on device
+    #   scene_index: Index of scene to write [0..3] (nanoKONTROL1 only, default: current scene)
+    #   returns: Future resolved with 'write_ack' reply
+    def write(self, scene_index=None, **kwargs):
+        if scene_index is None:
+            scene_index = self.current_scene
+        self._write_index = scene_index
+        return self.transactions.write(self.scene, scene_index, **kwargs)
+
+
+    # Change current scene (nanoKONTROL1)
+    #   scene_index: Index of scene [0..3]
+    #   returns: Future resolved with 'scene_change' reply
+    def change_scene(self, scene_index, **kwargs):
+        msg = protocol.scene_change_request(self.scene, scene_index)
+        if msg is None:
+            raise ValueError('Invalid scene index {}'.format(scene_index))
+        self._scene_requests.append(scene_index)
+        kwargs.setdefault('match', lambda reply: reply['scene'] == scene_index)
+        future = self.transactions.request(msg, ('scene_change',), **kwargs)
+        future.add_done_callback(lambda future: self._on_change_scene_done(scene_index, future))
+        return future
+
+
+    # Forget a scene change request that failed so a later change on the device is not treated as requested
+    def _on_change_scene_done(self, scene_index, future):
+        if (future.cancelled() or future.exception() is not None) and scene_index in self._scene_requests:
+            self._scene_requests.remove(scene_index)
+
+
+    # Download all scenes (nanoKONTROL1)
+    # Each scene change is sent with the following dump request and the next scene is requested
+    # as soon as the dump arrives. The device is returned to its original scene afterwards.
+    #   returns: Future resolved with scene_cache (scene data indexed by scene index)
+    def fetch_all_scenes(self):
+        result = Future()
+        if self.scene.device_type != 'nanoKONTROL1':
+            result.set_exception(ValueError('{} has only one scene'.format(self.scene.device_type)))
+            return result
+        original = self.current_scene
+
+        def fetch(index):
+            if index > 3:
+                self.change_scene(original).add_done_callback(on_return)
+                return
+            self.change_scene(index)
+            self.dump().add_done_callback(lambda future: on_dump(index, future))
+
+        def on_dump(index, future):
+            if future.cancelled():
+                result.cancel()
+            elif future.exception():
+                result.set_exception(future.exception())
+            elif self.current_scene != index:
+                result.set_exception(TimeoutError('Device did not change to scene {}'.format(index + 1)))
+            else:
+                fetch(index + 1)
+
+        def on_return(future):
+            if future.cancelled():
+                result.cancel()
+            elif future.exception():
+                result.set_exception(future.exception())
+            else:
+                result.set_result(self.scene_cache)
+
+        fetch(0)
+        return result
+
+
+    # Resend or fail timed out requests
+    #   returns: Seconds until next timeout or None if no requests are pending
+    def poll(self):
+        return self.transactions.poll()
+
+
+# Route received MIDI messages to sessions by the port they arrived on
+class SessionRouter:
+    def __init__(self):
+        self.sessions = {} # Sessions indexed by input port
+
+    # Add a session
+    #   session: DeviceSession with input port set
+    def add(self, session):
+        self.sessions[session.input] = session
+
+
+    # Remove a session
+    #   session: DeviceSession to remove
+    def remove(self, session):
+        if self.sessions.get(session.input) is session:
+            del self.sessions[session.input]
+
+
+    # Get session receiving from a port
+    #   input: Input port identifier
+    #   returns: DeviceSession or None if no session uses the port
+    def get(self, input):
+        return self.sessions.get(input)
+
+
+    # Handle a received MIDI message
+    #   data: Raw MIDI message
+    #   input: Identifier of port message was received on
+    #   returns: (session, parsed message) or None if no session uses the port
+    def handle_midi(self, data, input):
+        session = self.sessions.get(input)
+        if session is None:
+            return None
+        return session, session.handle_midi(data)
+
+
+    # Resend or fail timed out requests of all sessions
+    def poll(self):
+        for session in list(self.sessions.values()):
+            session.poll()
+
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
@@ -0,0 +1,182 @@
+# Request / response transactions with nanoKONTROL devices
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Each request is sent immediately and returns a future that is resolved when
+# a matching reply (parsed by protocol.parse_midi) is passed to handle_reply.
+# Requests may be pipelined - replies are matched to the oldest pending request
+# expecting that reply type. Requests without a reply are resent until their
+# retries are exhausted then fail with TimeoutError. Upload and write are not
+# resent by default: they change device state and their acks carry no request
+# identifier, so a slow ack to one attempt would be taken as the ack to the next.
+#
+# The owner must pass received replies to handle_reply and call poll
+# periodically, e.g. from a Tk after() loop or a command line read loop.
+#
+# Dependencies: None
+
+from concurrent.futures import Future
+from time import monotonic
+from nanokonfig import protocol
+
+# Exception raised (set on future) when a device rejects a request (NAK)
+class TransactionError(Exception):
+    #   reply: Parsed reply that rejected the request
+    def __init__(self, reply):
+        super().__init__('Device replied {}'.format(reply['type']))
+        self.reply = reply
+
+
+# A single request awaiting reply
+class Transaction:
+    __slots__ = ('msg', 'success', 'failure', 'match', 'timeout', 'retries', 'attempts', 'deadline', 'future')
+
+    def __init__(self, msg, success, failure, match, timeout, retries):
+        self.msg = msg # Raw MIDI message to send
+        self.success = success # Reply types that complete the request
+        self.failure = failure # Reply types that reject the request
+        self.match = match # Optional function(reply) returning True if reply belongs to this request
+        self.timeout = timeout # Seconds to wait for each reply
+        self.retries = retries # Quantity of times to resend after timeout
+        self.attempts = 0 # Quantity of times request has been sent
+        self.deadline = 0 # Time when current attempt times out
+        self.future = Future()
+
+
+class TransactionManager:
+    #   send: Function to send a raw MIDI message
+    #   timeout: Default seconds to wait for each reply
+    #   retries: Default quantity of times to resend a request that is not answered
+    #   clock: Function returning current time in seconds (default: time.monotonic)
+    def __init__(self, send, timeout=1.0, retries=2, clock=monotonic):
+        self.send = send
+        self.timeout = timeout
+        self.retries = retries
+        self.clock = clock
+        self.pending = [] # Transactions awaiting reply, oldest first
+        self.stats = {'sent': 0, 'retries': 0, 'completed': 0, 'rejected': 0, 'timeouts': 0}
+
+
+    # Get quantity of transactions awaiting reply
+    def __len__(self):
+        return len(self.pending)
+
+
+    # Send a request and wait for a reply
+    #   msg: Raw MIDI message to send
+    #   success: Iterable of reply types that complete the request
+    #   failure: Iterable of reply types that reject the request (default: none)
+    #   match: Optional function(reply) returning True if reply belongs to this request
+    #   timeout: Seconds to wait for each reply (default: manager default)
+    #   retries: Quantity of times to resend after timeout (default: manager default)
+    #   returns: Future resolved with the parsed reply or failed with TransactionError or TimeoutError
+    def request(self, msg, success, failure=(), match=None, timeout=None, retries=None):
+        transaction = Transaction(msg, tuple(success), tuple(failure), match,
+            self.timeout if timeout is None else timeout,
+            self.retries if retries is None else retries)
+        self.pending.append(transaction)
+        self._send(transaction)
+        return transaction.future
+
+
+    # Send (or resend) a transaction's message and restart its timer
+    def _send(self, transaction):
+        transaction.attempts += 1
+        transaction.deadline = self.clock() + transaction.timeout
+        self.stats['sent'] += 1
+        self.send(transaction.msg)
+
+
+    # Match a received reply to the oldest pending transaction expecting it
+    #   reply: Parsed MIDI message from protocol.parse_midi
+    #   returns: True if reply completed or rejected a transaction
+    def handle_reply(self, reply):
+        if not reply or not self.pending:
+            return False
+        type = reply['type']
+        for transaction in self.pending:
+            if transaction.future.done():
+                continue # Cancelled by requester
+            if type not in transaction.success and type not in transaction.failure:
+                continue
+            if transaction.match and not transaction.match(reply):
+                continue
+            self.pending.remove(transaction)
+            if type in transaction.success:
+                self.stats['completed'] += 1
+                transaction.future.set_result(reply)
+            else:
+                self.stats['rejected'] += 1
+                transaction.future.set_exception(TransactionError(reply))
+            return True
+        return False
+
+
+    # Resend or fail transactions that have timed out and discard cancelled transactions
+    #   returns: Seconds until next timeout or None if no transactions are pending
+    def poll(self):
+        now = self.clock()
+        next_deadline = None
+        for transaction in list(self.pending):
+            if transaction.future.done():
+                self.pending.remove(transaction)
+                continue
+            if now >= transaction.deadline:
+                if transaction.attempts <= transaction.retries:
+                    self.stats['retries'] += 1
+                    self._send(transaction)
+                else:
+                    self.pending.remove(transaction)
+                    self.stats['timeouts'] += 1
+                    transaction.future.set_exception(TimeoutError('No reply after {} attempts'.format(transaction.attempts)))
+                    continue
+            if next_deadline is None or transaction.deadline < next_deadline:
+                next_deadline = transaction.deadline
+        if next_deadline is None:
+            return None
+        return max(0, next_deadline - now)
+
+
+    # Cancel all pending transactions
+    def cancel_all(self):
+        for transaction in self.pending:
+            transaction.future.cancel()
+        self.pending = []
+
+
+    ## Device commands ##
+
+    # Request current scene data dump
+    #   scene: Scene object providing global MIDI channel and device type
+    #   returns: Future resolved with 'dump' reply
+    def dump(self, scene, **kwargs):
+        return self.request(protocol.dump_request(scene), ('dump',), **kwargs)
+
+
+    # Upload scene data to device 'current scene'
+    # Not resent unless retries is given
+    #   scene: Scene object to upload
+    #   returns: Future resolved with 'load_ack' reply or failed on 'load_nak'
+    def upload(self, scene, **kwargs):
+        kwargs.setdefault('retries', 0)
+        return self.request(protocol.scene_data(scene), ('load_ack',), ('load_nak',), **kwargs)
+
+
+    # Save current temporary scene data on device
+    # Not resent unless retries is given
+    #   scene: Scene object providing global MIDI channel and device type
+    #   scene_index: Index of scene to write [0..3] (nanoKONTROL1 only)
+    #   returns: Future resolved with 'write_ack' reply or failed on 'write_nak'
+    def write(self, scene, scene_index=0, **kwargs):
+        kwargs.setdefault('retries', 0)
+        return self.request(protocol.scene_write_request(scene, scene_index), ('write_ack',), ('write_nak',), **kwargs)
+
+
+    # Search for devices
+    #   echo_id: Identifier echoed in device reply
+    #   returns: Future resolved with first 'search_reply'
+    def search(self, echo_id=0, **kwargs):
+        kwargs.setdefault('match', lambda reply: reply['echo_id'] == echo_id)
+        return self.request(protocol.device_search(echo_id), ('search_reply',), **kwargs)
@@ -0,0 +1,91 @@
+# Simulated nanoKONTROL for tests
+#
+# Copyright: riban ltd (riban.co.uk)
+# Licencse: GPL V3.0
+# Source: https://github.com/riban-bw/nanoKONTROL-Config
+#
+# Answers device search, dump, upload, write and scene change requests like a
+# real device, including ignoring command lists sent on another global MIDI
+# channel. Replies are queued until deliver() is called, as a device replies
+# after the request has been sent.
+
+from nanokonfig.scene import scene, device_types, control_map
+from nanokonfig import protocol
+
+class FakeDevice:
+    #   device_type: Device type ['nanoKONTROL1', 'nanoKONTROL2']
+    #   chan: Global MIDI channel [0..15]
+    def __init__(self, device_type, chan=0):
+        self.device_type = device_type
+        self.chan = chan
+        self.scenes = [scene(device_type) for i in range(4 if device_type == 'nanoKONTROL1' else 1)]
+        for index, s in enumerate(self.scenes):
+            # Differ from default scene and from each other
+            s.global_midi_chan = chan
+            s.set_global_channel(chan)
+            s.set_control_parameter(control_map[device_type]['groups'][0], 'slider', 'cmd', 100 + index)
+        self.current_scene = 0
+        self.received = [] # Raw messages received
+        self.ignored = [] # Raw messages not answered
+        self.replies = [] # Raw replies awaiting delivery
+        self.written = [] # Indexes of scenes saved by write requests
+        self.mute = False # True to ignore all requests
+
+
+    # Get the current scene
+    @property
+    def scene(self):
+        return self.scenes[self.current_scene]
+
+
+    # Receive a MIDI message from the application
+    #   msg: Raw MIDI message
+    def send(self, msg):
+        msg = bytes(msg)
+        self.received.append(msg)
+        if self.mute:
+            self.ignored.append(msg)
+            return
+        if msg[:4] == b'\xF0\x42\x50\x00':
+            family_id = device_types[self.device_type]['family_id']
+            self.replies.append(bytes((0xF0, 0x42, 0x50, 0x01, self.chan, msg[4], family_id & 0x7F, family_id >> 7, 0, 0, 1, 0, 1, 0, 0xF7)))
+            return
+        header = bytes((0xF0, 0x42, 0x40 | self.chan) + device_types[self.device_type]['sysex_id'])
+        if msg[:7] != header:
+            self.ignored.append(msg)
+            return
+        command = msg[7:-1]
+        if command[:3] == b'\x1F\x10\x00':
+            self.replies.append(protocol.scene_data(self.scene))
+        elif command[:6] == bytes(protocol.dump_headers[self.device_type]):
+            self.scene.set_data(command[6:])
+            self.replies.append(header + b'\x5F\x23\x00\xF7')
+        elif command[:2] == b'\x1F\x11':
+            index = command[2] if len(self.scenes) > 1 else 0
+            self.scenes[index] = self.scene.copy()
+            self.written.append(index)
+            self.replies.append(header + b'\x5F\x21\x00\xF7')
+        elif command[:2] == b'\x1F\x14' and len(self.scenes) > 1:
+            self.current_scene = command[2]
+            self.replies.append(header + bytes((0x5F, 0x4F, command[2])) + b'\xF7')
+        else:
+            self.ignored.append(msg)
+
+
+    # Change scene using scene button (nanoKONTROL1)
+    #   index: Scene index [0..3]
+    def press_scene(self, index):
+        self.current_scene = index
+        header = bytes((0xF0, 0x42, 0x40 | self.chan) + device_types[self.device_type]['sysex_id'])
+        self.replies.append(header + bytes((0x5F, 0x4F, index)) + b'\xF7')
+
+
+    # Deliver queued replies
+    #   handle_midi: Function(data) receiving each reply
+    #   returns: Quantity of replies delivered
+    def deliver(self, handle_midi):
+        count = 0
+        while self.replies:
+            handle_midi(self.replies.pop(0))
+            count += 1
+        return count
@@ -0,0 +1,56 @@
+import unittest
+from nanokonfig.bulkedit import apply_pattern, get_pattern_params
+from nanokonfig.scene import scene, control_map
+
+class TestBulkEdit(unittest.TestCase):
+    def test_numbering_order(self):
+        s = scene('nanoKONTROL2')
+        groups = control_map['nanoKONTROL2']['groups']
+        self.assertEqual(apply_pattern(s, ['slider', 'knob'], [0, 1], 20), 4)
+        self.assertEqual([s.get_control_parameter(groups[group], control, 'cmd') for control in ('slider', 'knob') for group in (0, 1)], [20, 21, 22, 23])
+        apply_pattern(s, ['mute'], range(8), 60, step=2, assign=2, min=1, max=100, behaviour=1)
+        for group in range(8):
+            self.assertEqual([s.get_control_parameter(groups[group], 'mute', param) for param in ('cmd', 'assign', 'min', 'max', 'behaviour')], [60 + 2 * group, 2, 1, 100, 1])
+
+
+    def test_group_channel(self):
+        s = scene('nanoKONTROL2')
+        groups = control_map['nanoKONTROL2']['groups']
+        params, channels = get_pattern_params('nanoKONTROL2', ['slider', 'knob'], [0, 1], 0, chan=2)
+        self.assertEqual(channels, [(groups[0], 2), (groups[1], 2)]) # Once per group
+        apply_pattern(s, ['slider'], [1], 0, chan=16)
+        self.assertEqual(s.get_group_channel(groups[1]), 16)
+        self.assertEqual(s.get_group_channel(groups[2]), 16)
+        apply_pattern(s, ['slider'], [1], 0, chan=2)
+        self.assertEqual(s.get_group_channel(groups[1]), 2)
+
+
+    def test_transport(self):
+        s = scene('nanoKONTROL1')
+        transport = control_map['nanoKONTROL1']['transport']
+        apply_pattern(s, ['play', 'stop'], [None], 100, min=5, behaviour=1)
+        self.assertEqual(s.get_control_parameter(transport, 'play', 'cmd'), 100)
+        self.assertEqual(s.get_control_parameter(transport, 'stop', 'cmd'), 101)
+        self.assertEqual(s.get_control_parameter(transport, 'play', 'transport_behaviour'), 1) # nanoKONTROL1 transport has no min or behaviour
+        s = scene('nanoKONTROL2')
+        apply_pattern(s, ['play'], [None], 100, min=5, behaviour=1)
+        transport = control_map['nanoKONTROL2']['transport']
+        self.assertEqual([s.get_control_parameter(transport, 'play', param) for param in ('cmd', 'min', 'behaviour')], [100, 5, 1])
+
+
+    def test_invalid_pattern_leaves_scene_unchanged(self):
+        for controls, groups, kwargs in (
+                (['slider'], range(8), {'start': 125}), # CC exceeds 127
+                (['slider'], [8], {'start': 0}), # No group 9
+                (['button_a'], [0], {'start': 0}), # nanoKONTROL1 only
+                (['slider'], [0, 1], {'start': 0, 'chan': 17}),
+                (['slider'], [0], {'start': 0, 'max': 128})):
+            with self.subTest(controls=controls, groups=groups, kwargs=kwargs):
+                s = scene('nanoKONTROL2')
+                with self.assertRaises(ValueError):
+                    apply_pattern(s, controls, groups, **kwargs)
+                self.assertEqual(s.data, scene('nanoKONTROL2').data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from nanokonfig.cli import DeviceJob
+from nanokonfig.scene import scene, control_map
+from nanokonfig.session import DeviceSession
+from tests.fakedevice import FakeDevice
+
+class TestDeviceJob(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'scene.bin')
+
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+
+    # Run a command on a simulated device
+    #   device: FakeDevice
+    #   command: Command to run
+    #   scene_index: Index of scene to write (nanoKONTROL1)
+    #   returns: Finished DeviceJob
+    def run_job(self, device, command, scene_index=None):
+        session = DeviceSession(device.send)
+        job = DeviceJob(session, command, self.path, scene_index)
+        job.run()
+        while device.deliver(session.handle_midi):
+            pass
+        self.assertIsNotNone(job.duration, job.result)
+        self.assertEqual(device.ignored, [])
+        return job
+
+
+    def test_dump_and_verify(self):
+        for device_type in ('nanoKONTROL1', 'nanoKONTROL2'):
+            with self.subTest(device_type=device_type):
+                device = FakeDevice(device_type, chan=3)
+                job = self.run_job(device, 'dump')
+                self.assertTrue(job.ok, job.result)
+                with open(self.path, 'rb') as f:
+                    self.assertEqual(f.read(), bytes(device.scene.data))
+                job = self.run_job(device, 'verify')
+                self.assertTrue(job.ok, job.result)
+
+
+    def test_verify_mismatch(self):
+        for device_type in ('nanoKONTROL1', 'nanoKONTROL2'):
+            with self.subTest(device_type=device_type):
+                device = FakeDevice(device_type, chan=3)
+                with open(self.path, 'wb') as f:
+                    f.write(scene(device_type).data)
+                job = self.run_job(device, 'verify')
+                self.assertFalse(job.ok)
+
+
+    def test_upload_and_write(self):
+        for device_type in ('nanoKONTROL1', 'nanoKONTROL2'):
+            for command in ('upload', 'write'):
+                with self.subTest(device_type=device_type, command=command):
+                    device = FakeDevice(device_type, chan=3)
+                    data = scene(device_type)
+                    data.set_control_parameter(control_map[device_type]['groups'][1], 'knob', 'cmd', 42)
+                    with open(self.path, 'wb') as f:
+                        f.write(data.data)
+                    job = self.run_job(device, command, 2 if device_type == 'nanoKONTROL1' else None)
+                    self.assertTrue(job.ok, job.result)
+                    self.assertEqual(bytes(device.scene.data), bytes(data.data))
+                    if command == 'write':
+                        self.assertEqual(device.written, [2 if device_type == 'nanoKONTROL1' else 0])
+                        self.assertEqual(bytes(device.scenes[device.written[0]].data), bytes(data.data))
+
+
+    def test_write_requires_scene_index(self):
+        device = FakeDevice('nanoKONTROL1', chan=3)
+        device.current_scene = 1
+        with open(self.path, 'wb') as f:
+            f.write(scene('nanoKONTROL1').data)
+        job = self.run_job(device, 'write')
+        self.assertFalse(job.ok)
+        self.assertIn('--scene-index', job.result)
+        self.assertEqual(device.written, [])
+        self.assertNotEqual(bytes(device.scene.data), bytes(scene('nanoKONTROL1').data)) # Not uploaded
+
+
+    def test_no_reply(self):
+        device = FakeDevice('nanoKONTROL2', chan=3)
+        device.mute = True
+        session = DeviceSession(device.send, timeout=0, retries=0)
+        job = DeviceJob(session, 'dump', self.path)
+        job.run()
+        session.poll()
+        self.assertFalse(job.ok)
+        self.assertEqual(job.result, 'No reply from device')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import random
+import unittest
+from nanokonfig.scene import scene
+from nanokonfig.codec import encode_korg_7bit, decode_korg_7bit, encode_many, decode_many, encoded_length, decoded_length
+
+# Encoding of original scene.get_midi_data
+def encode_baseline(data):
+    sysex = ()
+    for offset in range(0, len(data), 7):
+        block = data[offset:offset+7]
+        b0 = 0
+        for b in range(len(block)):
+            b0 |= ((block[b] & 0x80) >> (7 - b))
+        sysex += (b0,)
+        for word in block:
+            sysex += (word & 0x7F,)
+    return bytes(sysex)
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.random = random.Random(1)
+
+
+    def test_encode_matches_baseline(self):
+        # 256 (nanoKONTROL1) and 339 (nanoKONTROL2) end with partial blocks of 4 and 3 bytes
+        for length in (0, 1, 6, 7, 8, 14, 256, 339):
+            with self.subTest(length=length):
+                data = bytes(self.random.randrange(256) for i in range(length))
+                encoded = encode_korg_7bit(data)
+                self.assertEqual(encoded, encode_baseline(data))
+                self.assertEqual(len(encoded), encoded_length(length))
+                self.assertTrue(all(b < 0x80 for b in encoded))
+
+
+    def test_scene_lengths(self):
+        self.assertEqual(encoded_length(256), 36 * 8 + 1 + 4)
+        self.assertEqual(encoded_length(339), 48 * 8 + 1 + 3)
+        self.assertEqual(decoded_length(293), 256)
+        self.assertEqual(decoded_length(388), 339)
+
+
+    def test_round_trip(self):
+        for length in (1, 5, 7, 13, 256, 339):
+            with self.subTest(length=length):
+                data = bytes(self.random.randrange(256) for i in range(length))
+                self.assertEqual(decode_korg_7bit(encode_korg_7bit(data)), data)
+                self.assertEqual(decode_korg_7bit(memoryview(encode_korg_7bit(data))), data)
+                self.assertEqual(decode_korg_7bit(list(encode_korg_7bit(list(data)))), data)
+
+
+    def test_high_bits(self):
+        data = bytes((0x80, 0xFF, 0x00, 0x81, 0x7F, 0xC0, 0x01, 0xFE, 0x80))
+        self.assertEqual(encode_korg_7bit(data), bytes((0b0101011, 0x00, 0x7F, 0x00, 0x01, 0x7F, 0x40, 0x01, 0b11, 0x7E, 0x00)))
+        self.assertEqual(decode_korg_7bit(encode_korg_7bit(data)), data)
+
+
+    def test_many(self):
+        bufs = [bytes(self.random.randrange(256) for i in range(length)) for length in (256, 339, 3, 7, 0)]
+        encoded = encode_many(bufs)
+        self.assertEqual(encoded, [encode_korg_7bit(buf) for buf in bufs])
+        self.assertEqual(decode_many(encoded), bufs)
+
+
+    def test_scene_midi_data(self):
+        for device_type in ('nanoKONTROL1', 'nanoKONTROL2'):
+            with self.subTest(device_type=device_type):
+                s = scene(device_type)
+                s.data = bytearray(self.random.randrange(256) for i in range(len(s.data)))
+                midi_data = s.get_midi_data()
+                self.assertEqual(bytes(midi_data), encode_baseline(s.data))
+                copy = scene(device_type)
+                copy.set_data(midi_data)
+                self.assertEqual(copy.data, s.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import random
+import unittest
+from nanokonfig.conflicts import ConflictTracker
+from nanokonfig.scene import scene, control_map, get_controls
+
+class TestConflictTracker(unittest.TestCase):
+    def setUp(self):
+        self.scene = scene('nanoKONTROL2')
+        self.tracker = ConflictTracker()
+        self.tracker.rebuild(self.scene)
+        self.tracker.get_changes()
+        self.groups = control_map['nanoKONTROL2']['groups']
+
+
+    def test_default_scene_has_no_conflicts(self):
+        self.assertEqual(self.tracker.get_conflicted(), [])
+        self.assertFalse(self.tracker.is_conflicted(0, 'slider'))
+
+
+    def test_conflict_and_resolve(self):
+        self.scene.set_control_parameter(self.groups[1], 'knob', 'cmd', 0) # Same CC as slider 1
+        self.tracker.update_control(self.scene, 1, self.groups[1], 'knob')
+        self.assertTrue(self.tracker.is_conflicted(1, 'knob'))
+        self.assertEqual(self.tracker.get_conflicts(0, 'slider'), [(1, 'knob')])
+        self.assertEqual(self.tracker.get_changes(), {(1, 'knob'), (0, 'slider')})
+        self.assertEqual(self.tracker.get_changes(), set())
+        self.scene.set_control_parameter(self.groups[1], 'knob', 'assign', 0) # Disabled
+        self.tracker.update_control(self.scene, 1, self.groups[1], 'knob')
+        self.assertFalse(self.tracker.is_conflicted(0, 'slider'))
+        self.assertEqual(self.tracker.get_conflicts(1, 'knob'), [])
+        self.assertEqual(self.tracker.get_changes(), {(1, 'knob'), (0, 'slider')})
+
+
+    def test_channel_changes(self):
+        self.scene.set_control_parameter(self.groups[1], 'slider', 'cmd', 0)
+        self.tracker.update_control(self.scene, 1, self.groups[1], 'slider')
+        self.assertTrue(self.tracker.is_conflicted(0, 'slider'))
+        self.scene.set_group_channel(self.groups[1], 5)
+        self.tracker.update_group(self.scene, 1)
+        self.assertEqual(self.tracker.get_conflicted(), [])
+        self.scene.set_global_channel(5) # Group 0 follows global channel onto channel of group 1
+        self.tracker.update_global_channel(self.scene)
+        self.assertEqual(sorted(self.tracker.get_conflicted()), [(0, 'slider'), (1, 'slider')])
+
+
+    def test_incremental_updates_match_rebuild(self):
+        random_ = random.Random(2)
+        for device_type in ('nanoKONTROL1', 'nanoKONTROL2'):
+            with self.subTest(device_type=device_type):
+                s = scene(device_type)
+                tracker = ConflictTracker()
+                tracker.rebuild(s)
+                controls = get_controls(device_type)
+                for i in range(500):
+                    group, group_offset, control = random_.choice(controls)
+                    action = random_.random()
+                    if action < 0.4:
+                        s.set_control_parameter(group_offset, control, 'cmd', random_.randint(0, 5))
+                        tracker.update_control(s, group, group_offset, control)
+                    elif action < 0.6:
+                        s.set_control_parameter(group_offset, control, 'assign', random_.randint(0, 2))
+                        tracker.update_control(s, group, group_offset, control)
+                    elif action < 0.8:
+                        s.set_group_channel(group_offset, random_.choice((0, 1, 16)))
+                        tracker.update_group(s, group)
+                    else:
+                        s.set_global_channel(random_.randint(0, 1))
+                        tracker.update_global_channel(s)
+                    reference = ConflictTracker()
+                    reference.rebuild(s)
+                    self.assertEqual(tracker.assignments, reference.assignments)
+                    self.assertEqual(tracker.controls, reference.controls)
+
+
+    def test_rebuild_reports_previous_conflicts(self):
+        self.scene.set_control_parameter(self.groups[1], 'slider', 'cmd', 0)
+        self.tracker.update_control(self.scene, 1, self.groups[1], 'slider')
+        self.tracker.get_changes()
+        self.tracker.rebuild(scene('nanoKONTROL2'))
+        self.assertTrue({(0, 'slider'), (1, 'slider')} <= self.tracker.get_changes())
+        self.assertEqual(self.tracker.get_conflicted(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from nanokonfig.connection import ConnectionManager
+
+class TestConnectionManager(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.unavailable = set()
+        self.connections = ConnectionManager(self.connect, self.disconnect)
+
+
+    def connect(self, direction, endpoint):
+        if endpoint in self.unavailable:
+            raise KeyError(endpoint)
+        self.calls.append(('connect', direction, endpoint))
+
+
+    def disconnect(self, direction, endpoint):
+        if endpoint in self.unavailable:
+            raise KeyError(endpoint)
+        self.calls.append(('disconnect', direction, endpoint))
+
+
+    def test_apply_only_differences(self):
+        self.assertEqual(self.connections.apply(), [])
+        self.connections.set_desired('in', 'nanoKONTROL2:out')
+        self.connections.set_desired('out', 'nanoKONTROL2:in')
+        self.assertEqual(self.connections.apply(), ['in', 'out'])
+        self.assertEqual(self.calls, [('connect', 'in', 'nanoKONTROL2:out'), ('connect', 'out', 'nanoKONTROL2:in')])
+        self.assertTrue(self.connections.is_connected('in'))
+        self.assertEqual(self.connections.apply(), []) # Same desired state makes no calls
+        self.assertEqual(len(self.calls), 2)
+
+
+    def test_change_and_disconnect(self):
+        self.connections.set_desired('in', 'a')
+        self.connections.apply()
+        self.connections.set_desired('in', 'b')
+        self.assertEqual(self.connections.apply(), ['in'])
+        self.assertEqual(self.calls[1:], [('disconnect', 'in', 'a'), ('connect', 'in', 'b')])
+        self.connections.set_desired('in', None)
+        self.assertEqual(self.connections.apply(), ['in'])
+        self.assertEqual(self.calls[-1], ('disconnect', 'in', 'b'))
+        self.assertFalse(self.connections.is_connected('in'))
+        self.assertEqual(self.connections.stats, {'connects': 2, 'disconnects': 2, 'failures': 0})
+
+
+    def test_lost_endpoint_reconnects(self):
+        self.connections.set_desired('out', 'device')
+        self.connections.apply()
+        self.connections.lost('device')
+        self.assertIsNone(self.connections.actual['out'])
+        self.assertFalse(self.connections.is_connected('out'))
+        self.assertEqual(self.connections.apply(), ['out'])
+        self.assertEqual(self.calls, [('connect', 'out', 'device')] * 2) # Lost endpoint is not disconnected
+
+
+    def test_failures(self):
+        self.connections.set_desired('in', 'a')
+        self.connections.apply()
+        self.unavailable.update(('a', 'b'))
+        self.connections.set_desired('in', 'b')
+        self.assertEqual(self.connections.apply(), ['in']) # Failed disconnect still clears connection
+        self.assertIsNone(self.connections.actual['in'])
+        self.assertEqual(self.connections.stats['failures'], 1)
+        self.assertEqual(self.connections.apply(), []) # Retried on each apply
+        self.assertEqual(self.connections.stats['failures'], 2)
+        self.unavailable.clear()
+        self.assertEqual(self.connections.apply(), ['in'])
+        self.assertTrue(self.connections.is_connected('in'))
+
+
+if __name__ == '__main__':
+    unittest.main()
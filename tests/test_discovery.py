@@ -0,0 +1,55 @@
+import unittest
+from nanokonfig.discovery import DeviceDiscovery, MAX_PROBES
+
+# Device search reply as sent by a device
+#   echo_id: Identifier echoed from search request
+#   chan: Global MIDI channel
+#   family_id: Korg family ID
+def search_reply(echo_id, chan=0, family_id=147):
+    return bytes((0xF0, 0x42, 0x50, 0x01, chan, echo_id, family_id & 0x7F, family_id >> 7, 0x00, 0x00, 0x01, 0x00, 0x02, 0x00, 0xF7))
+
+
+class TestDeviceDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.discovery = DeviceDiscovery(['port A', 'port B', 'port C'])
+
+
+    def test_requests_have_distinct_echo_ids(self):
+        requests = self.discovery.get_requests()
+        self.assertEqual([output for output, msg in requests], ['port A', 'port B', 'port C'])
+        self.assertEqual([msg[4] for output, msg in requests], [1, 2, 3])
+        with self.assertRaises(ValueError):
+            DeviceDiscovery(range(MAX_PROBES + 1))
+
+
+    def test_reply_matched_by_echo_id(self):
+        device = self.discovery.handle_midi(search_reply(2, chan=5), 'device out')
+        self.assertEqual(device, {'output': 'port B', 'input': 'device out', 'device_type': 'nanoKONTROL2', 'family_id': 147,
+            'member_id': 0, 'version': '2.1', 'chan': 5})
+        self.discovery.handle_midi(search_reply(1, family_id=132), 'other out')
+        self.assertEqual([(device['output'], device['device_type']) for device in self.discovery.get_results()], [('port A', 'nanoKONTROL1'), ('port B', 'nanoKONTROL2')])
+
+
+    def test_unmatched_messages_ignored(self):
+        self.assertIsNone(self.discovery.handle_midi(search_reply(0), 'in')) # Normal device search
+        self.assertIsNone(self.discovery.handle_midi(search_reply(4), 'in'))
+        self.assertIsNone(self.discovery.handle_midi(b'\xB0\x00\x7F', 'in'))
+        self.assertEqual(self.discovery.get_results(), [])
+
+
+    def test_same_output_heard_on_several_inputs(self):
+        self.discovery.handle_midi(search_reply(3), 'in 2')
+        self.discovery.handle_midi(search_reply(3), 'in 1')
+        self.discovery.handle_midi(search_reply(3), None)
+        self.assertEqual([device['input'] for device in self.discovery.get_results()], [None, 'in 1', 'in 2'])
+
+
+    def test_owned_inputs(self):
+        self.discovery.add_input('temporary')
+        self.assertTrue(self.discovery.owns_input('temporary'))
+        self.assertFalse(self.discovery.owns_input('selected device'))
+        self.assertFalse(self.discovery.owns_input(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from nanokonfig.leds import LedState
+from nanokonfig.session import DeviceSession
+
+class TestLedState(unittest.TestCase):
+    def setUp(self):
+        self.leds = LedState(chan=2)
+
+
+    def test_first_flush_sends_all(self):
+        msgs = self.leds.flush()
+        self.assertEqual(len(msgs), len(self.leds.ccs))
+        self.assertTrue(all(msg[0] == 0xB2 and msg[2] == 0 for msg in msgs))
+        self.assertEqual(self.leds.flush(), [])
+
+
+    def test_flush_sends_only_changes(self):
+        self.leds.flush()
+        self.assertTrue(self.leds.set('mute', 3))
+        self.assertTrue(self.leds.set('play'))
+        self.assertFalse(self.leds.set('mute', 8))
+        self.assertFalse(self.leds.set('knob', 0))
+        self.assertEqual(self.leds.flush(), [b'\xB2\x29\x7F', b'\xB2\x33\x7F'])
+        self.leds.set('mute', 3, False)
+        self.leds.set('mute', 3, True) # Back to state already sent
+        self.assertEqual(self.leds.flush(), [])
+        self.assertTrue(self.leds.get('mute', 3))
+        self.assertFalse(self.leds.get('solo', 3))
+        self.leds.clear()
+        self.assertEqual(self.leds.flush(), [b'\xB2\x29\x00', b'\xB2\x33\x00'])
+
+
+    def test_invalidate_and_set_channel(self):
+        self.leds.set('rec')
+        self.leds.flush()
+        self.leds.invalidate()
+        self.assertEqual(len(self.leds.flush()), len(self.leds.ccs))
+        self.leds.set_channel(2)
+        self.assertEqual(self.leds.flush(), [])
+        self.leds.set_channel(5)
+        msgs = self.leds.flush()
+        self.assertEqual(len(msgs), len(self.leds.ccs))
+        self.assertIn(b'\xB5\x2D\x7F', msgs)
+
+
+    def test_host_messages(self):
+        self.leds.flush()
+        self.assertFalse(self.leds.handle_midi(b'\xB0\x29\x7F')) # Wrong channel
+        self.assertFalse(self.leds.handle_midi(b'\xB2\x00\x7F')) # Not an LED
+        self.assertFalse(self.leds.handle_midi(b'\x92\x29\x7F'))
+        self.assertFalse(self.leds.handle_midi(b'\xB2\x29'))
+        self.assertEqual(self.leds.flush(), [])
+        self.assertTrue(self.leds.handle_midi(b'\xB2\x29\x01'))
+        self.assertTrue(self.leds.handle_cc(2, 0x40, 127))
+        self.assertEqual(self.leds.flush(), [b'\xB2\x29\x7F', b'\xB2\x40\x7F'])
+        self.assertEqual(self.leds.stats, {'requested': 2, 'sent': len(self.leds.ccs) + 2})
+
+
+class TestDeviceLedMode(unittest.TestCase):
+    def test_device_led_mode_follows_synced_data(self):
+        session = DeviceSession(lambda msg: None)
+        self.assertIsNone(session.get_device_led_mode())
+        session.scene.mark_synced()
+        self.assertEqual(session.get_device_led_mode(), 0)
+        session.scene.set_led_mode(1) # Edited but not uploaded
+        self.assertEqual(session.get_device_led_mode(), 0)
+        session.scene.mark_synced()
+        self.assertEqual(session.get_device_led_mode(), 1)
+        session.scene.set_device_type('nanoKONTROL1')
+        self.assertIsNone(session.get_device_led_mode())
+
+
+if __name__ == '__main__':
+    unittest.main()
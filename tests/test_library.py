@@ -0,0 +1,146 @@
+import os
+import struct
+import tempfile
+import unittest
+from nanokonfig.library import SceneLibrary, header_struct, record_struct
+from nanokonfig.scene import scene, control_map
+
+# Get a nanoKONTROL2 scene that differs from the default
+#   value: CC of first slider
+def make_scene(value):
+    s = scene('nanoKONTROL2')
+    s.set_control_parameter(control_map['nanoKONTROL2']['groups'][0], 'slider', 'cmd', value)
+    return s
+
+
+# File wrapper failing after a quantity of bytes has been written, e.g. disk full
+class FailingFile:
+    def __init__(self, file, limit):
+        self.file = file
+        self.limit = limit
+
+    def write(self, data):
+        if len(data) > self.limit:
+            self.file.write(data[:self.limit])
+            raise OSError(28, 'No space left on device')
+        self.limit -= len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class TestSceneLibrary(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'scenes.nksl')
+
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+
+    def test_append_replace_reopen(self):
+        with SceneLibrary(self.path) as library:
+            library.extend([make_scene(i) for i in range(10)])
+            library.append(make_scene(50), 'fifty')
+            library.replace(3, make_scene(60), 'sixty')
+        with SceneLibrary(self.path, readonly=True) as library:
+            self.assertEqual(len(library), 11)
+            self.assertEqual(library[10].name, 'fifty')
+            self.assertEqual(library[3].name, 'sixty')
+            self.assertEqual(bytes(library[3].data), bytes(make_scene(60).data))
+            self.assertEqual(bytes(library[9].data), bytes(make_scene(9).data))
+
+
+    def test_failed_append_keeps_library(self):
+        with SceneLibrary(self.path) as library:
+            library.extend([make_scene(i) for i in range(5)])
+        for limit in (0, 10, 400, 776): # Within first record, second record and table segment (header is overwritten in place so cannot run out of space)
+            with self.subTest(limit=limit):
+                library = SceneLibrary(self.path)
+                library.file = FailingFile(library.file, limit)
+                with self.assertRaises(OSError):
+                    library.extend([make_scene(100), make_scene(101)])
+                library.close()
+                with SceneLibrary(self.path, readonly=True) as library:
+                    self.assertEqual([bytes(record.data) for record in library], [bytes(make_scene(i).data) for i in range(5)])
+
+
+    def test_truncated_library(self):
+        with SceneLibrary(self.path) as library:
+            library.extend([make_scene(i) for i in range(5)])
+        size = os.path.getsize(self.path)
+        for length in (3, header_struct.size, size - 2):
+            with self.subTest(length=length):
+                with open(self.path, 'r+b') as f:
+                    f.truncate(length)
+                with self.assertRaises(ValueError):
+                    SceneLibrary(self.path, readonly=True)
+
+
+    def test_space_is_reclaimed(self):
+        with SceneLibrary(self.path) as library:
+            for i in range(200):
+                library.append(make_scene(i % 128))
+            for i in range(100):
+                library.replace(i, make_scene(127 - i % 128), 'replaced name')
+            live_size = library._get_live_size()
+        self.assertLessEqual(os.path.getsize(self.path), 2 * live_size)
+        with SceneLibrary(self.path, readonly=True) as library:
+            self.assertEqual(len(library), 200)
+            self.assertEqual(bytes(library[5].data), bytes(make_scene(122).data))
+            self.assertEqual(bytes(library[150].data), bytes(make_scene(22).data))
+
+
+    def test_append_writes_table_delta(self):
+        with SceneLibrary(self.path) as library:
+            library.extend([make_scene(i) for i in range(100)])
+            record_size = record_struct.size + len(make_scene(0).data)
+            for i in range(40):
+                size = os.path.getsize(self.path)
+                library.append(make_scene(i))
+                self.assertEqual(os.path.getsize(self.path) - size, record_size + 16) # Segment header and one entry
+            size = os.path.getsize(self.path)
+            library.extend([make_scene(i) for i in range(70)]) # Changes since full table exceed half the library
+            self.assertEqual(os.path.getsize(self.path) - size, 70 * record_size + 8 + 8 * 210)
+        with SceneLibrary(self.path, readonly=True) as library:
+            self.assertEqual(len(library), 210)
+            self.assertEqual(bytes(library[139].data), bytes(make_scene(39).data))
+
+
+    def test_replace_keeps_views(self):
+        with SceneLibrary(self.path) as library:
+            library.extend([make_scene(i) for i in range(3)])
+            record = library[1]
+            library.replace(1, make_scene(90), 'ninety')
+            library.replace(-1, make_scene(91))
+            self.assertEqual(bytes(record.data), bytes(make_scene(1).data))
+            self.assertEqual(bytes(library[1].data), bytes(make_scene(90).data))
+            self.assertEqual(bytes(library[2].data), bytes(make_scene(91).data))
+            previous = library._mm
+            del record
+            library.append(make_scene(5))
+            self.assertTrue(previous.closed) # No views left so superseded map is released
+        with SceneLibrary(self.path, readonly=True) as library:
+            self.assertEqual([record.name for record in library], ['', 'ninety', '', ''])
+
+
+    def test_version_1_library(self):
+        records = [struct.pack('<BxHd32s', 1, 339, 1.0, name) + bytes(make_scene(i).data) for i, name in enumerate((b'a', b'b'))]
+        with open(self.path, 'wb') as f:
+            f.write(header_struct.pack(b'NKSL', 1, 0, 2, header_struct.size + sum(len(record) for record in records)))
+            f.write(b''.join(records))
+            f.write(struct.pack('<2I', header_struct.size, header_struct.size + len(records[0])))
+        with SceneLibrary(self.path) as library:
+            self.assertEqual([record.name for record in library], ['a', 'b'])
+            library.append(make_scene(2), 'c')
+        with open(self.path, 'rb') as f:
+            self.assertEqual(header_struct.unpack(f.read(header_struct.size))[1], 2)
+        with SceneLibrary(self.path, readonly=True) as library:
+            self.assertEqual([record.name for record in library], ['a', 'b', 'c'])
+            self.assertEqual(bytes(library[1].data), bytes(make_scene(1).data))
+
+
+if __name__ == '__main__':
+    unittest.main()
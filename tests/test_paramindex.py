@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from nanokonfig.paramindex import ParameterIndex
+from nanokonfig.library import SceneLibrary
+from nanokonfig.scene import scene, control_map
+
+class TestParameterIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ParameterIndex()
+        self.scene = scene('nanoKONTROL2')
+        self.group_offset = control_map['nanoKONTROL2']['groups'][2]
+
+
+    def test_find_default_assignments(self):
+        self.index.add('a', 'nanoKONTROL2', self.scene.data)
+        self.assertEqual(self.index.find(0, 1, 2), [('a', 2, 'slider')])
+        self.assertEqual(self.index.find_scenes(0, 1, 2), ['a'])
+        self.assertEqual(self.index.find(1, 1, 2), [])
+        self.assertEqual(self.index.find(0, 2, 2), []) # Sent as CC not note
+
+
+    def test_group_and_global_channel(self):
+        self.scene.set_global_channel(4)
+        self.scene.set_group_channel(self.group_offset, 9)
+        self.index.add('a', 'nanoKONTROL2', self.scene.data)
+        self.assertEqual(self.index.find(4, 1, 1), [('a', 1, 'slider')]) # Group follows global channel
+        self.assertEqual(self.index.find(9, 1, 2), [('a', 2, 'slider')])
+        self.assertEqual(self.index.find(4, 1, 2), [])
+
+
+    def test_replace_and_remove(self):
+        self.index.add('a', 'nanoKONTROL2', self.scene.data)
+        self.index.add('b', 'nanoKONTROL2', self.scene.data)
+        self.assertEqual(sorted(self.index.find_scenes(0, 1, 2)), ['a', 'b'])
+        self.scene.set_control_parameter(self.group_offset, 'slider', 'cmd', 100)
+        self.scene.set_control_parameter(control_map['nanoKONTROL2']['groups'][3], 'slider', 'cmd', 100)
+        self.index.add('a', 'nanoKONTROL2', self.scene.data)
+        self.assertEqual(self.index.find_scenes(0, 1, 2), ['b'])
+        self.assertEqual(sorted(self.index.find(0, 1, 100)), [('a', 2, 'slider'), ('a', 3, 'slider')])
+        self.index.remove('a')
+        self.index.remove('missing')
+        self.assertEqual(self.index.find(0, 1, 100), [])
+        self.assertNotIn((0, 1, 100), self.index.index) # Empty entries are removed
+        self.assertEqual(len(self.index), 1)
+        self.index.remove('b')
+        self.assertEqual(self.index.index, {})
+
+
+    def test_disabled_controls_not_indexed(self):
+        self.scene.set_control_parameter(self.group_offset, 'slider', 'assign', 0)
+        self.index.add('a', 'nanoKONTROL2', self.scene.data)
+        self.assertEqual(self.index.find(0, 1, 2), [])
+
+
+    def test_add_library(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with SceneLibrary(os.path.join(dir, 'scenes.nksl')) as library:
+                nk1 = scene('nanoKONTROL1')
+                nk1.set_control_parameter(control_map['nanoKONTROL1']['groups'][0], 'slider', 'cmd', 7)
+                library.extend([self.scene, nk1])
+                self.index.add_library(library)
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.find(0, 1, 7), [(0, 7, 'slider'), (1, 0, 'slider'), (1, 7, 'slider')]) # Keyed by record index
+
+
+if __name__ == '__main__':
+    unittest.main()
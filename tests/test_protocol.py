@@ -0,0 +1,97 @@
+import unittest
+from nanokonfig import protocol
+from nanokonfig.protocol import MidiParser, parse_midi
+from nanokonfig.scene import scene, control_map
+
+class TestMidiParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = MidiParser(echo_id=5)
+
+
+    # Get command list message as sent by a device
+    #   device_type: Device type
+    #   chan: Global MIDI channel
+    #   data: Command list data
+    def command(self, device_type, chan, data):
+        s = scene(device_type)
+        s.global_midi_chan = chan
+        return protocol.command_list(s, data)
+
+
+    def test_channel_messages(self):
+        self.assertEqual(self.parser.parse(b'\xB3\x07\x64'), {'type': 'cc', 'chan': 3, 'cc': 7, 'value': 100})
+        self.assertEqual(self.parser.parse(b'\x9F\x3C\x00'), {'type': 'note_off', 'chan': 15, 'note': 60, 'value': 0})
+        self.assertEqual(self.parser.parse(b'\x90\x3C\x01')['type'], 'note_on')
+        self.assertEqual(self.parser.parse(b'\xE1\x00\x40')['value'], 0x2000)
+        self.assertIsNone(self.parser.parse(b'\xB0\x07'))
+        self.assertIsNone(self.parser.parse(b'\xF8'))
+        self.assertIsNone(self.parser.parse(b''))
+
+
+    def test_command_replies_follow_global_channel(self):
+        ack = self.command('nanoKONTROL2', 3, (0x5F, 0x23, 0x00))
+        self.assertIsNone(self.parser.parse(ack, 0))
+        self.assertEqual(self.parser.parse(ack, 3), {'type': 'load_ack', 'device_type': 'nanoKONTROL2'})
+        self.assertIsNone(self.parser.parse(ack, 4))
+        write_nak = self.command('nanoKONTROL1', 4, (0x5F, 0x22, 0x00))
+        self.assertEqual(self.parser.parse(write_nak, 4), {'type': 'write_nak', 'device_type': 'nanoKONTROL1'})
+
+
+    def test_prefix_table_rebuilt_on_channel_change(self):
+        old = self.command('nanoKONTROL1', 3, (0x5F, 0x21, 0x00))
+        new = self.command('nanoKONTROL1', 7, (0x5F, 0x21, 0x00))
+        self.assertEqual(self.parser.parse(old, 3)['type'], 'write_ack')
+        self.assertIsNone(self.parser.parse(old, 7))
+        self.assertEqual(self.parser.parse(new, 7)['type'], 'write_ack')
+        self.assertIsNone(self.parser.parse(new, 3))
+
+
+    def test_dump_and_scene_change(self):
+        for device_type in ('nanoKONTROL1', 'nanoKONTROL2'):
+            with self.subTest(device_type=device_type):
+                s = scene(device_type)
+                s.global_midi_chan = 9
+                s.set_control_parameter(control_map[device_type]['groups'][0], 'slider', 'cmd', 12)
+                msg = self.parser.parse(protocol.scene_data(s), 9)
+                self.assertEqual(msg['type'], 'dump')
+                self.assertEqual(msg['device_type'], device_type)
+                copy = scene(device_type)
+                copy.set_data(msg['payload'])
+                self.assertEqual(copy.data, s.data)
+        msg = self.parser.parse(self.command('nanoKONTROL1', 9, (0x5F, 0x4F, 2)), 9)
+        self.assertEqual(msg, {'type': 'scene_change', 'device_type': 'nanoKONTROL1', 'scene': 2})
+
+
+    def test_search_reply_echo_id(self):
+        reply = bytes((0xF0, 0x42, 0x50, 0x01, 0x02, 0x05, 0x13, 0x01, 0x00, 0x00, 0x01, 0x00, 0x02, 0x00, 0xF7))
+        msg = self.parser.parse(reply)
+        self.assertEqual((msg['type'], msg['chan'], msg['echo_id'], msg['device_type'], msg['major']), ('search_reply', 2, 5, 'nanoKONTROL2', 2))
+        other = reply[:5] + b'\x06' + reply[6:]
+        self.assertIsNone(self.parser.parse(other))
+        self.assertEqual(MidiParser(None).parse(other)['echo_id'], 6)
+
+
+    def test_inquiry_reply(self):
+        reply = bytes((0xF0, 0x7E, 0x01, 0x06, 0x02, 0x42, 0x04, 0x01, 0x00, 0x00, 0x03, 0x00, 0x01, 0x00, 0xF7))
+        msg = self.parser.parse(reply)
+        self.assertEqual((msg['type'], msg['chan'], msg['device_type'], msg['minor']), ('inquiry_reply', 1, 'nanoKONTROL1', 3))
+
+
+    def test_register_handler(self):
+        self.parser.register_command((0x7A,), lambda data, device_type: {'type': 'custom', 'device_type': device_type})
+        self.assertEqual(self.parser.parse(self.command('nanoKONTROL2', 0, (0x7A, 0x01)))['type'], 'custom')
+        self.parser.register(0xC0, lambda data: {'type': 'program', 'program': data[1]})
+        self.assertEqual(self.parser.parse(b'\xC5\x09'), {'type': 'program', 'program': 9})
+
+
+    def test_parse_midi(self):
+        s = scene('nanoKONTROL2')
+        s.global_midi_chan = 2
+        ack = (0xF0, 0x42, 0x42, 0x00, 0x01, 0x13, 0x00, 0x5F, 0x21, 0x00, 0xF7)
+        self.assertEqual(parse_midi(ack, s)['type'], 'write_ack')
+        s.global_midi_chan = 0
+        self.assertIsNone(parse_midi(ack, s))
+
+
+if __name__ == '__main__':
+    unittest.main()
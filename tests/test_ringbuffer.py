@@ -0,0 +1,73 @@
+import threading
+import time
+import unittest
+from nanokonfig.ringbuffer import MidiRingBuffer
+
+class TestMidiRingBuffer(unittest.TestCase):
+    def test_fifo_and_wrap_around(self):
+        ring = MidiRingBuffer(slots=4, slot_size=8)
+        received = []
+        for i in range(20):
+            self.assertTrue(ring.put(bytes((0x90, i, 100 + i % 2))[:1 + i % 3]))
+            if i % 3 == 2:
+                while len(ring):
+                    received.append(bytes(ring.peek()))
+                    ring.pop()
+        while len(ring):
+            received.append(bytes(ring.peek()))
+            ring.pop()
+        self.assertEqual(received, [bytes((0x90, i, 100 + i % 2))[:1 + i % 3] for i in range(20)])
+        self.assertEqual(ring.get_stats(), {'queued': 20, 'consumed': 20, 'dropped': 0, 'discarded': 0, 'pending': 0})
+
+
+    def test_full_and_oversize(self):
+        ring = MidiRingBuffer(slots=2, slot_size=3)
+        self.assertTrue(ring.put([0xB0, 1, 2]))
+        self.assertFalse(ring.put(b'\xF0\x00\x00\xF7'))
+        self.assertTrue(ring.put(b'\xB0\x03\x04'))
+        self.assertFalse(ring.put(b'\xB0\x05\x06'))
+        self.assertEqual(ring.dropped, 2)
+        ring.discard()
+        self.assertEqual(bytes(ring.peek()), b'\xB0\x03\x04')
+        self.assertTrue(ring.put(b'\xB0\x05\x06'))
+        ring.pop()
+        self.assertEqual(bytes(ring.peek()), b'\xB0\x05\x06')
+        self.assertEqual(ring.discarded, 1)
+
+
+    def test_empty(self):
+        ring = MidiRingBuffer()
+        self.assertIsNone(ring.peek())
+        ring.pop()
+        ring.discard()
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(ring.consumed + ring.discarded, 0)
+
+
+    def test_producer_thread(self):
+        ring = MidiRingBuffer(slots=8, slot_size=3)
+        count = 5000
+        def produce():
+            i = 0
+            while i < count:
+                if ring.put((0xB0, i % 128, (i // 128) % 128)):
+                    i += 1
+                else:
+                    time.sleep(0) # Full - let consumer run
+        thread = threading.Thread(target=produce)
+        thread.start()
+        received = 0
+        while received < count:
+            msg = ring.peek()
+            if msg is None:
+                time.sleep(0)
+                continue
+            self.assertEqual(bytes(msg), bytes((0xB0, received % 128, (received // 128) % 128)))
+            ring.pop()
+            received += 1
+        thread.join()
+        self.assertEqual(len(ring), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
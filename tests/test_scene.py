@@ -0,0 +1,136 @@
+import unittest
+from nanokonfig.scene import scene, control_map, device_types, get_param_offsets, get_controls, get_default_template
+
+class TestSceneParameters(unittest.TestCase):
+    def test_param_offsets_match_control_map(self):
+        for device_type in device_types:
+            map = control_map[device_type]
+            table = get_param_offsets(device_type)
+            for group_offset in map['groups'] + [map['transport']]:
+                for control, control_offset in map['group_map'].items():
+                    for param, (param_offset, param_max) in map['param_map'].items():
+                        offset = group_offset + control_offset + param_offset
+                        if offset < device_types[device_type]['data_len']:
+                            self.assertEqual(table[(group_offset, control, param)], (offset, param_max))
+                        else:
+                            self.assertNotIn((group_offset, control, param), table)
+
+
+    def test_get_set_parameter(self):
+        s = scene('nanoKONTROL2')
+        group_offset = control_map['nanoKONTROL2']['groups'][2]
+        self.assertTrue(s.set_control_parameter(group_offset, 'knob', 'cmd', 99))
+        self.assertEqual(s.get_control_parameter(group_offset, 'knob', 'cmd'), 99)
+        self.assertEqual(s.data[group_offset + 7 + 2], 99)
+        self.assertFalse(s.set_control_parameter(group_offset, 'knob', 'cmd', 128))
+        self.assertFalse(s.set_control_parameter(group_offset, 'knob', 'assign', 3))
+        self.assertFalse(s.set_control_parameter(group_offset, 'knob', 'attack', 1))
+        self.assertEqual(s.get_control_parameter(group_offset, 'knob', 'attack'), 0)
+        self.assertEqual(s.get_control_parameter(group_offset, 'knob', 'cmd'), 99)
+
+
+    def test_get_set_many(self):
+        s = scene('nanoKONTROL1')
+        params = [(group_offset, control, 'cmd', i) for i, (group, group_offset, control) in enumerate(get_controls('nanoKONTROL1'))]
+        self.assertTrue(s.set_many(params))
+        self.assertEqual(s.get_many([param[:3] for param in params]), [param[3] for param in params])
+        self.assertFalse(s.set_many([(16, 'slider', 'cmd', 200), (16, 'slider', 'min', 5)]))
+        self.assertEqual(s.get_control_parameter(16, 'slider', 'min'), 5)
+        self.assertEqual(s.get_many([(16, 'slider', 'unknown')]), [0])
+
+
+    def test_data_length(self):
+        for device_type in device_types:
+            self.assertIsInstance(scene(device_type).data, bytearray)
+            self.assertEqual(len(scene(device_type).data), device_types[device_type]['data_len'])
+        with self.assertRaises(ValueError):
+            scene('nanoKONTROL2', bytes(10))
+        with self.assertRaises(ValueError):
+            scene('nanoKONTROL3')
+
+
+class TestSceneDefaults(unittest.TestCase):
+    def test_default_values(self):
+        s = scene('nanoKONTROL2')
+        transport = control_map['nanoKONTROL2']['transport']
+        self.assertEqual(s.get_control_parameter(transport, 'play', 'cmd'), 0x29)
+        self.assertEqual(s.get_control_parameter(transport, 'next_marker', 'cmd'), 0x34 + 10)
+        self.assertEqual(s.get_control_parameter(control_map['nanoKONTROL2']['groups'][3], 'mute', 'cmd'), 0x33)
+        self.assertEqual(s.get_group_channel(transport), 16)
+        s = scene('nanoKONTROL1')
+        self.assertEqual(s.get_scene_name(), ' ' * 12)
+        self.assertEqual(s.get_control_parameter(control_map['nanoKONTROL1']['transport'], 'rec', 'mmc_cmd'), 5)
+        self.assertEqual(s.get_control_parameter(control_map['nanoKONTROL1']['groups'][8], 'button_b', 'cmd'), 0x38)
+        self.assertTrue(all(s.get_group_channel(group_offset) == 16 for group_offset in control_map['nanoKONTROL1']['groups']))
+
+
+    def test_reset_copies_template(self):
+        for device_type in device_types:
+            template = get_default_template(device_type)
+            self.assertIsInstance(template, bytes)
+            self.assertIs(get_default_template(device_type), template)
+            s = scene(device_type)
+            self.assertEqual(s.data, template)
+            s.data[5] ^= 0x7F
+            self.assertEqual(scene(device_type).data, template)
+            s.reset_data()
+            self.assertEqual(s.data, template)
+
+
+    def test_set_device_type(self):
+        s = scene('nanoKONTROL2')
+        s.data[10] = 1
+        s.set_device_type('nanoKONTROL2')
+        self.assertEqual(s.data[10], 1) # Unchanged type keeps data
+        s.set_device_type('nanoKONTROL1')
+        self.assertEqual(s.data, get_default_template('nanoKONTROL1'))
+        self.assertTrue(s.set_control_parameter(224, 'rec', 'mmc_id', 3))
+
+
+class TestSceneSync(unittest.TestCase):
+    def test_dirty_tracking(self):
+        s = scene('nanoKONTROL2')
+        self.assertFalse(s.is_synced())
+        self.assertEqual(len(s.get_dirty_offsets()), len(s.data))
+        s.mark_synced()
+        self.assertTrue(s.is_synced())
+        self.assertEqual(s.get_dirty_offsets(), [])
+        s.set_control_parameter(3, 'slider', 'cmd', 77)
+        self.assertFalse(s.is_synced())
+        self.assertEqual(s.get_dirty_offsets(), [3 + 1 + 2])
+        s.set_control_parameter(3, 'slider', 'cmd', 0)
+        self.assertTrue(s.is_synced()) # Edited back to device value
+        s.clear_synced()
+        self.assertFalse(s.is_synced())
+
+
+    def test_mark_synced_with_uploaded_data(self):
+        s = scene('nanoKONTROL1')
+        uploaded = bytes(s.data)
+        s.set_scene_name('edited')
+        s.mark_synced(uploaded)
+        self.assertEqual(s.get_dirty_offsets(), list(range(6)))
+        self.assertTrue(s.copy().get_dirty_offsets() == s.get_dirty_offsets())
+
+
+    def test_midi_data_cache(self):
+        s = scene('nanoKONTROL2')
+        midi_data = s.get_midi_data()
+        self.assertIs(s.get_midi_data(), midi_data)
+        s.set_control_parameter(3, 'slider', 'cmd', 77)
+        self.assertNotEqual(s.get_midi_data(), midi_data)
+
+
+    def test_diff(self):
+        s = scene('nanoKONTROL2')
+        other = s.copy()
+        self.assertEqual(s.diff(other), [])
+        other.set_control_parameter(34, 'knob', 'max', 100)
+        other.set_group_channel(34, 2)
+        self.assertEqual(s.diff(other), [(34, None, 'channel', 16, 2), (34, 'knob', 'max', 127, 100)])
+        with self.assertRaises(ValueError):
+            s.diff(scene('nanoKONTROL1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+from nanokonfig.session import DeviceSession
+from tests.fakedevice import FakeDevice
+
+class TestDeviceSession(unittest.TestCase):
+    def setUp(self):
+        self.device = FakeDevice('nanoKONTROL1', chan=3)
+        self.session = DeviceSession(self.device.send)
+
+
+    def deliver(self):
+        self.device.deliver(self.session.handle_midi)
+
+
+    def test_search_callback_sees_reply_applied(self):
+        seen = []
+        self.session.search().add_done_callback(lambda future: seen.append((self.session.global_midi_chan, self.session.scene.device_type)))
+        self.deliver()
+        self.assertEqual(seen, [(3, 'nanoKONTROL1')])
+
+
+    def test_dump_callback_sees_reply_applied(self):
+        self.session.search()
+        self.deliver()
+        seen = []
+        self.session.dump().add_done_callback(lambda future: seen.append(bytes(self.session.scene.data)))
+        self.deliver()
+        self.assertEqual(self.device.ignored, [])
+        self.assertEqual(seen, [bytes(self.device.scene.data)])
+
+
+    def test_upload_skipped_when_device_has_scene(self):
+        self.session.search()
+        self.deliver()
+        self.session.dump()
+        self.deliver()
+        sent = len(self.device.received)
+        self.assertIsNone(self.session.upload().result(0))
+        self.assertEqual(len(self.device.received), sent)
+        self.session.scene.set_control_parameter(16, 'knob', 'cmd', 1)
+        future = self.session.upload()
+        self.deliver()
+        self.assertEqual(future.result(0)['type'], 'load_ack')
+        self.assertEqual(self.device.scene.data, self.session.scene.data)
+        self.assertTrue(self.session.scene.is_synced())
+        self.assertIsNone(self.session.upload().result(0))
+
+
+    def test_fetch_all_scenes(self):
+        self.session.search()
+        self.deliver()
+        result = self.session.fetch_all_scenes()
+        while self.device.deliver(self.session.handle_midi):
+            pass
+        self.assertEqual(result.result(0), {index: bytes(s.data) for index, s in enumerate(self.device.scenes)})
+        self.assertEqual(self.session.current_scene, 0)
+        self.assertEqual(self.device.current_scene, 0)
+
+
+    def test_fetch_all_scenes_fails_if_not_returned_to_original_scene(self):
+        scene_changes = []
+        def send(msg):
+            if msg[7:9] == b'\x1F\x14':
+                scene_changes.append(msg)
+                if len(scene_changes) > 4:
+                    return # Lose request to return to original scene
+            self.device.send(msg)
+        session = DeviceSession(send, timeout=0, retries=0)
+        session.search()
+        self.device.deliver(session.handle_midi)
+        result = session.fetch_all_scenes()
+        while self.device.deliver(session.handle_midi):
+            pass
+        self.assertFalse(result.done())
+        session.poll()
+        self.assertIsInstance(result.exception(0), TimeoutError)
+
+
+    def test_failed_scene_change_is_forgotten(self):
+        session = DeviceSession(self.device.send, timeout=0, retries=0)
+        session.search()
+        self.device.deliver(session.handle_midi)
+        session.dump()
+        self.device.deliver(session.handle_midi)
+        session.scene_cache[2] = bytes(session.scene.data)
+        self.device.mute = True
+        future = session.change_scene(2)
+        session.poll()
+        self.assertIsInstance(future.exception(0), TimeoutError)
+        # Scene changed later on device so cached scene may be stale
+        self.device.mute = False
+        self.device.press_scene(2)
+        msgs = []
+        self.device.deliver(lambda data: msgs.append(session.handle_midi(data)))
+        self.assertFalse(msgs[0]['loaded'])
+        self.assertNotIn(2, session.scene_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from nanokonfig.scene import scene
+from nanokonfig.transaction import TransactionManager, TransactionError
+
+class TestTransactionManager(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.sent = []
+        self.transactions = TransactionManager(self.sent.append, timeout=1.0, retries=2, clock=lambda: self.now)
+        self.scene = scene('nanoKONTROL2')
+
+
+    def test_reply_completes_request(self):
+        future = self.transactions.dump(self.scene)
+        self.assertEqual(len(self.sent), 1)
+        self.assertFalse(self.transactions.handle_reply({'type': 'load_ack'}))
+        self.assertFalse(future.done())
+        reply = {'type': 'dump', 'payload': b''}
+        self.assertTrue(self.transactions.handle_reply(reply))
+        self.assertIs(future.result(0), reply)
+        self.assertEqual(len(self.transactions), 0)
+
+
+    def test_nak_rejects_request(self):
+        future = self.transactions.upload(self.scene)
+        self.transactions.handle_reply({'type': 'load_nak'})
+        self.assertIsInstance(future.exception(0), TransactionError)
+        self.assertEqual(future.exception(0).reply['type'], 'load_nak')
+
+
+    def test_timeout_and_retry(self):
+        future = self.transactions.dump(self.scene)
+        self.assertEqual(self.transactions.poll(), 1.0)
+        for attempt in range(2):
+            self.now += 1.0
+            self.transactions.poll()
+            self.assertEqual(len(self.sent), 2 + attempt)
+            self.assertFalse(future.done())
+        self.now += 1.0
+        self.assertIsNone(self.transactions.poll())
+        self.assertIsInstance(future.exception(0), TimeoutError)
+        self.assertEqual(self.transactions.stats['retries'], 2)
+        self.assertEqual(self.transactions.stats['timeouts'], 1)
+
+
+    def test_upload_and_write_not_resent(self):
+        upload = self.transactions.upload(self.scene)
+        write = self.transactions.write(self.scene)
+        self.now += 1.0
+        self.transactions.poll()
+        self.assertEqual(len(self.sent), 2)
+        self.assertIsInstance(upload.exception(0), TimeoutError)
+        self.assertIsInstance(write.exception(0), TimeoutError)
+        upload = self.transactions.upload(self.scene, retries=1)
+        self.now += 1.0
+        self.transactions.poll()
+        self.assertEqual(len(self.sent), 4)
+        self.assertFalse(upload.done())
+
+
+    def test_pipelined_replies_match_oldest(self):
+        first = self.transactions.dump(self.scene)
+        second = self.transactions.dump(self.scene)
+        self.transactions.handle_reply({'type': 'dump', 'id': 1})
+        self.assertEqual(first.result(0)['id'], 1)
+        self.assertFalse(second.done())
+        self.transactions.handle_reply({'type': 'dump', 'id': 2})
+        self.assertEqual(second.result(0)['id'], 2)
+
+
+    def test_match(self):
+        first = self.transactions.search(echo_id=1)
+        second = self.transactions.search(echo_id=2)
+        self.transactions.handle_reply({'type': 'search_reply', 'echo_id': 2})
+        self.assertFalse(first.done())
+        self.assertEqual(second.result(0)['echo_id'], 2)
+        self.assertFalse(self.transactions.handle_reply({'type': 'search_reply', 'echo_id': 3}))
+
+
+    def test_cancel(self):
+        first = self.transactions.dump(self.scene)
+        second = self.transactions.dump(self.scene)
+        first.cancel()
+        self.transactions.handle_reply({'type': 'dump'})
+        self.assertTrue(second.done())
+        self.transactions.dump(self.scene)
+        self.transactions.cancel_all()
+        self.assertEqual(len(self.transactions), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()